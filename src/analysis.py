@@ -1,10 +1,17 @@
 import numpy as np
 import math
 import pickle
+import os
+import time
+from collections import OrderedDict
 from textwrap import dedent
 from trainer import Trainer
+from checkpoint import CheckpointWriter, CheckpointReader
 
 class TestResult:
+    # z-value of the 95% confidence interval of the correct portion
+    CONFIDENCE_Z = 1.96
+
     def __init__(self, network_pred):
         self.network_pred = network_pred.astype(np.int64)
 
@@ -20,7 +27,29 @@ class TestResult:
         self.label_correct_portion = self.label_correct_count / self.label_count
         self.label_false_portion = self.label_false_count / self.label_count
 
-    
+        self.confidence_interval = TestResult.wilson_interval(self.correct_count, self.tests_count)
+
+    def __setstate__(self, state):
+        # Results pickled before they had a confidence interval
+        self.__dict__.update(state)
+        if 'confidence_interval' not in state:
+            self.confidence_interval = TestResult.wilson_interval(self.correct_count, self.tests_count)
+
+    @staticmethod
+    def wilson_interval(correct_count, tests_count, z=CONFIDENCE_Z):
+        """Wilson score interval (low, high) of the correct portion"""
+
+        if tests_count == 0:
+            return (0.0, 1.0)
+        p = correct_count / tests_count
+        center = (p + z * z / (2 * tests_count)) / (1 + z * z / tests_count)
+        half_width = z * math.sqrt(p * (1 - p) / tests_count + z * z / (4 * tests_count * tests_count)) / (1 + z * z / tests_count)
+        return (center - half_width, center + half_width)
+
+    @property
+    def confidence_width(self):
+        return self.confidence_interval[1] - self.confidence_interval[0]
+
     def __str__(self):
         return dedent("""\
         Test Result:
@@ -32,6 +61,7 @@ class TestResult:
         False count:        {}
         Correct portion:    {}
         False portion:      {}
+        95% interval:       [{:.4f}, {:.4f}]
         
         Labels count:           {}
         Lables correct count:   {}
@@ -39,10 +69,19 @@ class TestResult:
         Lables correct portion: {}
         Lables false portion:   {}""").format(self.network_pred, 
             self.tests_count, self.correct_count, self.false_count, self.correct_portion, self.false_portion,
+            self.confidence_interval[0], self.confidence_interval[1],
             self.label_count, self.label_correct_count, self.label_false_count, np.round(self.label_correct_portion, 2), np.round(self.label_false_portion, 2))
         
 
 class Analysis:
+    # Number of test results kept for networks that may be tested again
+    TEST_RESULT_CACHE_SIZE = 16
+    # Adaptive tests start with MIN_ADAPTIVE_TESTS images and grow by ADAPTIVE_TEST_STEP images
+    MIN_ADAPTIVE_TESTS = 100
+    ADAPTIVE_TEST_STEP = 50
+    # Seed of the fixed order of the test images
+    TEST_ORDER_SEED = 0
+
     def __init__(self, trainer, test_images, test_labels, num_labels):
         self.trainer = trainer
         self.test_images = test_images
@@ -50,6 +89,10 @@ class Analysis:
         self.num_labels = num_labels
         self.test_results_epoch = []
         self.test_results_batch = []
+        self.budget_test_results = []  # tests of the current network at the end of every perform_batches
+        self.elapsed_time = 0  # wall-clock seconds spent in perform_analysis over all sessions
+        self._test_result_cache = OrderedDict()
+        self._test_order = None
 
         initial_test_result = self.perform_test()
         self.test_results_epoch.append(initial_test_result)
@@ -64,53 +107,154 @@ class Analysis:
         analysis.trainer.set_training_data(train_images, train_labels)
         analysis.test_images = test_images
         analysis.test_labels = test_labels
+        analysis._test_result_cache = OrderedDict()
+        analysis._test_order = None
+        if not hasattr(analysis, 'budget_test_results'):
+            analysis.budget_test_results = []
+
+        # Networks pickled before they were versioned
+        for network in [analysis.trainer.optimizer.network, analysis.trainer.best_network]:
+            if not hasattr(network, 'version'):
+                network.parameters_changed()
 
         return analysis
 
-    def perform_analysis(self, epochs, batches_per_test=math.inf, num_tests_batch=math.inf, num_tests_epoch=math.inf):
+    def perform_analysis(self, epochs, batches_per_test=math.inf, num_tests_batch=math.inf, num_tests_epoch=math.inf, live_network=False,
+                         confidence_width=None):
+        """Train for epochs and test every batches_per_test batches and at the end of every epoch. The tests use the best 
+        network, or the network being trained if live_network is set. With confidence_width the batch tests stop as soon
+        as the confidence interval of the accuracy is at most that wide (using at most num_tests_batch images)"""
+
         batches_per_test = min(batches_per_test, self.trainer.epoch_size)
         num_tests_batch = min(num_tests_batch, len(self.test_images))
         num_tests_epoch = min(num_tests_epoch, len(self.test_images))
+        start_time = time.perf_counter()
+        try:
+            self._perform_analysis(epochs, batches_per_test, num_tests_batch, num_tests_epoch, live_network, confidence_width)
+        finally:
+            self.elapsed_time += time.perf_counter() - start_time
+
+    def _perform_analysis(self, epochs, batches_per_test, num_tests_batch, num_tests_epoch, live_network, confidence_width):
+        # The optimizer's network may be replaced by a rollback, so look it up for every test
+        tested_network = lambda: self.trainer.optimizer.network if live_network else None
+
         for _ in range(epochs):
             batch_counter = 0
             while True:
                 self.trainer.finish_batch()
                 batch_counter += 1
                 if batch_counter >= batches_per_test:
-                    test_result = self.perform_test(num_tests_batch)
+                    test_result = self.perform_test(num_tests_batch, tested_network(), confidence_width)
                     self.test_results_batch.append(test_result)
                     batch_counter = 0
 
-                if self.trainer.epoch_counter == 0:
-                    test_result = self.perform_test(num_tests_epoch)
+                if self.trainer.epoch_counter == 0 or self.trainer.stopped:
+                    test_result = self.perform_test(num_tests_epoch, tested_network())
                     self.test_results_epoch.append(test_result)
                     break
 
-    def perform_test(self, num_tests=math.inf):
+            if self.trainer.stopped:
+                break
+
+    def perform_batches(self, batches, batches_per_test=math.inf, num_tests_batch=math.inf, num_tests_epoch=math.inf):
+        """Train for a budget of batches regardless of epoch boundaries and return a final test of the current (not the 
+        best) network on num_tests_batch images, which is also appended to budget_test_results (test_results_batch only
+        holds tests of the best network). The best network is only replaced at the end of an epoch, so it would not 
+        reflect the progress within a budget"""
+
+        num_tests_batch = min(num_tests_batch, len(self.test_images))
+        num_tests_epoch = min(num_tests_epoch, len(self.test_images))
+        start_time = time.perf_counter()
+        try:
+            for _ in range(batches):
+                if self.trainer.stopped:
+                    break
+
+                self.trainer.finish_batch()
+                if len(self.trainer.average_loss_batch) % batches_per_test == 0:
+                    self.test_results_batch.append(self.perform_test(num_tests_batch))
+                if self.trainer.epoch_counter == 0:
+                    self.test_results_epoch.append(self.perform_test(num_tests_epoch))
+
+            test_result = self.perform_test(num_tests_batch, network=self.trainer.optimizer.network)
+            self.budget_test_results.append(test_result)
+        finally:
+            self.elapsed_time += time.perf_counter() - start_time
+
+        return test_result
+
+    def test_order(self):
+        """Fixed order of the test image indices in which every prefix is stratified, i.e. contains every label
+        (nearly) in proportion to its frequency in the test set"""
+
+        if self._test_order is None:
+            random_state = np.random.RandomState(Analysis.TEST_ORDER_SEED)
+            labels = np.asarray(self.test_labels)
+            positions = np.empty(len(labels))
+            for label in np.unique(labels):
+                indices = random_state.permutation(np.flatnonzero(labels == label))
+                # Spread the images of every label evenly over the order
+                positions[indices] = (np.arange(len(indices)) + random_state.rand()) / len(indices)
+            self._test_order = np.argsort(positions, kind='stable')
+        return self._test_order
+
+    def perform_test(self, num_tests=math.inf, network=None, confidence_width=None):
+        """Test network (the trainer's best network by default) on a stratified subset of num_tests test images (see
+        test_order). With confidence_width the subset grows from MIN_ADAPTIVE_TESTS images only until the confidence
+        interval of the accuracy is at most that wide. Results are cached by the network's version, so an unchanged
+        network is not tested twice on the same images"""
+
+        if network is None:
+            network = self.trainer.best_network
+        num_tests = min(num_tests, len(self.test_images))
+
+        key = (network.version, num_tests, confidence_width)
+        cached_result = self._test_result_cache.get(key)
+        if cached_result is not None:
+            return cached_result
+
         network_pred = np.zeros(shape=(self.num_labels, self.num_labels))
+        order = self.test_order()
+        next_check = Analysis.MIN_ADAPTIVE_TESTS
 
-        for j in range(min(num_tests, len(self.test_images))):
-            pred_enc = self.trainer.best_network.forward(self.test_images[j])
+        for k in range(num_tests):
+            j = order[k]
+            pred_enc = network.forward(self.test_images[j])
             pred = np.argmax(pred_enc)
             network_pred[self.test_labels[j]][pred] += 1
 
-        return TestResult(network_pred)
+            if confidence_width is not None and k + 1 >= next_check:
+                low, high = TestResult.wilson_interval(network_pred.trace(), k + 1)
+                if high - low <= confidence_width:
+                    break
+                next_check += Analysis.ADAPTIVE_TEST_STEP
+
+        test_result = TestResult(network_pred)
+        self._test_result_cache[key] = test_result
+        if len(self._test_result_cache) > Analysis.TEST_RESULT_CACHE_SIZE:
+            self._test_result_cache.popitem(last=False)
+
+        return test_result
 
 
     def save_to_file(self, file):
         if isinstance(file, str):
-            with open(file, "wb") as f:
-                return self.save_to_file(f)
+            # Write to a temporary file first so that readers never see a partially written file
+            with open(file + '.tmp', "wb") as f:
+                self.save_to_file(f)
+            os.replace(file + '.tmp', file)
+            return
         
-        self.trainer.save_to_file(file)
-        pickle.dump(
-            (
-                self.num_labels,
-                self.test_results_epoch,
-                self.test_results_batch,
-            ),
-            file
-        )
+        writer = CheckpointWriter(file)
+        self.trainer.write_checkpoint(writer)
+        writer.write_object('analysis', (
+            self.num_labels,
+            self.test_results_epoch,
+            self.test_results_batch,
+            self.elapsed_time,
+            self.budget_test_results,
+        ))
+        writer.close()
 
     @staticmethod
     def load_from_file(file, train_images, train_labels, test_images, test_labels):
@@ -120,14 +264,32 @@ class Analysis:
         
         analysis = Analysis.__new__(Analysis)
 
-        analysis.trainer = Trainer.load_from_file(file, train_images, train_labels)
+        if CheckpointReader.is_checkpoint(file):
+            reader = CheckpointReader(file)
+            analysis.trainer = Trainer.read_checkpoint(reader, train_images, train_labels)
+            analysis_state = reader.read_object('analysis')
+        else:
+            # Chained pickles of the trainer and the analysis' state
+            analysis.trainer = Trainer.load_from_file(file, train_images, train_labels)
+            analysis_state = pickle.load(file)
+            if len(analysis_state) == 3:
+                # Written before the elapsed time was recorded
+                analysis_state = analysis_state + (0,)
+        if len(analysis_state) == 4:
+            # Written before the tests of perform_batches were kept separately
+            analysis_state = analysis_state + ([],)
+
         (
             analysis.num_labels,
             analysis.test_results_epoch,
             analysis.test_results_batch,
-        ) = pickle.load(file)
+            analysis.elapsed_time,
+            analysis.budget_test_results,
+        ) = analysis_state
 
         analysis.test_images = test_images
         analysis.test_labels = test_labels
+        analysis._test_result_cache = OrderedDict()
+        analysis._test_order = None
 
         return analysis
\ No newline at end of file
@@ -0,0 +1,119 @@
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class Augmentation:
+    def __init__(self, image_size = (28, 28), in_channels = 1, max_shift = 2, max_rotation = 10, elastic_alpha = 0,
+                 elastic_sigma = 4, seed = 0):
+        """Random shifts by up to max_shift pixels, rotations by up to max_rotation degrees and elastic distortions
+        (displacement fields of uniform noise smoothed by a Gaussian of width elastic_sigma and scaled by elastic_alpha,
+        off for elastic_alpha = 0) of flattened images. The transforms of a batch only depend on (seed, epoch, batch)"""
+
+        self.image_size = image_size
+        self.in_channels = in_channels
+        self.max_shift = max_shift
+        self.max_rotation = max_rotation
+        self.elastic_alpha = elastic_alpha
+        self.elastic_sigma = elastic_sigma
+        self.seed = seed
+
+    def random_state(self, epoch, batch):
+        return np.random.RandomState([self.seed, epoch, batch])
+
+    def transform(self, images, random_state):
+        """The augmented copies of the images (rows of flattened images) with bilinear interpolation and zeros outside
+        of the images, all computed at once by index maps"""
+
+        num_images = len(images)
+        height, width = self.image_size
+        source_y, source_x = self._source_coordinates(num_images, random_state)
+
+        # Pad with one row and column of zeros on every side, so that all sampled corners are valid indices
+        padded = np.zeros((num_images, self.in_channels, height + 2, width + 2))
+        padded[:, :, 1:-1, 1:-1] = np.reshape(images, (num_images, self.in_channels, height, width))
+        source_y = np.clip(source_y, -1, height) + 1
+        source_x = np.clip(source_x, -1, width) + 1
+
+        y0 = np.minimum(np.floor(source_y).astype(int), height)
+        x0 = np.minimum(np.floor(source_x).astype(int), width)
+        wy = (source_y - y0)[:, None]
+        wx = (source_x - x0)[:, None]
+
+        # Gather the four corners of every sampled point, with the channels in the last axis moved back to the second
+        image_index = np.arange(num_images)[:, None, None]
+        corner = lambda y, x: np.moveaxis(padded[image_index, :, y, x], -1, 1)
+        augmented = ((1 - wy) * ((1 - wx) * corner(y0, x0) + wx * corner(y0, x0 + 1)) +
+                     wy * ((1 - wx) * corner(y0 + 1, x0) + wx * corner(y0 + 1, x0 + 1)))
+
+        return augmented.reshape(np.shape(images))
+
+    def _source_coordinates(self, num_images, random_state):
+        # Output pixel p shows the input at R^-1 (p - c - shift) + c + elastic displacement(p), c the image center
+        height, width = self.image_size
+        angles = np.deg2rad(random_state.uniform(-self.max_rotation, self.max_rotation, num_images))[:, None, None]
+        shifts = random_state.uniform(-self.max_shift, self.max_shift, (2, num_images))[:, :, None, None]
+
+        y, x = np.meshgrid(np.arange(height) - (height - 1) / 2, np.arange(width) - (width - 1) / 2, indexing='ij')
+        y = y[None] - shifts[0]
+        x = x[None] - shifts[1]
+        cos, sin = np.cos(angles), np.sin(angles)
+        source_y = cos * y - sin * x + (height - 1) / 2
+        source_x = sin * y + cos * x + (width - 1) / 2
+
+        if self.elastic_alpha > 0:
+            displacements = random_state.uniform(-1, 1, (2, num_images, height, width))
+            # Smooth all fields at once by separable Gaussian convolutions (as matrix products)
+            smoothed = self._gaussian_matrix(height) @ displacements @ self._gaussian_matrix(width).T
+            source_y = source_y + self.elastic_alpha * smoothed[0]
+            source_x = source_x + self.elastic_alpha * smoothed[1]
+
+        return source_y, source_x
+
+    def _gaussian_matrix(self, size):
+        distances = np.arange(size)[:, None] - np.arange(size)[None, :]
+        return np.exp(-distances ** 2 / (2 * self.elastic_sigma ** 2)) / (np.sqrt(2 * np.pi) * self.elastic_sigma)
+
+
+class AugmentedBatches:
+    def __init__(self, augmentation, images, permutation, batch_size, epoch, start_batch = 0, prefetch = 2, workers = 1):
+        """Augments the batches (consecutive batch_size indices of the permutation) of an epoch from start_batch on in
+        workers background threads, keeping up to prefetch batches ahead of get"""
+
+        self.augmentation = augmentation
+        self.images = images
+        self.permutation = permutation
+        self.batch_size = batch_size
+        self.epoch = epoch
+        self.prefetch = prefetch
+
+        self._executor = ThreadPoolExecutor(workers)
+        self._futures = deque()
+        self._next_batch = start_batch
+        self._num_batches = len(permutation) // batch_size
+        for _ in range(prefetch):
+            self._submit()
+
+    def _submit(self):
+        if self._next_batch < self._num_batches:
+            self._futures.append((self._next_batch, self._executor.submit(self._augment, self._next_batch)))
+            self._next_batch += 1
+
+    def _augment(self, batch):
+        indices = self.permutation[batch * self.batch_size:(batch + 1) * self.batch_size]
+        return self.augmentation.transform(self.images[indices], self.augmentation.random_state(self.epoch, batch))
+
+    def get(self, batch):
+        """The augmented images of the batch, which must be the next one of the epoch"""
+
+        if not self._futures or self._futures[0][0] != batch:
+            raise ValueError(f"Batch {batch} is not the next batch")
+
+        _, future = self._futures.popleft()
+        self._submit()
+        return future.result()
+
+    def close(self):
+        for _, future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
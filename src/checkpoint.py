@@ -0,0 +1,131 @@
+"""
+Indexed checkpoint files, so that a reader can load single sections (e.g. only the best network) without reading the
+rest of the file. A checkpoint consists of
+
+    MAGIC
+    sections        pickled objects, and arrays as raw C-ordered data aligned to ALIGNMENT bytes
+    table           pickled dict: section name -> ('object', offset, size) or ('array', offset, size, dtype, shape)
+    table offset    8 byte little-endian unsigned integer
+    MAGIC
+
+Arrays can be memory-mapped (copy-on-write) from checkpoints given as paths. Networks are stored as the pickled network
+structure in the section 'name/structure' and one array section 'name/layer index/parameter name' per parameter.
+"""
+
+import struct
+import pickle
+import numpy as np
+
+MAGIC = b'CKNCKPT1'
+ALIGNMENT = 64
+
+class CheckpointWriter:
+    def __init__(self, file):
+        self.file = file
+        self.table = {}
+        self._start = file.tell()
+        file.write(MAGIC)
+
+    def _offset(self):
+        # Offsets are relative to the start of the checkpoint
+        return self.file.tell() - self._start
+
+    def write_object(self, name, obj):
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        self.table[name] = ('object', self._offset(), len(data))
+        self.file.write(data)
+
+    def write_array(self, name, array):
+        array = np.ascontiguousarray(array)
+
+        # Align the data so that it can be memory-mapped efficiently
+        self.file.write(b'\0' * (-self._offset() % ALIGNMENT))
+        self.table[name] = ('array', self._offset(), array.nbytes, array.dtype.str, array.shape)
+        self.file.write(memoryview(array).cast('B') if array.nbytes > 0 else b'')
+
+    def write_network(self, name, network):
+        self.write_object(f'{name}/structure', network.structure())
+        for j, parameter_name, array in network.get_parameters():
+            self.write_array(f'{name}/{j}/{parameter_name}', array)
+
+    def close(self):
+        table_offset = self._offset()
+        self.file.write(pickle.dumps(self.table, protocol=pickle.HIGHEST_PROTOCOL))
+        self.file.write(struct.pack('<Q', table_offset))
+        self.file.write(MAGIC)
+
+
+class CheckpointReader:
+    def __init__(self, file):
+        """file is a path (needed for memory mapping) or a seekable binary file positioned at the checkpoint"""
+
+        self.path = file if isinstance(file, str) else None
+        self.file = open(file, 'rb') if isinstance(file, str) else file
+        self._start = self.file.tell()
+
+        self.file.seek(-8 - len(MAGIC), 2)
+        table_offset, magic = struct.unpack('<Q', self.file.read(8))[0], self.file.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError("Not a checkpoint file")
+
+        self.file.seek(self._start + table_offset)
+        self.table = pickle.load(self.file)
+
+    @staticmethod
+    def is_checkpoint(file):
+        """Whether the path or binary file (at its current position, which is kept) starts a checkpoint"""
+
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                return CheckpointReader.is_checkpoint(f)
+
+        position = file.tell()
+        magic = file.read(len(MAGIC))
+        file.seek(position)
+        return magic == MAGIC
+
+    def __contains__(self, name):
+        return name in self.table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.path is not None:
+            self.file.close()
+
+    def read_object(self, name):
+        _, offset, size = self.table[name]
+        self.file.seek(self._start + offset)
+        return pickle.loads(self.file.read(size))
+
+    def read_array(self, name, mmap = False):
+        """The array of the section, memory-mapped copy-on-write if mmap is set and the checkpoint was given as a path"""
+
+        _, offset, size, dtype, shape = self.table[name]
+        if size == 0:
+            return np.zeros(shape, dtype=dtype)
+
+        if mmap and self.path is not None:
+            return np.memmap(self.path, dtype=dtype, mode='c', offset=self._start + offset, shape=shape)
+
+        data = bytearray(size)
+        self.file.seek(self._start + offset)
+        self.file.readinto(data)
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    def read_network(self, name, mmap = False):
+        network = self.read_object(f'{name}/structure')
+
+        parameters = []
+        prefix = f'{name}/'
+        for section in self.table:
+            if section.startswith(prefix) and section != f'{name}/structure':
+                j, parameter_name = section[len(prefix):].split('/', 1)
+                parameters.append((int(j), parameter_name, self.read_array(section, mmap)))
+        network.set_parameters(parameters)
+
+        return network
@@ -1,6 +1,7 @@
 # Standard library imports
 import os
 import math
+import argparse
 
 # Third-party library imports
 from mnist import MNIST
@@ -9,25 +10,54 @@ from mnist import MNIST
 import kernel
 import layer_info as li
 from analysis import Analysis
-from train_mnist import create_mnist_trainer
+from train_mnist import create_mnist_trainer, create_schedule
 
 
-def create_analysis(mnist, filepath, epochs, trainer, batches_per_test=100, num_tests_batch=1000, num_tests_epoch=math.inf):
+def create_analysis(mnist, filepath, epochs, trainer, batches_per_test=100, num_tests_batch=1000, num_tests_epoch=math.inf, verbose=True,
+                    live_network=False, confidence_width=None):
+    """Trains the analysis stored at filepath (or a new one for trainer) until epochs are reached and returns it. 
+    trainer may be None if filepath exists. With live_network the tests use the network being trained instead of the 
+    best network. With confidence_width the batch tests stop once the accuracy's confidence interval is that narrow"""
+
     if os.path.exists(filepath):
         analysis = Analysis.load_from_file(filepath, mnist.train_images, mnist.train_labels, mnist.test_images, mnist.test_labels)
     else:
         analysis = Analysis(trainer, mnist.test_images, mnist.test_labels, num_labels=10)
 
-    while analysis.trainer.epoch <= epochs:
-        print("Epoch {}".format(analysis.trainer.epoch))
-        analysis.perform_analysis(epochs=1, batches_per_test=batches_per_test, num_tests_batch=num_tests_batch)
+    while analysis.trainer.epoch <= epochs and not analysis.trainer.stopped:
+        if verbose:
+            print("Epoch {}".format(analysis.trainer.epoch))
+        analysis.perform_analysis(epochs=1, batches_per_test=batches_per_test, num_tests_batch=num_tests_batch, num_tests_epoch=num_tests_epoch,
+                                  live_network=live_network, confidence_width=confidence_width)
         analysis.save_to_file(filepath)
-        print(str(analysis.test_results_epoch[-1]))
-        print()
-        print()
+        if verbose:
+            print(str(analysis.test_results_epoch[-1]))
+            print()
+            print()
+
+    return analysis
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Train and analyse several convolutional kernel networks on the MNIST dataset')
+    parser.add_argument('-s', help="learning rate schedule of new analyses ('rollback' halves the learning rate and restores the best network when the epoch loss increases)", 
+                        choices=['rollback', 'constant', 'step', 'cosine', 'plateau'], dest="schedule", default='rollback')
+    parser.add_argument('--warmup', help="number of linear warmup batches of the learning rate schedule", type=int, dest="warmup_batches", default=0)
+    parser.add_argument('--validation-size', help="number of training images held out for validation (chooses the best network only with a schedule)", type=int, dest="validation_size", default=0)
+    parser.add_argument('--early-stopping', help="stop after this many validations without improvement", type=int, dest="early_stopping_patience", default=None)
+    parser.add_argument('--test-live', help="test the network being trained instead of the best network", action='store_true', dest="live_network")
+    parser.add_argument('--confidence-width', help="stop the tests during an epoch once the 95%% confidence interval of the accuracy is at most this wide (e.g. 0.04)",
+                        type=float, dest="confidence_width", default=None)
+    args = parser.parse_args()
+
+    # Every trainer needs its own schedule, as schedules may keep state
+    def trainer_options():
+        return dict(
+            schedule=create_schedule(args.schedule, epochs=20, warmup_batches=args.warmup_batches),
+            validation_size=args.validation_size,
+            early_stopping_patience=args.early_stopping_patience
+        )
+
     mnist = MNIST(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), '../mnist'))
 
     create_analysis(
@@ -42,7 +72,9 @@ def main():
             li.AvgPoolingInfo(pooling_size=(3, 3)),
 
             li.FilterInfo(filter_size=(3, 3), zero_padding='same', out_channels=10, dp_kernel=kernel.RadialBasisFunction(alpha=4))
-        ])
+        ], **trainer_options()),
+        live_network=args.live_network,
+        confidence_width=args.confidence_width
     )
 
     create_analysis(
@@ -57,7 +89,9 @@ def main():
             li.AvgPoolingInfo(pooling_size=(3, 3)),
 
             li.FilterInfo(filter_size=(5, 5), zero_padding='same', out_channels=10, dp_kernel=kernel.RadialBasisFunction(alpha=4))
-        ])
+        ], **trainer_options()),
+        live_network=args.live_network,
+        confidence_width=args.confidence_width
     )
 
     create_analysis(
@@ -74,7 +108,9 @@ def main():
             li.FilterInfo(filter_size=(1, 1), zero_padding='same', out_channels=5, dp_kernel=kernel.RadialBasisFunction(alpha=4)),
 
             li.FilterInfo(filter_size=(3, 3), zero_padding='same', out_channels=5, dp_kernel=kernel.RadialBasisFunction(alpha=4))
-        ])
+        ], **trainer_options()),
+        live_network=args.live_network,
+        confidence_width=args.confidence_width
     )
 
     create_analysis(
@@ -86,7 +122,9 @@ def main():
             li.AvgPoolingInfo(pooling_size=(3, 3)),
 
             li.FilterInfo(filter_size=(3, 3), zero_padding='none', out_channels=15, dp_kernel=kernel.RadialBasisFunction(alpha=4)),
-        ])
+        ], **trainer_options()),
+        live_network=args.live_network,
+        confidence_width=args.confidence_width
     )
 
 if __name__ == '__main__':
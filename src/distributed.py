@@ -0,0 +1,354 @@
+"""
+Synchronous data-parallel training over TCP. A Coordinator drives an ordinary Trainer (its permutation, sampler,
+learning rate schedule, validation and rollback), but instead of running the forward and backward passes of a batch
+itself it splits the batch's image indices into one shard per worker. Each Worker holds the training images itself,
+computes the summed gradients of its shard and sends them back (with augmentation the coordinator augments the batch,
+as the trainer would, and sends the images of the shard along); the coordinator adds the shards up into its optimizer,
+which then performs the usual Optimizer.optim. This is an all-reduce of every batch, so training matches the
+single-process trainer up to the order of the floating point summation.
+
+Every message is a frame of
+
+    header length   4 byte little-endian unsigned integer
+    header          JSON, including the dtype and shape of every array that follows
+    arrays          raw C-ordered array data
+
+so the parameter arrays (filter matrices and output weights) and gradients are sent as raw buffers. The network
+structure and loss function are sent once when the coordinator connects, as a JSON description of their attributes
+(see describe) in which only the classes of networks, layers, kernels and loss functions can be instantiated, so that
+a peer cannot make a worker run code. Parameters are only sent when the network's version changed since the last batch.
+
+Start a worker on every node with
+
+    python distributed.py --host 0.0.0.0 --port 5000 -m mnist
+
+and train with train_mnist.py --workers node1:5000,node2:5000.
+"""
+
+# Standard library imports
+import argparse
+import json
+import socket
+import struct
+import multiprocessing
+
+# Third-party library imports
+import numpy as np
+
+# Local imports
+from optimizer import Optimizer
+from network import Network
+from layer_base import LayerBase, init_derived_layers
+from kernel import DotProductKernel
+from loss_function import LossFunction
+
+
+def send_message(sock, header, arrays = ()):
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    header = dict(header, arrays=[(array.dtype.str, array.shape) for array in arrays])
+    header_bytes = json.dumps(header).encode()
+
+    sock.sendall(struct.pack('<I', len(header_bytes)) + header_bytes)
+    for array in arrays:
+        if array.nbytes > 0:
+            sock.sendall(memoryview(array).cast('B'))
+
+
+def receive_message(sock):
+    """The header and the arrays of the next message, None if the connection was closed"""
+
+    length = _receive_exactly(sock, bytearray(4))
+    if length is None:
+        return None
+    header = json.loads(_receive_exactly(sock, bytearray(struct.unpack('<I', length)[0])))
+
+    arrays = []
+    for dtype, shape in header.pop('arrays'):
+        array = np.empty(shape, dtype=dtype)
+        if array.nbytes > 0 and _receive_exactly(sock, memoryview(array).cast('B')) is None:
+            raise ConnectionError("Connection closed within a message")
+        arrays.append(array)
+    return header, arrays
+
+
+def _receive_exactly(sock, buffer):
+    view = memoryview(buffer)
+    received = 0
+    while received < len(view):
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise ConnectionError("Connection closed within a message")
+        received += count
+    return buffer
+
+
+def describe(value, arrays):
+    """JSON description of a network structure, loss function or any of their attributes. The arrays in value are
+    appended to arrays and described by their index"""
+
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {'array': len(arrays) - 1}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {'tuple': [describe(item, arrays) for item in value]}
+    if isinstance(value, list):
+        return [describe(item, arrays) for item in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if type(value).__name__ in _described_classes():
+        return {'class': type(value).__name__, 'attributes': {name: describe(item, arrays) for name, item in vars(value).items()}}
+    raise TypeError(f"Cannot describe a value of type {type(value).__name__}")
+
+
+def build(description, arrays):
+    """The value of a description returned by describe"""
+
+    if isinstance(description, list):
+        return [build(item, arrays) for item in description]
+    if not isinstance(description, dict):
+        return description
+    if 'array' in description:
+        return arrays[description['array']]
+    if 'tuple' in description:
+        return tuple(build(item, arrays) for item in description['tuple'])
+
+    cls = _described_classes().get(description['class'])
+    if cls is None:
+        raise ValueError(f"Unknown class: {description['class']}")
+    value = cls.__new__(cls)
+    value.__dict__ = {name: build(item, arrays) for name, item in description['attributes'].items()}
+    return value
+
+
+def _described_classes():
+    init_derived_layers()
+    classes = [Network, *LayerBase.derived_layers.values(), *DotProductKernel.__subclasses__(), *LossFunction.__subclasses__()]
+    return {cls.__name__: cls for cls in classes}
+
+
+class Worker:
+    def __init__(self, train_images, train_labels, host = '127.0.0.1', port = 0):
+        """Listens on host:port (port 0 picks a free port, see address) for a coordinator"""
+
+        self.train_images = train_images
+        self.train_labels = train_labels
+        self.optimizer = None
+
+        self._server = socket.create_server((host, port))
+
+    @property
+    def address(self):
+        host, port = self._server.getsockname()[:2]
+        return (host, port)
+
+    def close(self):
+        self._server.close()
+
+    def serve(self):
+        """Serve coordinators one after another until one sends 'stop'"""
+
+        while True:
+            sock, _ = self._server.accept()
+            with sock:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if not self._serve_connection(sock):
+                    return
+
+    def _serve_connection(self, sock):
+        while True:
+            message = receive_message(sock)
+            if message is None:
+                return True
+            header, arrays = message
+
+            if header['type'] == 'stop':
+                return False
+            if header['type'] == 'setup':
+                self.optimizer = Optimizer(build(header['network'], arrays), build(header['loss_function'], arrays))
+            elif header['type'] == 'parameters':
+                self.optimizer.network.set_parameters([(j, name, array) for (j, name), array in zip(header['names'], arrays)])
+            elif header['type'] == 'gradients':
+                send_message(sock, *self.compute_gradients(*arrays))
+
+    def compute_gradients(self, indices, weights, images = None):
+        """The reply to a 'gradients' request: the losses of the images, the gradient sums (of the layers with
+        parameters and the output weights), the loss sum and the number of skipped backward passes. images are the
+        augmented images of the indices, if the coordinator sent them"""
+
+        optimizer = self.optimizer
+        optimizer.reset()
+        losses = np.empty(len(indices))
+        for k, (index, weight) in enumerate(zip(indices, weights)):
+            image = images[k] if images is not None else self.train_images[index]
+            losses[k] = optimizer.step(image, self.train_labels[index], weight=weight)
+
+        gradients = optimizer.gradient_sum if optimizer.gradient_sum is not None else optimizer.network.zero_gradients()
+        has_gradient = [isinstance(gradient, np.ndarray) for gradient in gradients]
+        header = {
+            'type': 'gradients',
+            'loss_sum': float(optimizer.loss_sum),
+            'num_skipped': optimizer.num_skipped,
+            'has_gradient': has_gradient,
+        }
+        return header, [losses] + [gradient for gradient, is_array in zip(gradients, has_gradient) if is_array]
+
+
+class Coordinator:
+    def __init__(self, trainer, addresses, timeout = None):
+        """Connects to the workers at addresses ((host, port) pairs) and sends them the trainer's network structure
+        and loss function. The workers need the same training images as the trainer (they are indexed like
+        trainer.train_images)"""
+
+        self.trainer = trainer
+        self._sent_version = None
+        self._sockets = []
+        for address in addresses:
+            sock = socket.create_connection(address, timeout=timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sockets.append(sock)
+
+        arrays = []
+        header = {
+            'type': 'setup',
+            'network': describe(trainer.optimizer.network.structure(), arrays),
+            'loss_function': describe(trainer.optimizer.loss_function, arrays),
+        }
+        for sock in self._sockets:
+            send_message(sock, header, arrays)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self, stop_workers = False):
+        for sock in self._sockets:
+            if stop_workers:
+                send_message(sock, {'type': 'stop'})
+            sock.close()
+        self._sockets = []
+
+    def finish_batch(self):
+        """Like Trainer.finish_batch, with the gradients of the batch computed by the workers"""
+
+        trainer = self.trainer
+        if trainer.stopped:
+            return
+
+        start = trainer.epoch_counter
+        end = start + trainer.batch_size - trainer.batch_counter
+        weights = trainer.sample_weights[start:end] if trainer.sample_weights is not None else np.ones(end - start)
+        images = trainer._augmented_images(start, end) if trainer.augmentation is not None else None
+        self._accumulate(trainer.permutation[start:end], weights, images)
+
+        trainer.batch_counter += end - start
+        trainer.epoch_counter += end - start
+        trainer._check_batch_epoch()
+
+    def finish_epoch(self):
+        if self.trainer.stopped:
+            return
+        self.finish_batch()
+        while self.trainer.epoch_counter > 0 and not self.trainer.stopped:
+            self.finish_batch()
+
+    def _accumulate(self, indices, weights, images = None):
+        # Add the gradients of the images to the optimizer as if it had performed their steps
+        optimizer = self.trainer.optimizer
+        network = optimizer.network
+
+        if network.version != self._sent_version:
+            parameters = network.get_parameters()
+            header = {'type': 'parameters', 'names': [(j, name) for j, name, _ in parameters]}
+            for sock in self._sockets:
+                send_message(sock, header, [array for _, _, array in parameters])
+            self._sent_version = network.version
+
+        shards = np.array_split(np.arange(len(indices)), len(self._sockets))
+        for sock, shard in zip(self._sockets, shards):
+            arrays = [np.asarray(indices[shard], dtype=np.int64), np.asarray(weights[shard], dtype=float)]
+            if images is not None:
+                arrays.append(images[shard])
+            send_message(sock, {'type': 'gradients'}, arrays)
+
+        # Reduce in the order of the workers
+        for sock, shard in zip(self._sockets, shards):
+            message = receive_message(sock)
+            if message is None:
+                raise ConnectionError("A worker closed the connection")
+            header, arrays = message
+
+            losses, arrays = arrays[0], iter(arrays[1:])
+            gradients = [next(arrays) if is_array else 0 for is_array in header['has_gradient']]
+            if optimizer.gradient_sum is None:
+                optimizer.gradient_sum = gradients
+            else:
+                for j, gradient in enumerate(gradients):
+                    optimizer.gradient_sum[j] += gradient
+
+            optimizer.loss_sum += header['loss_sum']
+            optimizer.num_steps += len(shard)
+            optimizer.num_skipped += header['num_skipped']
+            optimizer.total_steps += len(shard)
+            optimizer.total_skipped += header['num_skipped']
+            for index, loss in zip(indices[shard], losses):
+                self.trainer.sampler.report_loss(index, loss)
+
+
+def parse_addresses(workers):
+    """(host, port) pairs of a comma-separated list of host:port"""
+    addresses = []
+    for worker in workers.split(','):
+        host, port = worker.rsplit(':', 1)
+        addresses.append((host, int(port)))
+    return addresses
+
+
+def _run_local_worker(train_images, train_labels, connection):
+    worker = Worker(train_images, train_labels)
+    connection.send(worker.address)
+    try:
+        worker.serve()
+    finally:
+        worker.close()
+
+
+def start_local_workers(num_workers, train_images, train_labels):
+    """Start num_workers worker processes on localhost. Returns the processes and their addresses"""
+
+    context = multiprocessing.get_context('spawn')
+    processes, addresses = [], []
+    for _ in range(num_workers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run_local_worker, args=(train_images, train_labels, sender), daemon=True)
+        process.start()
+        processes.append(process)
+        addresses.append(receiver.recv())
+    return processes, addresses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a worker of distributed training on the MNIST dataset')
+    parser.add_argument('-m', help='path to the directory of the mnist dataset', type=str, dest="mnist_dir", default='mnist')
+    parser.add_argument('--host', help='interface to listen on (0.0.0.0 for all, only in a trusted network)', type=str, dest="host", default='127.0.0.1')
+    parser.add_argument('-p', '--port', help='port to listen on', type=int, dest="port", default=5000)
+    args = parser.parse_args()
+
+    from mnist import MNIST
+    mnist = MNIST.memory_mapped(args.mnist_dir)
+
+    worker = Worker(mnist.train_images, mnist.train_labels, args.host, args.port)
+    print(f"Worker listening on {worker.address}")
+    try:
+        worker.serve()
+    finally:
+        worker.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Stores the final feature maps of a frozen network on disk, so that only the output layer has to be trained on them.
+A feature store is a directory with
+
+    features.npy  memory-mapped array of shape (num_images, out_channels, num_positions) of the last layer's outputs
+    labels.npy    the labels of the images
+    progress.json number of images whose features are written, so that an interrupted extraction is resumed, and the
+                  fingerprint of the layers' parameters they were computed with
+"""
+
+# Standard library imports
+import os
+import argparse
+import hashlib
+import json
+import pickle
+import time
+
+# Third-party library imports
+import numpy as np
+
+# Local imports
+from update_rule import GradientDescent
+
+
+class FeatureStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(directory, 'labels.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.labels)
+
+    @staticmethod
+    def fingerprint(network):
+        """Hash of the configuration and parameters of the network's layers (not of the output weights, which the features
+        do not depend on)"""
+
+        digest = hashlib.sha256()
+        for layer in network.layers:
+            # The public attributes without the outputs cached by the last forward pass, and the filters
+            state = {name: value for name, value in vars(layer).items() if not name.startswith(('_', 'last_'))}
+            if hasattr(layer, 'filter_matrix'):
+                state['filter_matrix'] = np.ascontiguousarray(layer.filter_matrix)
+            digest.update(pickle.dumps((type(layer).__name__, sorted(state.items()))))
+        return digest.hexdigest()
+
+    @staticmethod
+    def extract(network, images, labels, directory, chunk_size=1000, dtype=np.float32, verbose=False):
+        """Run the layers of the network once over all images, chunk_size images at a time, and write the outputs of the
+        last layer to a feature store in the directory. A store in the directory is resumed or reused only if it was
+        extracted by layers with the same parameters"""
+
+        os.makedirs(directory, exist_ok=True)
+        features_path = os.path.join(directory, 'features.npy')
+        progress_path = os.path.join(directory, 'progress.json')
+
+        last_layer = network.layers[-1]
+        shape = (len(images), last_layer.out_channels, last_layer.output_size[0] * last_layer.output_size[1])
+        fingerprint = FeatureStore.fingerprint(network)
+
+        completed = 0
+        if os.path.exists(progress_path) and os.path.exists(features_path):
+            with open(progress_path) as f:
+                progress = json.load(f)
+            if (tuple(progress['shape']) == shape and progress['dtype'] == np.dtype(dtype).name and
+                    progress.get('fingerprint') == fingerprint):
+                completed = progress['completed']
+
+        if completed > 0:
+            features = np.load(features_path, mmap_mode='r+')
+        else:
+            features = np.lib.format.open_memmap(features_path, mode='w+', dtype=dtype, shape=shape)
+            np.save(os.path.join(directory, 'labels.npy'), np.asarray(labels))
+
+        chunk = np.empty((chunk_size,) + shape[1:])
+        for start in range(completed, len(images), chunk_size):
+            end = min(start + chunk_size, len(images))
+            for j in range(start, end):
+                x = images[j]
+                for layer in network.layers:
+                    x = layer.forward(x)
+                chunk[j - start] = x
+
+            # Write whole chunks and record the progress only after they are flushed
+            features[start:end] = chunk[:end - start]
+            features.flush()
+            with open(progress_path, 'w') as f:
+                json.dump({'shape': shape, 'dtype': np.dtype(dtype).name, 'fingerprint': fingerprint, 'completed': end}, f)
+
+            if verbose:
+                print(f"Extracted features of {end}/{len(images)} images", end='\r')
+
+        del features
+        return FeatureStore(directory)
+
+    def predict(self, output_weights, chunk_size=10000):
+        """Outputs of the output layer for all stored features, computed chunk by chunk"""
+
+        weights = output_weights.reshape(output_weights.shape[0], -1)
+        predictions = np.empty((len(self), weights.shape[0]))
+        for start in range(0, len(self), chunk_size):
+            chunk = self.features[start:start + chunk_size].reshape(-1, weights.shape[1])
+            predictions[start:start + chunk_size] = chunk @ weights.T
+        return predictions
+
+    def accuracy(self, output_weights):
+        return np.mean(np.argmax(self.predict(output_weights), axis=1) == self.labels)
+
+
+def train_output_layer(network, store, loss_function, learning_rate, regularization_parameter, batch_size, epochs,
+                       update_rule=None, seed=None):
+    """Train only network.output_weights on the stored features with vectorized batches. Every batch performs the same
+    update as Optimizer.optim does for the output weights. Returns the average loss (with regularization) of every epoch"""
+
+    update_rule = update_rule if update_rule is not None else GradientDescent()
+    rng = np.random.default_rng(seed)
+    weights = network.output_weights.reshape(network.output_weights.shape[0], -1)
+    labels = np.asarray(store.labels)
+
+    average_losses = []
+    for _ in range(epochs):
+        permutation = rng.permutation(len(store))
+        loss_sum = 0
+        num_batches = 0
+
+        for start in range(0, len(permutation), batch_size):
+            # Sorted indices read the memory-mapped features sequentially
+            batch = np.sort(permutation[start:start + batch_size])
+            features = store.features[batch].reshape(len(batch), -1)
+
+            predicted = features @ weights.T
+            regularization_term = np.sum(weights * weights) * regularization_parameter / 2
+            loss_sum += loss_function.batch_loss(predicted, labels[batch]).mean() + regularization_term
+            num_batches += 1
+
+            # Average gradient of the batch
+            gradient = loss_function.batch_gradient(predicted, labels[batch]).T @ features
+            gradient /= len(batch)
+
+            weights *= 1 - learning_rate * regularization_parameter
+            weights -= update_rule.descent(-1, gradient, learning_rate)
+
+        average_losses.append(loss_sum / num_batches)
+
+    network.output_weights = weights.reshape(network.output_weights.shape)
+    network.parameters_changed()
+    return average_losses
+
+
+def main():
+    # Imported here since they are only needed to run this module as a script
+    from mnist import MNIST
+    from trainer import Trainer
+    from loss_function import SquareHingeLoss
+    from output_solver import solve_output_layer
+
+    parser = argparse.ArgumentParser(description="Retrain the output layer of a trainer's best network on stored features")
+    parser.add_argument('-f', help='filepath of the trainer', type=str, dest="filepath", required=True)
+    parser.add_argument('-m', help='path to the directory of the mnist dataset', type=str, dest="mnist_dir", default='mnist')
+    parser.add_argument('-d', help='directory of the feature stores (extracted if not existent)', type=str, dest="store_dir", required=True)
+    parser.add_argument('-o', help='filepath to save the network with the retrained output layer to', type=str, dest="output", required=True)
+    parser.add_argument('-e', help='number of epochs', type=int, dest="epochs", default=20)
+    parser.add_argument('-b', help='batch size', type=int, dest="batch_size", default=128)
+    parser.add_argument('-lr', help='learning rate', type=float, dest="learning_rate", default=2)
+    parser.add_argument('-r', help='regularization parameter', type=float, dest="regularization_parameter", default=1/60000)
+    parser.add_argument('--margin', help='margin of the square hinge loss', type=float, dest="margin", default=0.2)
+    parser.add_argument('--solve', help='fit the output layer by L-BFGS instead of SGD', action='store_true', dest="solve")
+    args = parser.parse_args()
+
+    mnist = MNIST.memory_mapped(args.mnist_dir)
+    trainer = Trainer.load_from_file(args.filepath, train_images=mnist.train_images, train_labels=mnist.train_labels)
+    network = trainer.best_network
+
+    train_store = FeatureStore.extract(network, mnist.train_images, mnist.train_labels, os.path.join(args.store_dir, 'train'), verbose=True)
+    test_store = FeatureStore.extract(network, mnist.test_images, mnist.test_labels, os.path.join(args.store_dir, 'test'), verbose=True)
+
+    start_time = time.time()
+    if args.solve:
+        features = train_store.features.reshape(len(train_store), -1)
+        solve_output_layer(network, features, train_store.labels, SquareHingeLoss(margin=args.margin), args.regularization_parameter)
+    else:
+        losses = train_output_layer(network, train_store, SquareHingeLoss(margin=args.margin), args.learning_rate,
+                                    args.regularization_parameter, args.batch_size, args.epochs)
+        for epoch, loss in enumerate(losses, start=1):
+            print(f"Epoch {epoch}: average loss {loss:.5f}")
+    print(f"Trained the output layer in {time.time() - start_time:.1f}s")
+    print(f"Test accuracy: {100.0 * test_store.accuracy(network.output_weights):.2f}%")
+
+    network.save_to_file(args.output)
+
+
+if __name__ == '__main__':
+    main()
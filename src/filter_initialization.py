@@ -0,0 +1,69 @@
+import numpy as np
+from filter_layer import FilterLayer
+from random_feature_layer import RandomFeatureLayer
+
+def spherical_kmeans(patches, num_clusters, iterations=100, batch_size=1000, rng=None):
+    """Mini-batch spherical k-means on the unit-norm columns of patches. Returns the unit-norm centroids as columns"""
+
+    rng = rng if rng is not None else np.random.default_rng()
+    num_patches = patches.shape[1]
+
+    centroids = patches[:, rng.choice(num_patches, num_clusters, replace=num_patches < num_clusters)].copy()
+    if num_patches < num_clusters:
+        # Break ties between duplicate initial centroids
+        centroids += 0.01 * rng.standard_normal(centroids.shape)
+        centroids /= np.linalg.norm(centroids, axis=0)
+    counts = np.zeros(num_clusters)
+
+    for _ in range(iterations):
+        batch = patches[:, rng.choice(num_patches, min(batch_size, num_patches), replace=False)]
+
+        # Assign every patch to the centroid with the largest cosine similarity
+        assignments = np.argmax(centroids.T @ batch, axis=0)
+        one_hot = np.zeros((batch.shape[1], num_clusters))
+        one_hot[np.arange(batch.shape[1]), assignments] = 1
+
+        # Move every centroid towards the mean of its patches with a per-centroid learning rate of 1 / count
+        batch_counts = one_hot.sum(axis=0)
+        counts += batch_counts
+        updated = batch_counts > 0
+        centroids[:, updated] *= (counts[updated] - batch_counts[updated]) / counts[updated]
+        centroids[:, updated] += (batch @ one_hot[:, updated]) / counts[updated]
+        centroids[:, updated] /= np.linalg.norm(centroids[:, updated], axis=0)
+
+    # Restart centroids that never received a patch at random patches
+    empty = counts == 0
+    centroids[:, empty] = patches[:, rng.choice(num_patches, np.count_nonzero(empty))]
+
+    return centroids
+
+
+def initialize_filters_kmeans(network, images, num_images=1000, patches_per_image=10, iterations=100, batch_size=1000, min_patch_norm=1e-3, seed=None):
+    """Set the filter matrices of all filter layers of the network, layer by layer, to the spherical k-means centroids
+    of normalized patches sampled from the inputs that the (already initialized) previous layers produce for a random
+    subsample of the images"""
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(images), min(num_images, len(images)), replace=False)
+    inputs = [images[index] for index in sample]
+
+    for layer in network.layers:
+        # Random features are samples of the kernel's spectral density, not directions on the sphere
+        if isinstance(layer, FilterLayer) and not isinstance(layer, RandomFeatureLayer):
+            sampled_patches = []
+            for input in inputs:
+                patches = layer._extract_patches(input)
+                norms = np.linalg.norm(patches, axis=0)
+
+                # Skip (almost) empty patches, they carry no direction
+                nonempty = np.flatnonzero(norms > min_patch_norm)
+                chosen = rng.choice(nonempty, min(patches_per_image, len(nonempty)), replace=False)
+                sampled_patches.append(patches[:, chosen] / norms[chosen])
+
+            sampled_patches = np.concatenate(sampled_patches, axis=1)
+            if sampled_patches.shape[1] > 0:
+                layer.filter_matrix = spherical_kmeans(sampled_patches, layer.out_channels, iterations, batch_size, rng)
+
+        inputs = [layer.forward(input) for input in inputs]
+
+    network.parameters_changed()
@@ -5,12 +5,23 @@ import itertools
 import pickle
 
 class FilterLayer(LayerBase):
-    def __init__(self, input_size, in_channels, filter_size, filter_matrix, dp_kernel, zero_padding = (0, 0)):
+    # Patches with a norm of at most sparse_threshold (e.g. of the empty background of an image) are treated as zero: 
+    # their columns are skipped in the matrix products and filled in analytically. None disables the sparse mode
+    sparse_threshold = 0
+
+    # If not None, forward and gradient process the image in bands of output rows (tiles, with the halo of input rows 
+    # their patches overlap) whose patch matrix and temporaries of its size take at most about max_patch_bytes, instead 
+    # of keeping the whole patch matrix E(input). The sparse mode is not used then
+    max_patch_bytes = None
+
+    cache_attributes = ('last_output', '_E_input', '_S_diag', '_S_n1_diag', '_Z_T__E_input__S_n1', '_active', '_inactive')
+
+    def __init__(self, input_size, in_channels, filter_size, filter_matrix, dp_kernel, zero_padding = (0, 0), stride = (1, 1)):
         super().__init__(
             input_size=input_size, 
             output_size=(
-                input_size[0] + zero_padding[0] * 2 - (filter_size[0] - 1),
-                input_size[1] + zero_padding[1] * 2 - (filter_size[1] - 1)
+                (input_size[0] + zero_padding[0] * 2 - filter_size[0]) // stride[0] + 1,
+                (input_size[1] + zero_padding[1] * 2 - filter_size[1]) // stride[1] + 1
             ), 
             in_channels=in_channels, 
             out_channels=filter_matrix.shape[1]
@@ -19,6 +30,7 @@ class FilterLayer(LayerBase):
         self.filter_size = filter_size
         self.dp_kernel = dp_kernel
         self.zero_padding = zero_padding
+        self.stride = stride
         
         self.filter_matrix = filter_matrix
 
@@ -34,9 +46,16 @@ class FilterLayer(LayerBase):
          # S^-1 (diagonal elements)
         self._S_n1_diag = None
 
-        # Z^T E(input) S^-1
+        # Z^T E(input) S^-1 (only the active columns if _active is not None)
         self._Z_T__E_input__S_n1 = None    
 
+        # Indices of the columns of E(input) that are not treated as zero, None if all are active
+        self._active = None
+        self._inactive = None
+
+        # Output row ranges of the tiles of the last forward pass, None if it was not tiled (then _E_input is kept)
+        self._tiles = None
+
     @property
     def filter_matrix(self):
         return self._filter_matrix
@@ -60,21 +79,73 @@ class FilterLayer(LayerBase):
         self._A_1_2 = (evectors * evalues_n1_4) @ evectors.transpose()
         self._A_3_2 = (evectors * evalues_n3_4) @ evectors.transpose()
 
+        # Output columns of zero patches divided by S (A k(0)), and Z k'(0) A giving Z B for zero patches from U P^T
+        zeros = np.zeros(self._Z_T__Z.shape[0])
+        self._A__k_0 = self._A @ self.dp_kernel.func(zeros)
+        self._Z__k_d_0__A = (filter_matrix * self.dp_kernel.deriv(zeros)) @ self._A
+
+
+    def zero_gradient(self):
+        return np.zeros_like(self.filter_matrix)
+
+    def get_parameters(self):
+        return {'filter_matrix': self.filter_matrix}
+
+    def set_parameters(self, parameters):
+        self.filter_matrix = parameters['filter_matrix']
+
     
+    def clear_cache(self):
+        super().clear_cache()
+        self.last_input = None
+
+
     def forward(self, input):
+        tiles = self.tiles()
+        if tiles is not None:
+            return self._forward_tiled(input, tiles)
+        return self.forward_patches(input, *self.patches_and_norms(input))
+
+
+    def tiles(self):
+        """Output row ranges (start, end) of the tiles for max_patch_bytes, None if the whole image fits"""
+
+        if self.max_patch_bytes is None:
+            return None
+
+        # The patch matrix of a tile and two temporaries of its size in _h
+        bytes_per_row = 3 * self.filter_matrix.shape[0] * self.output_size[1] * 8
+        rows = max(1, int(self.max_patch_bytes // bytes_per_row))
+        if rows >= self.output_size[0]:
+            return None
+        return [(start, min(start + rows, self.output_size[0])) for start in range(0, self.output_size[0], rows)]
+
+
+    def forward_patches(self, input, E_input, S_diag):
+        """Forward pass from the already extracted patches E(input) and their (regularized) norms S, as computed by
+        patches_and_norms(input)"""
+
         self.last_input = input
+        self._tiles = None
 
         # E(input)
-        self._E_input = self._extract_patches(input)
+        self._E_input = E_input
 
         # S (diagonal elements)
-        self._S_diag = np.linalg.norm(self._E_input, axis = 0)
-        # avoid 0 entries so that we are able to invert S
-        self._S_diag += np.full(len(self._S_diag), 0.00001)
+        self._S_diag = S_diag
 
         # S^-1 (diagonal elements)
         self._S_n1_diag = 1 / self._S_diag
 
+        self._active = self._inactive = None
+        if self.sparse_threshold is not None:
+            # S contains the regularization 0.00001
+            is_active = self._S_diag > self.sparse_threshold + 0.00001
+            if not is_active.all():
+                self._active = np.flatnonzero(is_active)
+                self._inactive = np.flatnonzero(~is_active)
+                return self._forward_sparse()
+
         # Z^T E(input) S^-1
         self._Z_T__E_input__S_n1 = self._filter_matrix.transpose() @ (self._E_input * self._S_n1_diag)
 
@@ -86,6 +157,52 @@ class FilterLayer(LayerBase):
 
         return self.last_output
 
+
+    def _forward_tiled(self, input, tiles):
+        # The same computations as forward_patches, tile by tile, keeping S, Z^T E(input) S^-1 and M but not E(input)
+        self.last_input = input
+        self._tiles = tiles
+        self._E_input = None
+        self._active = self._inactive = None
+
+        padded_input = self._pad(input)
+        width = self.output_size[1]
+        num_patches = self.output_size[0] * width
+        self._S_diag = np.empty(num_patches)
+        self._S_n1_diag = np.empty(num_patches)
+        self._Z_T__E_input__S_n1 = np.empty((self.out_channels, num_patches))
+        self.last_output = np.empty((self.out_channels, num_patches))
+
+        for start_row, end_row in tiles:
+            columns = slice(start_row * width, end_row * width)
+            E_input = self._extract_patches_rows(padded_input, start_row, end_row)
+
+            S_diag = np.linalg.norm(E_input, axis = 0)
+            S_diag += np.full(len(S_diag), 0.00001)
+            S_n1_diag = 1 / S_diag
+            Z_T__E_input__S_n1 = self._filter_matrix.transpose() @ (E_input * S_n1_diag)
+
+            self._S_diag[columns] = S_diag
+            self._S_n1_diag[columns] = S_n1_diag
+            self._Z_T__E_input__S_n1[:, columns] = Z_T__E_input__S_n1
+            self.last_output[:, columns] = (self._A @ self.dp_kernel.func(Z_T__E_input__S_n1)) * S_diag
+
+        return self.last_output
+
+
+    def _forward_sparse(self):
+        active = self._active
+
+        # Z^T E(input) S^-1 of the active columns
+        self._Z_T__E_input__S_n1 = self._filter_matrix.transpose() @ (self._E_input[:, active] * self._S_n1_diag[active])
+
+        # M = A k(Z^T E(input) S^-1) S, which is A k(0) S for the zero columns
+        self.last_output = np.empty((self._A.shape[0], self._E_input.shape[1]))
+        self.last_output[:, active] = (self._A @ self.dp_kernel.func(self._Z_T__E_input__S_n1)) * self._S_diag[active]
+        self.last_output[:, self._inactive] = np.outer(self._A__k_0, self._S_diag[self._inactive])
+
+        return self.last_output
+
     
     def compute_gradient(self, gradient_calculation_info):
         gci = gradient_calculation_info
@@ -107,14 +224,17 @@ class FilterLayer(LayerBase):
 
 
     def gradient_descent(self, descent):
-        new_filter_matrix = self._filter_matrix - descent
-        norms = np.linalg.norm(new_filter_matrix, axis = 0)
-        self.filter_matrix = new_filter_matrix / norms
+        # Z - descent projected back onto unit-norm filters, computed in place in the layer's own filter buffer
+        new_filter_matrix = np.subtract(self._filter_matrix, descent, out=self._filter_matrix)
+        new_filter_matrix /= np.linalg.norm(new_filter_matrix, axis = 0)
+        self.filter_matrix = new_filter_matrix
 
     
     def _calculate_B(self, U_upscaled):
         # U_upscaled = U P^T
-        # B = k'(Z^T E(input) S^-1) * (A U P^T)
+        # B = k'(Z^T E(input) S^-1) * (A U P^T)     (only the active columns in the sparse mode)
+        if self._active is not None:
+            U_upscaled = U_upscaled[:, self._active]
         return self.dp_kernel.deriv(self._Z_T__E_input__S_n1) * (self._A @ U_upscaled)
 
 
@@ -126,8 +246,12 @@ class FilterLayer(LayerBase):
     def _g(self, B, C):
         # g(U) = E(input) B^T - 1/2 Z (k'(Z^T Z) * (C + C^T))
 
-        # E(input) B^T
-        E_input__B_T = self._E_input @ B.transpose()
+        # E(input) B^T (the zero columns of E(input) do not contribute)
+        if self._tiles is not None:
+            E_input__B_T = self._E_input__B_T_tiled(B)
+        else:
+            E_input = self._E_input if self._active is None else self._E_input[:, self._active]
+            E_input__B_T = E_input @ B.transpose()
 
         # k'(Z^T Z) * (C + C^T)
         k_d_Z_T__Z__mul__C_plus_C_T = self._k_d_Z_T__Z * (C + C.transpose())
@@ -138,11 +262,27 @@ class FilterLayer(LayerBase):
         return g_U
 
 
+    def _E_input__B_T_tiled(self, B):
+        padded_input = self._pad(self.last_input)
+        width = self.output_size[1]
+
+        E_input__B_T = np.zeros((self.filter_matrix.shape[0], B.shape[0]))
+        for start_row, end_row in self._tiles:
+            E_input = self._extract_patches_rows(padded_input, start_row, end_row)
+            E_input__B_T += E_input @ B[:, start_row * width:end_row * width].transpose()
+        return E_input__B_T
+
+
     def _h(self, U_upscaled, B):
         # U_upscaled = U P^T
         # X = S^-2 * (M^T U P^T - E(input)^T Z B))    (X is a diagonal matrix)
         # h(U) = E_adj( Z B + E(input) X )
 
+        if self._tiles is not None:
+            return self._h_tiled(U_upscaled, B)
+        if self._active is not None:
+            return self._h_sparse(U_upscaled, B)
+
         # Z B
         Z_B = self.filter_matrix @ B
 
@@ -161,7 +301,65 @@ class FilterLayer(LayerBase):
         return h_U
 
 
+    def _h_tiled(self, U_upscaled, B):
+        # The adjoint of every tile's Z B + E(input) X is added into the padded input, where the halos overlap
+        padded_input = self._pad(self.last_input)
+        width = self.output_size[1]
+        adj_patched = np.zeros(padded_input.shape)
+
+        for start_row, end_row in self._tiles:
+            columns = slice(start_row * width, end_row * width)
+            E_input = self._extract_patches_rows(padded_input, start_row, end_row)
+
+            Z_B = self.filter_matrix @ B[:, columns]
+            M_T__U__P_T__diag = np.einsum('ij,ij->j', self.last_output[:, columns], U_upscaled[:, columns])
+            E_input_T__Z__B__diag = np.einsum('ij,ij->j', E_input, Z_B)
+            S_n1_diag = self._S_n1_diag[columns]
+            X_diag = S_n1_diag * S_n1_diag * (M_T__U__P_T__diag - E_input_T__Z__B__diag)
+
+            Z_B += E_input * X_diag
+            self._extract_patches_adj_rows(Z_B, start_row, end_row, adj_patched)
+
+        return self._unpad(adj_patched)
+
+
+    def _h_sparse(self, U_upscaled, B):
+        # B only has the active columns. For the zero columns B = k'(0) * (A U P^T), so Z B = Z k'(0) A U P^T, and
+        # E(input) X vanishes
+        active, inactive = self._active, self._inactive
+        E_input = self._E_input[:, active]
+
+        Z_B__E_input_X = np.empty((self.filter_matrix.shape[0], self._E_input.shape[1]))
+        Z_B__E_input_X[:, inactive] = self._Z__k_d_0__A @ U_upscaled[:, inactive]
+
+        # Z B + E(input) X for the active columns
+        Z_B = self.filter_matrix @ B
+        M_T__U__P_T__diag = np.einsum('ij,ij->j', self.last_output[:, active], U_upscaled[:, active])
+        E_input_T__Z__B__diag = np.einsum('ij,ij->j', E_input, Z_B)
+        S_n1_diag = self._S_n1_diag[active]
+        X_diag = S_n1_diag * S_n1_diag * (M_T__U__P_T__diag - E_input_T__Z__B__diag)
+        Z_B__E_input_X[:, active] = Z_B + E_input * X_diag
+
+        return self._extract_patches_adj(Z_B__E_input_X)
+
+
+    def patches_and_norms(self, input):
+        # E(input)
+        E_input = self._extract_patches(input)
+
+        # S (diagonal elements)
+        S_diag = np.linalg.norm(E_input, axis = 0)
+        # avoid 0 entries so that we are able to invert S
+        S_diag += np.full(len(S_diag), 0.00001)
+
+        return E_input, S_diag
+
+
     def _extract_patches(self, input):
+        return self._extract_patches_rows(self._pad(input), 0, self.output_size[0])
+
+
+    def _pad(self, input):
         # Reshape input into a 3D matrix with shape (in_channels, input_size[0], input_size[1])
         input = np.reshape(input, (self.in_channels, self.input_size[0], self.input_size[1]))
 
@@ -169,11 +367,16 @@ class FilterLayer(LayerBase):
         if self.zero_padding[0] > 0 or self.zero_padding[1] > 0:
             input = np.pad(input, ((0, 0), (self.zero_padding[0], self.zero_padding[0]), 
                                 (self.zero_padding[1], self.zero_padding[1])))
+        return input
+
+
+    def _extract_patches_rows(self, padded_input, start_row, end_row):
+        # Patches of the output rows start_row to end_row (exclusive) of the zero padded input
 
         # Calculate the size of the output patch matrix
         patch_mx_size = (
             self.in_channels * self.filter_size[0] * self.filter_size[1], 
-            self.output_size[0], 
+            end_row - start_row, 
             self.output_size[1]
         )
         # Create an empty patch matrix with the calculated size
@@ -186,10 +389,10 @@ class FilterLayer(LayerBase):
             end_channel = start_channel + self.in_channels
 
             # Extract patches from the input matrix
-            patch_mx[start_channel:end_channel, :, :] = input[
+            patch_mx[start_channel:end_channel, :, :] = padded_input[
                 :, 
-                x_offset : self.output_size[0] + x_offset, 
-                y_offset : self.output_size[1] + y_offset
+                x_offset + self.stride[0] * start_row : x_offset + self.stride[0] * (end_row - 1) + 1 : self.stride[0], 
+                y_offset : y_offset + self.stride[1] * (self.output_size[1] - 1) + 1 : self.stride[1]
             ]
 
         # Reshape the patch matrix into a 2D matrix with shape (in_channels * filter_size[0] * filter_size[1], num_patches)
@@ -199,22 +402,28 @@ class FilterLayer(LayerBase):
     
 
     def _extract_patches_adj(self, mx):        
-        mx = mx.reshape(-1, self.output_size[0], self.output_size[1])
-
         # Initialize a zero-filled array with the size of the original input with zero-padding
         adj_patched = np.zeros((self.in_channels, self.input_size[0] + self.zero_padding[0] * 2, self.input_size[1] + self.zero_padding[1] * 2))
-        
+        self._extract_patches_adj_rows(mx, 0, self.output_size[0], adj_patched)
+        return self._unpad(adj_patched)
+
+
+    def _extract_patches_adj_rows(self, mx, start_row, end_row, adj_patched):
+        # Add the adjoint of _extract_patches_rows applied to mx to the zero padded adj_patched
+        mx = mx.reshape(-1, end_row - start_row, self.output_size[1])
+
         # Sum all extracted patches to their original position
-        channel_offset = 0
         for x_offset, y_offset in itertools.product(range(self.filter_size[0]), range(self.filter_size[1])):
             start_channel = (x_offset * self.filter_size[1] + y_offset) * self.in_channels
             end_channel = start_channel + self.in_channels
 
             adj_patched[:, 
-                x_offset:self.output_size[0] + x_offset,
-                y_offset:self.output_size[1] + y_offset
+                x_offset + self.stride[0] * start_row : x_offset + self.stride[0] * (end_row - 1) + 1 : self.stride[0],
+                y_offset : y_offset + self.stride[1] * (self.output_size[1] - 1) + 1 : self.stride[1]
             ] += mx[start_channel:end_channel, :, :]
 
+
+    def _unpad(self, adj_patched):
         # If the input had zero padding, remove it from the result
         if self.zero_padding[0] > 0 or self.zero_padding[1] > 0:
             start_x = self.zero_padding[0]
@@ -241,6 +450,7 @@ class FilterLayer(LayerBase):
                 self.filter_matrix, 
                 self.dp_kernel, 
                 self.zero_padding,
+                self.stride,
                 self.last_input,
                 self.last_output,
                 self._E_input,
@@ -253,6 +463,10 @@ class FilterLayer(LayerBase):
 
     @staticmethod
     def _derived_load_from_file(file):
+        state = pickle.load(file)
+        if len(state) == 12:
+            # Written before strides were supported
+            state = state[:6] + ((1, 1),) + state[6:]
         (
             input_size, 
             in_channels, 
@@ -260,15 +474,16 @@ class FilterLayer(LayerBase):
             filter_matrix, 
             dp_kernel, 
             zero_padding,
+            stride,
             last_input,
             last_output,
             _E_input,
             _S_diag,
             _S_n1_diag,
             _Z_T__E_input__S_n1,
-        ) = pickle.load(file)
+        ) = state
 
-        filter_layer = FilterLayer(input_size, in_channels, filter_size, filter_matrix, dp_kernel, zero_padding)
+        filter_layer = FilterLayer(input_size, in_channels, filter_size, filter_matrix, dp_kernel, zero_padding, stride)
         filter_layer.last_input = last_input
         filter_layer.last_output = last_output
         filter_layer._E_input = _E_input
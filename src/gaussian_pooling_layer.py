@@ -0,0 +1,142 @@
+import numpy as np
+from layer_base import LayerBase
+from gradient_calculation_info import GradientCalculationInfo
+import pickle
+
+class GaussianPoolingLayer(LayerBase):
+    """Linear pooling with a Gaussian window followed by subsampling. The 2D Gaussian is separable, so forward and
+    adjoint are computed as one 1D pass per axis with a cost proportional to the window width"""
+
+    cache_attributes = ('last_output',)
+
+    def __init__(self, input_size, in_channels, subsampling, sigma = None):
+        super().__init__(
+            input_size=input_size,
+            output_size=((input_size[0] - 1) // subsampling[0] + 1, (input_size[1] - 1) // subsampling[1] + 1),
+            in_channels=in_channels,
+            out_channels=in_channels
+        )
+
+        self.subsampling = subsampling
+        self.sigma = sigma if sigma is not None else GaussianPoolingLayer.default_sigma(subsampling)
+        self.last_output = None
+
+        self._weights = [GaussianPoolingLayer.gaussian_weights(sigma) for sigma in self.sigma]
+
+    @staticmethod
+    def default_sigma(subsampling):
+        return (subsampling[0] / np.sqrt(2), subsampling[1] / np.sqrt(2))
+
+    @staticmethod
+    def gaussian_weights(sigma):
+        # Normalized 1D Gaussian weights, truncated at two standard deviations
+        radius = int(np.ceil(2 * sigma))
+        weights = np.exp(-np.arange(-radius, radius + 1) ** 2 / (2 * sigma ** 2))
+        return weights / weights.sum()
+
+    def compute_gradient(self, gradient_calculation_info):
+        new_info = GradientCalculationInfo(
+            last_output_after_pooling=gradient_calculation_info.last_output_after_pooling,
+            U=gradient_calculation_info.U,
+            U_upscaled=self.backward(gradient_calculation_info.U_upscaled), # U P^T
+            layer_number=gradient_calculation_info.layer_number - 1
+        )
+
+        return 0, new_info
+
+    def gradient_descent(self, descent):
+        pass
+
+    def forward(self, input):
+        assert input.shape[1] == self.input_size[0] * self.input_size[1]
+
+        pooled = input.reshape(self.out_channels, self.input_size[0], self.input_size[1])
+        pooled = self._pool_axis(pooled, axis=1)
+        pooled = self._pool_axis(pooled, axis=2)
+
+        self.last_output = pooled.reshape(self.out_channels, -1)
+        return self.last_output
+
+    def backward(self, U):
+        assert U.shape[1] == self.output_size[0] * self.output_size[1]
+
+        upscaled = U.reshape(-1, self.output_size[0], self.output_size[1])
+        upscaled = self._pool_axis_t(upscaled, axis=2, size=self.input_size[1])
+        upscaled = self._pool_axis_t(upscaled, axis=1, size=self.input_size[0])
+
+        return upscaled.reshape(-1, self.input_size[0] * self.input_size[1])
+
+    def _pool_axis(self, U_3d, axis):
+        # out[k] = sum_t w[t] U_padded[k * s + t] along the axis
+        weights = self._weights[axis - 1]
+        radius = len(weights) // 2
+        subsampling = self.subsampling[axis - 1]
+        output_length = self.output_size[axis - 1]
+
+        padded_shape = list(U_3d.shape)
+        padded_shape[axis] += 2 * radius
+        padded = np.zeros(padded_shape)
+        padded[self._axis_slice(axis, radius, radius + U_3d.shape[axis])] = U_3d
+
+        output_shape = list(U_3d.shape)
+        output_shape[axis] = output_length
+        output = np.zeros(output_shape)
+        for t, weight in enumerate(weights):
+            output += weight * padded[self._axis_slice(axis, t, t + subsampling * (output_length - 1) + 1, subsampling)]
+
+        return output
+
+    def _pool_axis_t(self, U_3d, axis, size):
+        # Adjoint of _pool_axis: U_padded[k * s + t] += w[t] out[k], then remove the padding
+        weights = self._weights[axis - 1]
+        radius = len(weights) // 2
+        subsampling = self.subsampling[axis - 1]
+        output_length = U_3d.shape[axis]
+
+        padded_shape = list(U_3d.shape)
+        padded_shape[axis] = size + 2 * radius
+        padded = np.zeros(padded_shape)
+        for t, weight in enumerate(weights):
+            padded[self._axis_slice(axis, t, t + subsampling * (output_length - 1) + 1, subsampling)] += weight * U_3d
+
+        return padded[self._axis_slice(axis, radius, radius + size)]
+
+    @staticmethod
+    def _axis_slice(axis, start, stop, step = 1):
+        index = [slice(None)] * 3
+        index[axis] = slice(start, stop, step)
+        return tuple(index)
+
+    def save_to_file(self, file):
+        if isinstance(file, str):
+            with open(file, "wb") as f:
+                return self.save_to_file(f)
+
+        file.write(f"{GaussianPoolingLayer.__name__}\n".encode())
+        pickle.dump(
+            (
+                self.input_size,
+                self.in_channels,
+                self.subsampling,
+                self.sigma,
+                self.last_output,
+            ),
+            file
+        )
+
+    @staticmethod
+    def _derived_load_from_file(file):
+        (
+            input_size,
+            in_channels,
+            subsampling,
+            sigma,
+            last_output,
+        ) = pickle.load(file)
+
+        pooling_layer = GaussianPoolingLayer(input_size, in_channels, subsampling, sigma)
+        pooling_layer.last_output = last_output
+
+        return pooling_layer
+
+LayerBase.register_derived(GaussianPoolingLayer)
@@ -0,0 +1,199 @@
+"""
+Asynchronous (Hogwild-style) SGD on parameters in shared memory. The network's parameter arrays (filter matrices and
+output weights) are placed in one shared memory block (see inference_server.SharedNetwork) and every worker process
+trains on its own share of the images of every epoch. For each minibatch a worker
+
+    1. copies the current shared parameters into its local network, which recomputes the derived matrices of the
+       layers (A, A^1/2 and A^3/2 of FilterLayer) from exactly the filters the minibatch is computed with,
+    2. runs Optimizer.step for every image of the minibatch on the local network, and
+    3. applies Optimizer.optim to the shared parameters without any lock.
+
+Other workers may update the shared parameters between 1. and 3., so gradients can be slightly stale and concurrent
+updates of the same array may interleave; there is no halving and rollback of the learning rate. The images are also
+shared once instead of copied to every worker.
+
+Run with --compare to measure the training loss per wall-clock second against the synchronous Trainer on MNIST.
+"""
+
+# Standard library imports
+import os
+import argparse
+import time
+import types
+import multiprocessing
+from copy import deepcopy
+from multiprocessing import shared_memory
+
+# Third-party library imports
+import numpy as np
+
+# Local imports
+from optimizer import Optimizer
+from inference_server import SharedNetwork
+
+
+def _share_array(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.dtype.str, array.shape)
+
+
+def _attach_array(descriptor):
+    name, dtype, shape = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _train_worker(worker_index, num_workers, network_descriptor, images_descriptor, labels_descriptor, loss_function,
+                  update_rule, learning_rate, regularization_parameter, batch_size, epochs, seed, start_time):
+    shared_network, network_shm = SharedNetwork.attach(network_descriptor, writeable=True)
+    images_shm, train_images = _attach_array(images_descriptor)
+    labels_shm, train_labels = _attach_array(labels_descriptor)
+
+    optimizer = Optimizer(deepcopy(shared_network), loss_function, update_rule)
+    parameters = shared_network.get_parameters()
+    losses = []
+
+    for epoch in range(epochs):
+        # All workers draw the same permutation of the epoch and train on their share of it
+        permutation = np.random.RandomState(seed + epoch).permutation(len(train_images))[worker_index::num_workers]
+
+        for start in range(0, len(permutation) - batch_size + 1, batch_size):
+            optimizer.network.set_parameters([(j, name, array.copy()) for j, name, array in parameters])
+            for index in permutation[start:start + batch_size]:
+                optimizer.step(train_images[index], train_labels[index])
+
+            loss = optimizer.optim(learning_rate, regularization_parameter, target=shared_network)
+            losses.append((time.time() - start_time, loss))
+
+    del shared_network, parameters, train_images, train_labels
+    for shm in [network_shm, images_shm, labels_shm]:
+        try:
+            shm.close()
+        except BufferError:
+            # Views are still referenced (e.g. by the optimizer's cached arrays), the mapping is released with them
+            pass
+
+    return losses
+
+
+def train_hogwild(network, loss_function, learning_rate, regularization_parameter, batch_size, train_images, train_labels,
+                  epochs = 1, processes = None, update_rule = None, seed = 0):
+    """Train the network asynchronously with processes workers (one per CPU by default), each with its own copy of
+    update_rule (plain gradient descent by default), and set the network's parameters to the result. Returns the
+    (seconds since the start, average minibatch loss) of all minibatches of all workers in the order of time"""
+
+    processes = processes if processes is not None else os.cpu_count()
+    start_time = time.time()
+
+    shared_network = SharedNetwork(network)
+    images_shm, images_descriptor = _share_array(np.asarray(train_images))
+    labels_shm, labels_descriptor = _share_array(np.asarray(train_labels))
+
+    # Every worker computes its own minibatches, so keep the BLAS libraries single-threaded. The libraries read the
+    # variables when the workers import numpy, so they are set before the pool starts them
+    for variable in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ.setdefault(variable, '1')
+
+    try:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes) as pool:
+            worker_losses = pool.starmap(_train_worker, [
+                (worker_index, processes, shared_network.descriptor, images_descriptor, labels_descriptor, loss_function,
+                 deepcopy(update_rule), learning_rate, regularization_parameter, batch_size, epochs, seed, start_time)
+                for worker_index in range(processes)
+            ])
+
+        trained_network, shm = SharedNetwork.attach(shared_network.descriptor)
+        network.set_parameters([(j, name, array.copy()) for j, name, array in trained_network.get_parameters()])
+        del trained_network
+        shm.close()
+    finally:
+        shared_network.close()
+        for shm in [images_shm, labels_shm]:
+            shm.close()
+            shm.unlink()
+
+    return sorted(loss for losses in worker_losses for loss in losses)
+
+
+def train_synchronous(trainer, epochs):
+    """Train the trainer for epochs and return the (seconds since the start, average batch loss) of every batch, to
+    compare with train_hogwild"""
+
+    start_time = time.time()
+    losses = []
+    for _ in range(epochs):
+        while True:
+            trainer.finish_batch()
+            losses.append((time.time() - start_time, trainer.average_loss_batch[-1]))
+            if trainer.epoch_counter == 0 or trainer.stopped:
+                break
+    return losses
+
+
+def loss_curve(losses, interval):
+    """Average of the losses in every interval seconds, as (end of the interval, average loss) pairs"""
+
+    times = np.array([t for t, _ in losses])
+    values = np.array([loss for _, loss in losses])
+    curve = []
+    for end in np.arange(interval, times[-1] + interval, interval):
+        in_interval = (times > end - interval) & (times <= end)
+        if in_interval.any():
+            curve.append((end, values[in_interval].mean()))
+    return curve
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare asynchronous shared-memory SGD with the synchronous trainer on MNIST')
+    parser.add_argument('-m', help='path to the directory of the mnist dataset', type=str, dest="mnist_dir", default='mnist')
+    parser.add_argument('-e', help='number of epochs', type=int, dest="epochs", default=1)
+    parser.add_argument('-j', help='number of worker processes', type=int, dest="processes", default=os.cpu_count())
+    parser.add_argument('-n', help='number of training images', type=int, dest="num_images", default=60000)
+    parser.add_argument('-b', help='batch size', type=int, dest="batch_size", default=128)
+    parser.add_argument('-lr', help='learning rate', type=float, dest="learning_rate", default=2)
+    parser.add_argument('--interval', help='seconds per point of the loss curves', type=float, dest="interval", default=10)
+    parser.add_argument('--compare', help='also train synchronously and print both loss curves', action='store_true', dest="compare")
+    args = parser.parse_args()
+
+    from mnist import MNIST
+    import kernel
+    import layer_info as li
+    from train_mnist import create_mnist_trainer
+
+    mnist = MNIST.memory_mapped(args.mnist_dir)
+    layers = [
+        li.FilterInfo(filter_size=(3, 3), zero_padding='same', out_channels=10, dp_kernel=kernel.RadialBasisFunction(alpha=4)),
+        li.AvgPoolingInfo(pooling_size=(3, 3)),
+        li.FilterInfo(filter_size=(3, 3), zero_padding='same', out_channels=10, dp_kernel=kernel.RadialBasisFunction(alpha=4)),
+    ]
+
+    subset = types.SimpleNamespace(train_images=mnist.train_images[:args.num_images], train_labels=mnist.train_labels[:args.num_images])
+
+    # The same initial network for both
+    np.random.seed(0)
+    trainer = create_mnist_trainer(subset, layers, batch_size=args.batch_size, learning_rate=args.learning_rate)
+    network = deepcopy(trainer.optimizer.network)
+
+    curves = {}
+    accuracies = {}
+    losses = train_hogwild(network, trainer.optimizer.loss_function, args.learning_rate, trainer.regularization_parameter,
+                           args.batch_size, subset.train_images, subset.train_labels, args.epochs, args.processes)
+    curves['hogwild'] = (losses[-1][0], loss_curve(losses, args.interval))
+    accuracies['hogwild'] = np.mean(np.argmax(network.predict(mnist.test_images), axis=1) == mnist.test_labels)
+
+    if args.compare:
+        losses = train_synchronous(trainer, args.epochs)
+        curves['synchronous'] = (losses[-1][0], loss_curve(losses, args.interval))
+        accuracies['synchronous'] = np.mean(np.argmax(trainer.optimizer.network.predict(mnist.test_images), axis=1) == mnist.test_labels)
+
+    # Training loss per wall-clock interval
+    for name, (elapsed_time, curve) in curves.items():
+        print(f"{name}: {elapsed_time:.1f}s, test accuracy {100 * accuracies[name]:.2f}%")
+        for end, loss in curve:
+            print(f"    {end:8.1f}s  {loss:.6f}")
+
+
+if __name__ == '__main__':
+    main()
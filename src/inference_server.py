@@ -0,0 +1,443 @@
+"""
+Serves a trained Network over HTTP on localhost. The network is loaded from its save_to_file checkpoint (or a trainer
+checkpoint with --trainer), its structure and parameters are copied once into a shared memory block, and a pool of
+worker processes builds the network on views of that block, so the parameters exist once for all workers.
+
+POST /predict with a JSON body {"images": [[...], ...]} (flattened images) answers {"labels": [...], "scores": [[...]]}.
+Concurrent requests are grouped by a micro-batcher into batches of at most max_batch_size images; a batch is sent as soon
+as it is full or max_wait seconds after its first request arrived. GET /stats answers the latency and throughput
+statistics. Run with --load-test to send requests of test images to a running server.
+
+With --watch the checkpoint is watched and every completed (atomically replaced) checkpoint is swapped in without 
+stopping the server: the new parameters go to a new shared memory block with the next generation number, batches
+dispatched afterwards carry its descriptor, and each worker attaches to it on its next batch. The old block is unlinked
+as soon as no dispatched batch refers to it any more.
+"""
+
+# Standard library imports
+import os
+import sys
+import argparse
+import json
+import pickle
+import queue
+import threading
+import time
+import urllib.request
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Third-party library imports
+import numpy as np
+
+# Local imports
+from network import Network
+
+
+class SharedNetwork:
+    """The pickled structure and the parameter arrays of a network in one shared memory block. The descriptor
+    (generation, block name, structure size, layout) is all a worker needs to attach to it"""
+
+    def __init__(self, network, generation = 0):
+        parameters = network.get_parameters()
+
+        # Pickle the structure without the parameters and the arrays cached by the last forward pass
+        structure_bytes = pickle.dumps(network.structure())
+
+        # Layout of the parameters behind the structure, 8 byte aligned
+        layout = []
+        offset = (len(structure_bytes) + 7) // 8 * 8
+        for j, name, array in parameters:
+            array = np.asarray(array, dtype=float)
+            layout.append((j, name, offset, array.shape))
+            offset += array.nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.shm.buf[:len(structure_bytes)] = structure_bytes
+        for (j, name, array), (_, _, offset, shape) in zip(parameters, layout):
+            np.ndarray(shape, dtype=float, buffer=self.shm.buf, offset=offset)[...] = array
+
+        self.descriptor = (generation, self.shm.name, len(structure_bytes), layout)
+
+    @property
+    def generation(self):
+        return self.descriptor[0]
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    @staticmethod
+    def attach(descriptor, writeable = False):
+        """Build the network on views of the shared memory block. Returns the network and the block, which has to be
+        kept open as long as the network is used. With writeable the network's updates go to the block"""
+
+        _, name, structure_size, layout = descriptor
+        shm = shared_memory.SharedMemory(name=name)
+        network = pickle.loads(bytes(shm.buf[:structure_size]))
+
+        parameters = []
+        for j, parameter_name, offset, shape in layout:
+            array = np.ndarray(shape, dtype=float, buffer=shm.buf, offset=offset)
+            array.flags.writeable = writeable
+            parameters.append((j, parameter_name, array))
+        network.set_parameters(parameters)
+
+        return network, shm
+
+
+# State of a worker process: the network of the generation it last attached to
+_worker = {'generation': None, 'network': None, 'shm': None}
+
+
+def _predict_batch(descriptor, images):
+    if _worker['generation'] != descriptor[0]:
+        network, shm = SharedNetwork.attach(descriptor)
+        if _worker['shm'] is not None:
+            _worker['network'] = None
+            try:
+                _worker['shm'].close()
+            except BufferError:
+                # Views of the old block are still referenced, the mapping is released with them
+                pass
+        _worker.update(generation=descriptor[0], network=network, shm=shm)
+
+    return _worker['network'].predict(images)
+
+
+class InferenceStats:
+    def __init__(self, window = 10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self.start_time = time.time()
+        self.num_requests = 0
+        self.num_images = 0
+        self.num_batches = 0
+
+    def add_request(self, num_images, latency):
+        with self._lock:
+            self.num_requests += 1
+            self.num_images += num_images
+            self._latencies.append(latency)
+
+    def add_batch(self, batch_size):
+        with self._lock:
+            self.num_batches += 1
+            self._batch_sizes.append(batch_size)
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            elapsed_time = time.time() - self.start_time
+            percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) > 0 else [0, 0, 0]
+            return {
+                'requests': self.num_requests,
+                'images': self.num_images,
+                'batches': self.num_batches,
+                'mean_batch_size': float(np.mean(self._batch_sizes)) if self._batch_sizes else 0,
+                'images_per_second': self.num_images / elapsed_time if elapsed_time > 0 else 0,
+                'latency_ms_mean': float(np.mean(latencies)) if len(latencies) > 0 else 0,
+                'latency_ms_p50': float(percentiles[0]),
+                'latency_ms_p95': float(percentiles[1]),
+                'latency_ms_p99': float(percentiles[2]),
+            }
+
+
+class InferenceServer:
+    def __init__(self, network, host = '127.0.0.1', port = 0, processes = 2, max_batch_size = 64, max_wait = 0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = InferenceStats()
+
+        self.shared_network = SharedNetwork(network)
+        self.num_reloads = 0
+        self._generation_lock = threading.Lock()
+        self._in_flight = {}    # generation -> number of dispatched batches
+        self._retired = {}      # generation -> replaced SharedNetwork with batches in flight
+        self._requests = queue.Queue()
+        # Every worker computes its own batches, so keep the BLAS libraries single-threaded. The libraries read the 
+        # variables when the workers import numpy, which happens before any initializer runs
+        for variable in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+            os.environ.setdefault(variable, '1')
+        self._pool = multiprocessing.get_context('spawn').Pool(processes)
+        self._batcher = threading.Thread(target=self._batch_requests, daemon=True)
+        self._http_server = ThreadingHTTPServer((host, port), InferenceServer._handler(self))
+        self._http_thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        host, port = self._http_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._batcher.start()
+        self._http_thread.start()
+        return self
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._requests.put(None)
+        self._batcher.join()
+        self._pool.close()
+        self._pool.join()
+        for shared_network in list(self._retired.values()) + [self.shared_network]:
+            shared_network.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def update_network(self, network):
+        """Serve the network from the next batch on. Batches already dispatched finish with the previous network"""
+
+        shared_network = SharedNetwork(network, generation=self.shared_network.generation + 1)
+        with self._generation_lock:
+            previous = self.shared_network
+            self.shared_network = shared_network
+            self.num_reloads += 1
+            if self._in_flight.get(previous.generation, 0) == 0:
+                previous.close()
+            else:
+                self._retired[previous.generation] = previous
+
+    def predict(self, images):
+        """Scores of the images, computed by the workers in a micro-batch with the images of concurrent requests"""
+
+        future = Future()
+        self._requests.put((np.asarray(images, dtype=float), future))
+        return future.result()
+
+    def _batch_requests(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            # Collect requests until the batch is full or the first request waited max_wait seconds
+            batch = [request]
+            batch_size = len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            while batch_size < self.max_batch_size:
+                try:
+                    request = self._requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._requests.put(None)
+                    break
+                batch.append(request)
+                batch_size += len(request[0])
+
+            self.stats.add_batch(batch_size)
+            images = np.concatenate([images for images, _ in batch])
+            with self._generation_lock:
+                descriptor = self.shared_network.descriptor
+                self._in_flight[descriptor[0]] = self._in_flight.get(descriptor[0], 0) + 1
+
+            self._pool.apply_async(
+                _predict_batch, (descriptor, images),
+                callback=lambda scores, batch=batch, generation=descriptor[0]: self._distribute(batch, scores, generation),
+                error_callback=lambda error, batch=batch, generation=descriptor[0]: self._fail(batch, error, generation)
+            )
+
+    def _distribute(self, batch, scores, generation):
+        self._release(generation)
+        start = 0
+        for images, future in batch:
+            future.set_result(scores[start:start + len(images)])
+            start += len(images)
+
+    def _fail(self, batch, error, generation):
+        self._release(generation)
+        for _, future in batch:
+            future.set_exception(error)
+
+    def _release(self, generation):
+        # Unlink a replaced block once its last batch is done (the workers keep their mapping until they switch)
+        with self._generation_lock:
+            self._in_flight[generation] -= 1
+            if self._in_flight[generation] == 0:
+                del self._in_flight[generation]
+                if generation in self._retired:
+                    self._retired.pop(generation).close()
+
+    @staticmethod
+    def _handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._send_json(200, dict(server.stats.summary(), generation=server.shared_network.generation,
+                                              reloads=server.num_reloads))
+                else:
+                    self._send_json(404, {'error': f"unknown path {self.path}"})
+
+            def do_POST(self):
+                if self.path != '/predict':
+                    self._send_json(404, {'error': f"unknown path {self.path}"})
+                    return
+
+                start_time = time.monotonic()
+                try:
+                    images = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['images']
+                    scores = server.predict(images)
+                except (ValueError, KeyError) as error:
+                    self._send_json(400, {'error': str(error)})
+                    return
+
+                server.stats.add_request(len(scores), time.monotonic() - start_time)
+                self._send_json(200, {'labels': np.argmax(scores, axis=1).tolist(), 'scores': scores.tolist()})
+
+            def _send_json(self, status, content):
+                body = json.dumps(content).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class CheckpointWatcher:
+    """Polls a checkpoint file and calls on_change with the newly loaded network whenever the file was replaced. 
+    Networks, trainers and analyses write their checkpoints atomically (by os.replace); a changed file that cannot be
+    loaded, e.g. one still being written by another program, is reported and loaded again on the next poll"""
+
+    def __init__(self, filepath, on_change, trainer = False, interval = 1.0):
+        self.filepath = filepath
+        self.on_change = on_change
+        self.trainer = trainer
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._last_state = self._file_state()
+        self._failed_state = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _file_state(self):
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            state = self._file_state()
+            if state is None or state == self._last_state:
+                continue
+            try:
+                network = load_network(self.filepath, self.trainer)
+            except Exception as error:
+                if state != self._failed_state:
+                    print(f"Could not reload {self.filepath}: {error!r}", file=sys.stderr)
+                    self._failed_state = state
+                continue
+            self._last_state = state
+            self.on_change(network)
+
+
+def load_network(filepath, trainer = False):
+    """Load a network checkpoint, or the best network of a trainer or analysis checkpoint"""
+    if trainer:
+        from trainer import Trainer
+        return Trainer.load_best_network(filepath)
+    return Network.load_from_file(filepath)
+
+
+def request_predictions(url, images, timeout = 60):
+    """Send one /predict request and return the labels and scores"""
+
+    body = json.dumps({'images': np.asarray(images).tolist()}).encode()
+    request = urllib.request.Request(url + '/predict', data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        content = json.loads(response.read())
+    return np.array(content['labels']), np.array(content['scores'])
+
+
+def load_test(url, images, num_requests, concurrency = 8, images_per_request = 1):
+    """Send num_requests requests of images_per_request consecutive images from concurrency threads. Returns the
+    predicted labels of every request and the client-side statistics"""
+
+    def send(j):
+        start = (j * images_per_request) % len(images)
+        request_images = [images[(start + k) % len(images)] for k in range(images_per_request)]
+        start_time = time.monotonic()
+        labels, _ = request_predictions(url, request_images)
+        return labels, time.monotonic() - start_time
+
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(send, range(num_requests)))
+    elapsed_time = time.monotonic() - start_time
+
+    latencies = np.array([latency for _, latency in results]) * 1000
+    stats = {
+        'requests': num_requests,
+        'requests_per_second': num_requests / elapsed_time,
+        'images_per_second': num_requests * images_per_request / elapsed_time,
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+    }
+    return [labels for labels, _ in results], stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a trained network over HTTP on localhost')
+    parser.add_argument('-f', help='filepath of the network checkpoint', type=str, dest="filepath")
+    parser.add_argument('--trainer', help='the checkpoint is a trainer or analysis, serve its best network', action='store_true', dest="trainer")
+    parser.add_argument('--watch', help='reload the network whenever the checkpoint is replaced', action='store_true', dest="watch")
+    parser.add_argument('-p', help='port', type=int, dest="port", default=8000)
+    parser.add_argument('-j', help='number of worker processes', type=int, dest="processes", default=os.cpu_count())
+    parser.add_argument('-b', help='maximum number of images per batch', type=int, dest="max_batch_size", default=64)
+    parser.add_argument('-w', help='maximum time in ms a request waits for its batch to fill', type=float, dest="max_wait_ms", default=5)
+    parser.add_argument('--load-test', help='send requests of test images to the server at this url instead of serving', type=str, dest="url")
+    parser.add_argument('-m', help='path to the directory of the mnist dataset (for --load-test)', type=str, dest="mnist_dir", default='mnist')
+    parser.add_argument('-n', help='number of requests of the load test', type=int, dest="num_requests", default=1000)
+    parser.add_argument('-c', help='number of concurrent clients of the load test', type=int, dest="concurrency", default=8)
+    args = parser.parse_args()
+
+    if args.url is not None:
+        from mnist import MNIST
+        mnist = MNIST.memory_mapped(args.mnist_dir)
+        predictions, stats = load_test(args.url, mnist.test_images, args.num_requests, args.concurrency)
+        num_correct = sum(int(labels[0] == mnist.test_labels[j % len(mnist.test_labels)]) for j, labels in enumerate(predictions))
+        print(json.dumps(stats, indent=4))
+        print(f"Accuracy: {num_correct}/{len(predictions)}")
+        return
+
+    network = load_network(args.filepath, args.trainer)
+
+    with InferenceServer(network, port=args.port, processes=args.processes, max_batch_size=args.max_batch_size,
+                         max_wait=args.max_wait_ms / 1000) as server:
+        watcher = CheckpointWatcher(args.filepath, server.update_network, args.trainer).start() if args.watch else None
+        print(f"Serving on {server.address}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        if watcher is not None:
+            watcher.stop()
+
+
+if __name__ == '__main__':
+    main()
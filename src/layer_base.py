@@ -1,6 +1,10 @@
+import numpy as np
 import pickle
 
 class LayerBase:
+    # Names of the arrays forward creates and keeps for compute_gradient
+    cache_attributes = ()
+
     def __init__(self, input_size, output_size, in_channels, out_channels):
         self.input_size = input_size
         self.output_size = output_size
@@ -16,6 +20,28 @@ class LayerBase:
     def gradient_descent(self, descent):
         raise NotImplementedError()
 
+    def clear_cache(self):
+        """Drop the arrays kept by forward. compute_gradient needs a new forward pass afterwards"""
+        for name in self.cache_attributes:
+            setattr(self, name, None)
+
+    def cache_nbytes(self):
+        """Memory of the arrays currently kept by forward (without the input, as LayerInfo.cache_bytes)"""
+        arrays = [getattr(self, name) for name in self.cache_attributes]
+        return sum(array.nbytes for array in arrays if isinstance(array, np.ndarray))
+
+    def zero_gradient(self):
+        """A zero of the shape compute_gradient returns"""
+        return 0
+
+    def get_parameters(self):
+        """The trainable arrays of the layer by name (empty for layers without parameters)"""
+        return {}
+
+    def set_parameters(self, parameters):
+        """Replace the arrays returned by get_parameters, e.g. by views of shared memory"""
+        pass
+
     @staticmethod
     def load_from_file(file):
         if isinstance(file, str):
@@ -43,6 +69,10 @@ class LayerBase:
 def init_derived_layers():
     from filter_layer import FilterLayer
     from pooling_layer import PoolingLayer
+    from gaussian_pooling_layer import GaussianPoolingLayer
+    from random_feature_layer import RandomFeatureLayer
 
     LayerBase.register_derived(FilterLayer)
-    LayerBase.register_derived(PoolingLayer)
\ No newline at end of file
+    LayerBase.register_derived(PoolingLayer)
+    LayerBase.register_derived(GaussianPoolingLayer)
+    LayerBase.register_derived(RandomFeatureLayer)
\ No newline at end of file
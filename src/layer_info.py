@@ -1,18 +1,41 @@
 from filter_layer import FilterLayer
 from pooling_layer import PoolingLayer
+from gaussian_pooling_layer import GaussianPoolingLayer
+from random_feature_layer import RandomFeatureLayer
+import kernel
 import numpy as np
 
+class LayerSummary:
+    def __init__(self, layer_type, input_size, in_channels, output_size, out_channels, num_parameters, cache_bytes, flops):
+        self.layer_type = layer_type
+        self.input_size = input_size
+        self.in_channels = in_channels
+        self.output_size = output_size
+        self.out_channels = out_channels
+        self.num_parameters = num_parameters
+        self.cache_bytes = cache_bytes  # memory of the arrays the layer keeps from forward for the gradient computation
+        self.flops = flops  # estimated floating point operations of forward per image
+
+    @property
+    def is_valid(self):
+        return self.output_size[0] > 0 and self.output_size[1] > 0 and self.out_channels > 0
+
 class LayerInfoBase:
     def build(self, input_size, in_channels):
         raise NotImplementedError()
 
+    def infer(self, input_size, in_channels):
+        """Summarize the layer that build would create, without building any matrices"""
+        raise NotImplementedError()
+
 class FilterInfo(LayerInfoBase):
-    def __init__(self, filter_size, out_channels, dp_kernel, zero_padding = 'same', filter_matrix = None):
+    def __init__(self, filter_size, out_channels, dp_kernel, zero_padding = 'same', filter_matrix = None, stride = (1, 1)):
         self.filter_size = filter_size
         self.out_channels = out_channels
         self.dp_kernel = dp_kernel
         self.zero_padding = zero_padding
         self.filter_matrix = filter_matrix
+        self.stride = stride
 
     def build(self, input_size, in_channels):
         def create_random_filter_matrix():
@@ -23,20 +46,10 @@ class FilterInfo(LayerInfoBase):
             norms = np.linalg.norm(filter_matrix, axis = 0)
             return filter_matrix / norms
 
-        def zero_padding_str2tuple(zero_padding):
-            if isinstance(zero_padding, str):
-                if zero_padding == 'none':
-                    return (0, 0)
-                if zero_padding == 'same':
-                    return (self.filter_size[0] // 2, self.filter_size[1] // 2)
-                raise TypeError(f"'{zero_padding}' is not a tuple of integers or 'same' or 'none'")
-            
-            return zero_padding
-
         filter_matrix = self.filter_matrix if self.filter_matrix is not None else create_random_filter_matrix()
         filter_matrix = norm_filter_matrix(filter_matrix)
 
-        zero_padding = zero_padding_str2tuple(self.zero_padding)
+        zero_padding = self._zero_padding_tuple()
 
         return FilterLayer(
             input_size=input_size, 
@@ -44,19 +57,152 @@ class FilterInfo(LayerInfoBase):
             filter_size=self.filter_size,
             filter_matrix=filter_matrix,
             dp_kernel=self.dp_kernel,
-            zero_padding=zero_padding
+            zero_padding=zero_padding,
+            stride=self.stride
+        )
+
+    def infer(self, input_size, in_channels):
+        zero_padding = self._zero_padding_tuple()
+        output_size = (
+            (input_size[0] + zero_padding[0] * 2 - self.filter_size[0]) // self.stride[0] + 1,
+            (input_size[1] + zero_padding[1] * 2 - self.filter_size[1]) // self.stride[1] + 1
+        )
+        filter_vector_length = in_channels * self.filter_size[0] * self.filter_size[1]
+        num_patches = max(output_size[0], 0) * max(output_size[1], 0)
+        p = self.out_channels
+
+        return LayerSummary(
+            layer_type=FilterLayer.__name__,
+            input_size=input_size,
+            in_channels=in_channels,
+            output_size=output_size,
+            out_channels=p,
+            num_parameters=filter_vector_length * p,
+            # E(input), S, S^-1, Z^T E(input) S^-1 and the output M
+            cache_bytes=8 * num_patches * (filter_vector_length + 2 + 2 * p),
+            # patch norms and scaling, Z^T E(input) S^-1, kernel, A k(...) and scaling by S
+            flops=num_patches * (3 * filter_vector_length + 2 * p * filter_vector_length + 2 * p * p + 2 * p)
         )
 
+    def _zero_padding_tuple(self):
+        if isinstance(self.zero_padding, str):
+            if self.zero_padding == 'none':
+                return (0, 0)
+            if self.zero_padding == 'same':
+                return (self.filter_size[0] // 2, self.filter_size[1] // 2)
+            raise TypeError(f"'{self.zero_padding}' is not a tuple of integers or 'same' or 'none'")
+        
+        return self.zero_padding
+
 
         
+class RandomFeatureInfo(FilterInfo):
+    """Filter layer with out_channels random Fourier features of the RBF kernel instead of the projection onto the 
+    filters, see RandomFeatureLayer. The frequencies are sampled from N(0, alpha I) and the offsets from U(0, 2 pi)"""
+
+    def __init__(self, filter_size, out_channels, dp_kernel, zero_padding = 'same', stride = (1, 1), trainable = True, seed = None):
+        if not _is_radial_basis_function(dp_kernel):
+            raise ValueError("Random Fourier features are only defined for the RadialBasisFunction kernel")
+
+        super().__init__(filter_size, out_channels, dp_kernel, zero_padding=zero_padding, stride=stride)
+        self.trainable = trainable
+        self.seed = seed
+
+    def build(self, input_size, in_channels):
+        rng = np.random.default_rng(self.seed)
+        filter_vector_length = in_channels * self.filter_size[0] * self.filter_size[1]
+
+        return RandomFeatureLayer(
+            input_size=input_size,
+            in_channels=in_channels,
+            filter_size=self.filter_size,
+            filter_matrix=np.sqrt(self.dp_kernel.alpha) * rng.standard_normal((filter_vector_length, self.out_channels)),
+            offsets=rng.uniform(0, 2 * np.pi, self.out_channels),
+            alpha=self.dp_kernel.alpha,
+            zero_padding=self._zero_padding_tuple(),
+            stride=self.stride,
+            trainable=self.trainable
+        )
+
+    def infer(self, input_size, in_channels):
+        summary = super().infer(input_size, in_channels)
+        filter_vector_length = in_channels * self.filter_size[0] * self.filter_size[1]
+        num_patches = max(summary.output_size[0], 0) * max(summary.output_size[1], 0)
+        p = self.out_channels
+
+        summary.layer_type = RandomFeatureLayer.__name__
+        summary.num_parameters = filter_vector_length * p if self.trainable else 0
+        # patch norms and scaling, W^T E(input) S^-1 + b, cosine and scaling by S: no p x p product
+        summary.flops = num_patches * (3 * filter_vector_length + 2 * p * filter_vector_length + 3 * p)
+        return summary
+
+
+def _is_radial_basis_function(dp_kernel):
+    # Compared by name, since the kernel module can be loaded twice (as kernel and as src.kernel)
+    return any(cls.__name__ == kernel.RadialBasisFunction.__name__ and cls.__module__.rsplit('.', 1)[-1] == kernel.__name__
+               for cls in type(dp_kernel).__mro__)
+
+
 class AvgPoolingInfo(LayerInfoBase):
-    def __init__(self, pooling_size):
+    def __init__(self, pooling_size, stride = None):
         self.pooling_size = pooling_size
+        self.stride = stride
 
     def build(self, input_size, in_channels):
         return PoolingLayer(
             input_size=input_size,
             in_channels=in_channels,
-            pooling_size=self.pooling_size
+            pooling_size=self.pooling_size,
+            stride=self.stride
+        )
+
+    def infer(self, input_size, in_channels):
+        stride = self.stride if self.stride is not None else self.pooling_size
+        output_size = (
+            (input_size[0] - self.pooling_size[0]) // stride[0] + 1, 
+            (input_size[1] - self.pooling_size[1]) // stride[1] + 1
+        )
+        num_outputs = in_channels * output_size[0] * output_size[1]
+
+        return LayerSummary(
+            layer_type=PoolingLayer.__name__,
+            input_size=input_size,
+            in_channels=in_channels,
+            output_size=output_size,
+            out_channels=in_channels,
+            num_parameters=0,
+            cache_bytes=8 * num_outputs,
+            flops=num_outputs * self.pooling_size[0] * self.pooling_size[1]
+        )
+
+
+class GaussianPoolingInfo(LayerInfoBase):
+    def __init__(self, subsampling, sigma = None):
+        self.subsampling = subsampling
+        self.sigma = sigma
+
+    def build(self, input_size, in_channels):
+        return GaussianPoolingLayer(
+            input_size=input_size,
+            in_channels=in_channels,
+            subsampling=self.subsampling,
+            sigma=self.sigma
+        )
+
+    def infer(self, input_size, in_channels):
+        sigma = self.sigma if self.sigma is not None else GaussianPoolingLayer.default_sigma(self.subsampling)
+        widths = [len(GaussianPoolingLayer.gaussian_weights(s)) for s in sigma]
+        output_size = ((input_size[0] - 1) // self.subsampling[0] + 1, (input_size[1] - 1) // self.subsampling[1] + 1)
+
+        return LayerSummary(
+            layer_type=GaussianPoolingLayer.__name__,
+            input_size=input_size,
+            in_channels=in_channels,
+            output_size=output_size,
+            out_channels=in_channels,
+            num_parameters=0,
+            cache_bytes=8 * in_channels * output_size[0] * output_size[1],
+            # one multiply-add per window tap and output of the two 1D passes
+            flops=2 * in_channels * output_size[0] * (widths[0] * input_size[1] + widths[1] * output_size[1])
         )
 
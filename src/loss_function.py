@@ -7,6 +7,14 @@ class LossFunction:
     def gradient(self, predicted, expected):
         raise NotImplementedError()
 
+    def batch_loss(self, predicted, expected):
+        """Losses of a batch of predictions (one per row), as a vector"""
+        raise NotImplementedError()
+
+    def batch_gradient(self, predicted, expected):
+        """Gradients of a batch of predictions (one per row), as rows"""
+        raise NotImplementedError()
+
 class SquareHingeLoss(LossFunction):
     def __init__(self, margin):
         self.margin = margin
@@ -29,6 +37,26 @@ class SquareHingeLoss(LossFunction):
         grad = grad / len(loss_array)
         return grad
 
+    def batch_loss(self, predicted, expected):
+        loss_array = self._batch_loss_array(predicted, expected)
+        return (loss_array.sum(axis=1) ** 2) / (predicted.shape[1] - 1)
+
+    def batch_gradient(self, predicted, expected):
+        loss_array = self._batch_loss_array(predicted, expected)
+        rows = np.arange(len(predicted))
+
+        grad = (loss_array > 0).astype(float)
+        grad[rows, expected] = -np.count_nonzero(loss_array, axis=1)
+        grad *= (2 * loss_array.sum(axis=1) / (predicted.shape[1] - 1))[:, None]
+        return grad
+
+    def _batch_loss_array(self, predicted, expected):
+        # max(margin + predicted - predicted[expected], 0) with 0 at the expected entries
+        rows = np.arange(len(predicted))
+        loss_array = np.maximum(self.margin + predicted - predicted[rows, expected][:, None], 0)
+        loss_array[rows, expected] = 0
+        return loss_array
+
 class MeanSquaredError(LossFunction):
     def __init__(self):
         pass
@@ -37,4 +65,10 @@ class MeanSquaredError(LossFunction):
         return 1 / predicted.shape[0] * np.square(predicted - expected).sum()
     
     def gradient(self, predicted, expected):
-        return 2 * (predicted - expected) / predicted.shape[0]
\ No newline at end of file
+        return 2 * (predicted - expected) / predicted.shape[0]
+
+    def batch_loss(self, predicted, expected):
+        return np.square(predicted - expected).sum(axis=1) / predicted.shape[1]
+
+    def batch_gradient(self, predicted, expected):
+        return 2 * (predicted - expected) / predicted.shape[1]
\ No newline at end of file
@@ -0,0 +1,92 @@
+import math
+
+class LearningRateSchedule:
+    def learning_rate(self, base_learning_rate, batch, batches_per_epoch):
+        """Learning rate for the given (zero-based) batch"""
+        raise NotImplementedError()
+
+    def report_validation(self, accuracy):
+        pass
+
+class ConstantSchedule(LearningRateSchedule):
+    def learning_rate(self, base_learning_rate, batch, batches_per_epoch):
+        return base_learning_rate
+
+class StepSchedule(LearningRateSchedule):
+    def __init__(self, step_epochs, gamma=0.5):
+        self.step_epochs = step_epochs
+        self.gamma = gamma
+
+    def learning_rate(self, base_learning_rate, batch, batches_per_epoch):
+        return base_learning_rate * self.gamma ** (batch // (self.step_epochs * batches_per_epoch))
+
+class CosineSchedule(LearningRateSchedule):
+    def __init__(self, epochs, min_learning_rate=0):
+        self.epochs = epochs
+        self.min_learning_rate = min_learning_rate
+
+    def learning_rate(self, base_learning_rate, batch, batches_per_epoch):
+        progress = min(batch / (self.epochs * batches_per_epoch), 1)
+        return self.min_learning_rate + (base_learning_rate - self.min_learning_rate) * (1 + math.cos(math.pi * progress)) / 2
+
+class WarmupSchedule(LearningRateSchedule):
+    def __init__(self, warmup_batches, schedule=None):
+        self.warmup_batches = warmup_batches
+        self.schedule = schedule if schedule is not None else ConstantSchedule()
+
+    def learning_rate(self, base_learning_rate, batch, batches_per_epoch):
+        # Ramp up linearly, then hand over to the wrapped schedule as if it started after the warmup
+        if batch < self.warmup_batches:
+            return base_learning_rate * (batch + 1) / self.warmup_batches
+        return self.schedule.learning_rate(base_learning_rate, batch - self.warmup_batches, batches_per_epoch)
+
+    def report_validation(self, accuracy):
+        self.schedule.report_validation(accuracy)
+
+class PlateauSchedule(LearningRateSchedule):
+    """Multiplies the learning rate by factor whenever the validation accuracy did not improve for patience validations"""
+
+    def __init__(self, patience=2, factor=0.5, min_delta=0, min_learning_rate=0):
+        self.patience = patience
+        self.factor = factor
+        self.min_delta = min_delta
+        self.min_learning_rate = min_learning_rate
+
+        self.scale = 1
+        self.best_accuracy = -math.inf
+        self.num_bad_validations = 0
+
+    def learning_rate(self, base_learning_rate, batch, batches_per_epoch):
+        return max(base_learning_rate * self.scale, self.min_learning_rate)
+
+    def report_validation(self, accuracy):
+        if accuracy > self.best_accuracy + self.min_delta:
+            self.best_accuracy = accuracy
+            self.num_bad_validations = 0
+            return
+
+        self.num_bad_validations += 1
+        if self.num_bad_validations >= self.patience:
+            self.scale *= self.factor
+            self.num_bad_validations = 0
+
+class EarlyStopping:
+    """Signals to stop once the validation accuracy did not improve for patience validations"""
+
+    def __init__(self, patience=5, min_delta=0):
+        self.patience = patience
+        self.min_delta = min_delta
+
+        self.best_accuracy = -math.inf
+        self.num_bad_validations = 0
+
+    def report_validation(self, accuracy):
+        if accuracy > self.best_accuracy + self.min_delta:
+            self.best_accuracy = accuracy
+            self.num_bad_validations = 0
+        else:
+            self.num_bad_validations += 1
+
+    @property
+    def should_stop(self):
+        return self.num_bad_validations >= self.patience
@@ -20,6 +20,27 @@ class MNIST:
         with gzip.open(os.path.join(directory, 't10k-labels-idx1-ubyte.gz'), 'rb') as f:
             self.test_labels = np.frombuffer(f.read(), np.uint8, offset=8)
 
+    @staticmethod
+    def memory_mapped(directory):
+        """Loads the dataset from .npy copies of the arrays via memory mapping, creating them on first use, so 
+        that several processes share a single copy of the data in the page cache"""
+
+        names = ['train_images', 'train_labels', 'test_images', 'test_labels']
+        paths = {name: os.path.join(directory, f'{name}.npy') for name in names}
+
+        if not all(os.path.exists(path) for path in paths.values()):
+            mnist = MNIST(directory)
+            for name, path in paths.items():
+                # Write to a temporary file first so that no process maps a partially written file
+                tmp_path = path + '.tmp.npy'
+                np.save(tmp_path, getattr(mnist, name))
+                os.replace(tmp_path, path)
+
+        mnist = MNIST.__new__(MNIST)
+        for name, path in paths.items():
+            setattr(mnist, name, np.load(path, mmap_mode='r'))
+        return mnist
+
     @staticmethod
     def download_mnist(directory):
         base_url = 'http://yann.lecun.com/exdb/mnist/'
@@ -1,9 +1,46 @@
+import os
 import numpy as np
 from gradient_calculation_info import GradientCalculationInfo
 from layer_base import LayerBase
 import pickle
+import uuid
+
+class NetworkSummary:
+    def __init__(self, layer_summaries, output_nodes):
+        self.layers = layer_summaries
+        self.output_nodes = output_nodes
+
+        last = layer_summaries[-1]
+        num_features = last.out_channels * last.output_size[0] * last.output_size[1]
+        self.output_parameters = output_nodes * num_features
+
+        self.num_parameters = sum(layer.num_parameters for layer in layer_summaries) + self.output_parameters
+        self.cache_bytes = sum(layer.cache_bytes for layer in layer_summaries)
+        self.flops = sum(layer.flops for layer in layer_summaries) + 2 * self.output_parameters
+
+    def __str__(self):
+        lines = [f"{'layer':<14}{'input':>14}{'output':>14}{'parameters':>12}{'cache (KiB)':>13}{'FLOPs':>14}"]
+        for layer in self.layers:
+            lines.append(
+                f"{layer.layer_type:<14}"
+                f"{'{}x{}x{}'.format(layer.in_channels, *layer.input_size):>14}"
+                f"{'{}x{}x{}'.format(layer.out_channels, *layer.output_size):>14}"
+                f"{layer.num_parameters:>12}{layer.cache_bytes / 1024:>13.1f}{layer.flops:>14}"
+            )
+        lines.append(f"{'output':<14}{'':>14}{self.output_nodes:>14}{self.output_parameters:>12}{'':>13}{2 * self.output_parameters:>14}")
+        lines.append(f"{'total':<14}{'':>14}{'':>14}{self.num_parameters:>12}{self.cache_bytes / 1024:>13.1f}{self.flops:>14}")
+        return "\n".join(lines)
 
 class Network:
+    # If not None, forward keeps the caches of the layers (see LayerBase.cache_nbytes) only as long as they sum up to 
+    # at most cache_budget bytes. The other layers are grouped into segments of consecutive layers whose caches sum 
+    # up to at most cache_budget bytes (or single layers exceeding it); only the input of every segment is kept and 
+    # compute_gradients recomputes the segment's forward pass when the backward walk reaches it
+    cache_budget = None
+
+    # (first layer, last layer, input) of the segments of the last forward pass
+    _segments = ()
+
     def __init__(self, input_size, in_channels, layer_infos, output_nodes, output_weights = None):
         self.layers = []
 
@@ -22,6 +59,29 @@ class Network:
         self.output_weights = output_weights
         self.last_input = None
         self.last_output = None        
+        self.parameters_changed()
+
+    @staticmethod
+    def summarize(input_size, in_channels, layer_infos, output_nodes):
+        """Infer the shapes, parameter counts, forward-cache memory and FLOPs per image of the network the arguments 
+        would build, without building any layer. Raises a ValueError for layer stacks that shrink the input to nothing"""
+
+        layer_summaries = []
+        for layer_info in layer_infos:
+            layer_summary = layer_info.infer(input_size, in_channels)
+            if not layer_summary.is_valid:
+                raise ValueError(f"Layer {len(layer_summaries)} ({layer_summary.layer_type}) maps an input of size "
+                                 f"{in_channels}x{input_size[0]}x{input_size[1]} to an empty output")
+            layer_summaries.append(layer_summary)
+            input_size = layer_summary.output_size
+            in_channels = layer_summary.out_channels
+
+        return NetworkSummary(layer_summaries, output_nodes)
+
+    def parameters_changed(self):
+        """Give the network a new version. Must be called whenever parameters are modified, so that results computed
+        for an older version (e.g. cached test results) are not reused. Copies share the version until modified"""
+        self.version = uuid.uuid4().hex
 
     @property
     def input_size(self):
@@ -31,15 +91,85 @@ class Network:
     def output_size(self):
         return self.output_weights.shape[0]
     
-    def forward(self, x):
+    def forward(self, x, first_layer_patches = None):
+        """first_layer_patches optionally gives the patches and norms of x for the first (filter) layer, as returned by 
+        its patches_and_norms(x), e.g. from a PatchCache"""
+
         self.last_input = x
+        self._segments = []
 
-        for layer in self.layers:
-            x = layer.forward(x)
+        kept_bytes = 0
+        segment = None
+        for j, layer in enumerate(self.layers):
+            layer_input = x
+            if j == 0 and first_layer_patches is not None:
+                x = layer.forward_patches(x, *first_layer_patches)
+            else:
+                x = layer.forward(x)
+
+            if self.cache_budget is None:
+                continue
+
+            cache_bytes = layer.cache_nbytes()
+            if kept_bytes + cache_bytes <= self.cache_budget:
+                kept_bytes += cache_bytes
+                segment = None
+                continue
+
+            # Recompute the layer in the backward pass, as part of the current segment if it fits
+            if segment is None or segment_bytes + cache_bytes > self.cache_budget:
+                segment = [j, j, layer_input]
+                segment_bytes = 0
+                self._segments.append(segment)
+            segment[1] = j
+            segment_bytes += cache_bytes
+            layer.clear_cache()
 
         self.last_output = (x[None, :, :] * self.output_weights).sum(axis=(1, 2))
         return self.last_output
 
+    def predict(self, images):
+        """Outputs of the network for a batch of images, as rows"""
+        return np.array([self.forward(image) for image in images]).reshape(len(images), self.output_size)
+
+    def structure(self):
+        """Copy of the network without any arrays (parameters and the arrays cached by forward are None), to be 
+        completed by set_parameters"""
+
+        structure = Network.__new__(Network)
+        structure.layers = []
+        for layer in self.layers:
+            layer_structure = layer.__class__.__new__(layer.__class__)
+            layer_structure.__dict__ = {name: None if isinstance(value, np.ndarray) else value for name, value in layer.__dict__.items()}
+            structure.layers.append(layer_structure)
+
+        structure.output_weights = None
+        structure.last_input = None
+        structure.last_output = None
+        structure.version = self.version
+        structure.cache_budget = self.cache_budget
+        return structure
+
+    def get_parameters(self):
+        """All parameter arrays as a list of (layer index, name, array), with layer index -1 for the output weights"""
+        parameters = [(j, name, array) for j, layer in enumerate(self.layers) for name, array in layer.get_parameters().items()]
+        parameters.append((-1, 'output_weights', self.output_weights))
+        return parameters
+
+    def set_parameters(self, parameters):
+        """Replace the parameter arrays by the arrays of a list in the format of get_parameters"""
+        layer_parameters = [{} for _ in self.layers]
+        for j, name, array in parameters:
+            if j == -1:
+                self.output_weights = array
+            else:
+                layer_parameters[j][name] = array
+
+        for layer, parameters in zip(self.layers, layer_parameters):
+            if parameters:
+                layer.set_parameters(parameters)
+        self.parameters_changed()
+
     def compute_gradients(self, loss_func_gradient):
         """Compute the gradients for all filter layers and the output layer"""
 
@@ -47,6 +177,11 @@ class Network:
         num_layers = len(self.layers)
         gradients = [None] * (num_layers + 1)
 
+        segments_by_end = {segment[1]: segment for segment in self._segments}
+        segment_starts = {segment[0]: segment for segment in self._segments}
+        if num_layers - 1 in segments_by_end:
+            self._recompute(segments_by_end.pop(num_layers - 1))
+
         # Compute gradient for output_weights
         last_output = self.layers[num_layers - 1].last_output
         gradients[-1] = loss_func_gradient[:, None, None] * last_output[None, :, :]
@@ -58,14 +193,34 @@ class Network:
                                       U_upscaled=U,
                                       layer_number=num_layers-1)
         for i in reversed(range(len(self.layers))):
+            if i in segments_by_end:
+                self._recompute(segments_by_end[i])
             gradients[i], gci = self.layers[i].compute_gradient(gci)
+
+            # Free the recomputed caches of the segment again
+            if i in segment_starts:
+                start, end, _ = segment_starts[i]
+                for layer in self.layers[start:end + 1]:
+                    layer.clear_cache()
         
         return gradients
 
+    def _recompute(self, segment):
+        start, end, x = segment
+        for layer in self.layers[start:end + 1]:
+            x = layer.forward(x)
+
+    def zero_gradients(self):
+        """Gradients as returned by compute_gradients for a zero loss function gradient, without a backward pass"""
+        return [layer.zero_gradient() for layer in self.layers] + [np.zeros_like(self.output_weights)]
+
     def save_to_file(self, file):
         if isinstance(file, str):
-            with open(file, "wb") as f:
-                return self.save_to_file(f)
+            # Write to a temporary file first so that readers never see a partially written file
+            with open(file + '.tmp', "wb") as f:
+                self.save_to_file(f)
+            os.replace(file + '.tmp', file)
+            return
         
         pickle.dump(len(self.layers), file)
         for layer in self.layers:
@@ -80,6 +235,15 @@ class Network:
             file
         )
 
+    @staticmethod
+    def skip_in_file(file):
+        """Advance the file past a network written by save_to_file without building its layers"""
+        num_layers = pickle.load(file)
+        for _ in range(num_layers):
+            file.readline()
+            pickle.load(file)
+        pickle.load(file)
+
     @staticmethod
     def load_from_file(file):
         if isinstance(file, str):
@@ -102,4 +266,5 @@ class Network:
         network.output_weights = output_weights
         network.last_input = last_input
         network.last_output = last_output
+        network.parameters_changed()
         return network
\ No newline at end of file
@@ -1,13 +1,22 @@
 from copy import deepcopy
 import numpy as np
 from network import Network
+from update_rule import GradientDescent
 import pickle
 
 class Optimizer:
-    def __init__(self, network, loss_function):
+    def __init__(self, network, loss_function, update_rule = None):
+        self.update_rule = update_rule if update_rule is not None else GradientDescent()
         self.network = network
         self.loss_function = loss_function
 
+        # False if the output weights are fitted separately (e.g. by output_solver), only the layers are then updated
+        self.update_output_weights = True
+
+        # Number of steps (since creation) and of those the steps whose backward pass was skipped
+        self.total_steps = 0
+        self.total_skipped = 0
+
     @property
     def network(self):
         return self._network
@@ -16,14 +25,29 @@ class Optimizer:
     def network(self, network):
         if getattr(self, '_network', None) is not network:
             self._network = network
+            self.update_rule.reset()
             self.reset()
 
-    def step(self, training_input, expected_output):
-        """Perform a forward pass through the network, compute the loss and gradients, and accumulate them"""
+    def step(self, training_input, expected_output, first_layer_patches = None, weight = 1):
+        """Perform a forward pass through the network, compute the loss and gradients, and accumulate them scaled by the
+        (importance) weight. Returns the unweighted loss. The backward pass is skipped if the loss function gradient is
+        zero (e.g. for images SquareHingeLoss classifies correctly by more than the margin), as all gradients are zero
+        then"""
 
-        predicted = self.network.forward(training_input)
-        self.loss_sum += self.loss_function.loss(predicted=predicted, expected=expected_output)
+        predicted = self.network.forward(training_input, first_layer_patches)
+        loss = self.loss_function.loss(predicted=predicted, expected=expected_output)
+        self.loss_sum += weight * loss
         loss_func_gradient = self.loss_function.gradient(self.network.last_output, expected_output)
+        if weight != 1:
+            loss_func_gradient = loss_func_gradient * weight
+        self.num_steps += 1
+        self.total_steps += 1
+
+        if not np.any(loss_func_gradient):
+            self.num_skipped += 1
+            self.total_skipped += 1
+            return loss
+
         gradients = self.network.compute_gradients(loss_func_gradient)
         
         if self.gradient_sum is not None:
@@ -34,24 +58,34 @@ class Optimizer:
             # Initialize the gradient sum if this is the first step
             self.gradient_sum = gradients
 
-        self.num_steps += 1
+        return loss
 
-    def optim(self, learning_rate, regularization_parameter):
-        """Perform the optimization step, updating the filters and output weights in the network"""
+    def optim(self, learning_rate, regularization_parameter, target = None):
+        """Perform the optimization step, updating the filters and output weights in the network. The update is applied 
+        to target instead if given, a network of the same structure (e.g. on shared parameters the steps were computed
+        from a snapshot of)"""
 
         if self.num_steps == 0:
             return
 
-        gradient_sum_multiplier = learning_rate / self.num_steps
+        network = target if target is not None else self.network
         regularization_term = np.sum(self.network.output_weights * self.network.output_weights) * regularization_parameter / 2
 
-        # Perform gradient descent on all layers except the output layer
-        for j, layer in enumerate(self.network.layers):
-            layer.gradient_descent(gradient_sum_multiplier * self.gradient_sum[j])
+        if self.gradient_sum is None:
+            # The backward passes of all steps were skipped, the update rule still has to see the zero gradients
+            self.gradient_sum = self.network.zero_gradients()
+
+        # Perform gradient descent on all layers except the output layer (layers without parameters have a zero gradient)
+        for j, layer in enumerate(network.layers):
+            if isinstance(self.gradient_sum[j], np.ndarray):
+                layer.gradient_descent(self._descent(j, learning_rate))
         
         # Update the output weights using L2 regularization
-        self.network.output_weights *= 1 - learning_rate * regularization_parameter
-        self.network.output_weights -= gradient_sum_multiplier * self.gradient_sum[-1] 
+        if self.update_output_weights:
+            network.output_weights *= 1 - learning_rate * regularization_parameter
+            network.output_weights -= self._descent(-1, learning_rate)
+
+        network.parameters_changed()
 
         # Compute the total loss and reset the optimizer for the next iteration
         loss = self.loss_sum / self.num_steps + regularization_term
@@ -59,12 +93,19 @@ class Optimizer:
 
         return loss
 
+    def _descent(self, j, learning_rate):
+        # Average the accumulated gradient in place and let the update rule turn it into a descent
+        gradient = self.gradient_sum[j]
+        gradient /= self.num_steps
+        return self.update_rule.descent(j, gradient, learning_rate)
+
     def reset(self):
         """Reset the optimizer for the next iteration"""
 
         self.loss_sum = 0
         self.gradient_sum = None
         self.num_steps = 0
+        self.num_skipped = 0
 
     def save_to_file(self, file):
         if isinstance(file, str):
@@ -77,11 +118,37 @@ class Optimizer:
                 self.loss_function,
                 self.loss_sum,
                 self.gradient_sum,
-                self.num_steps
+                self.num_steps,
+                self.update_rule,
+                self.total_steps,
+                self.total_skipped,
             ), 
             file
         )
 
+    def write_checkpoint(self, writer):
+        """Write the sections 'network' and 'optimizer' to a CheckpointWriter"""
+        writer.write_network('network', self.network)
+        writer.write_object('optimizer', (
+            self.loss_function,
+            self.loss_sum,
+            self.gradient_sum,
+            self.num_steps,
+            self.update_rule,
+            self.total_steps,
+            self.total_skipped,
+        ))
+
+    @staticmethod
+    def read_checkpoint(reader):
+        return Optimizer._from_state(reader.read_network('network'), reader.read_object('optimizer'))
+
+    @staticmethod
+    def skip_in_file(file):
+        """Advance the file past an optimizer written by save_to_file"""
+        Network.skip_in_file(file)
+        pickle.load(file)
+
     @staticmethod
     def load_from_file(file):
         if isinstance(file, str):
@@ -89,15 +156,25 @@ class Optimizer:
                 return Optimizer.load_from_file(f)
         
         network = Network.load_from_file(file)
+        return Optimizer._from_state(network, pickle.load(file))
+
+    @staticmethod
+    def _from_state(network, state):
         (
             loss_function,
             loss_sum,
             gradient_sum,
-            num_steps
-        ) = pickle.load(file)
+            num_steps,
+        ) = state[:4]
+        # Files written before the update rule was saved were trained by plain gradient descent
+        update_rule = state[4] if len(state) > 4 else GradientDescent()
 
         optimizer = Optimizer(network, loss_function)
+        # Assigned after the network, which would reset the update rule's state
+        optimizer.update_rule = update_rule
         optimizer.loss_sum = loss_sum
         optimizer.gradient_sum = gradient_sum
         optimizer.num_steps = num_steps
+        # Files written before the step counters were saved start counting anew
+        optimizer.total_steps, optimizer.total_skipped = state[5:7] if len(state) > 5 else (0, 0)
         return optimizer
\ No newline at end of file
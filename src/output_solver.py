@@ -0,0 +1,142 @@
+"""
+Fits the output layer of a network directly on the final features instead of by SGD. With features f_i (the flattened
+outputs of the last layer) of n images, the objective is the one Optimizer.optim minimizes for the output weights W:
+
+    1/n sum_i loss(W f_i, y_i) + regularization_parameter/2 ||W||^2
+
+For MeanSquaredError with one-hot targets this is a ridge regression, solved from the Gram matrices F^T F and F^T Y
+(accumulated chunk by chunk) by a Cholesky factorization. Other losses (e.g. SquareHingeLoss) are minimized by L-BFGS,
+evaluating loss and gradient chunk by chunk. features can be any array of shape (n, num_features), e.g. the reshaped
+memory-mapped features of a FeatureStore.
+"""
+
+import numpy as np
+from loss_function import MeanSquaredError
+
+def network_features(network, images):
+    """Flattened outputs of the last layer of the network for all images, as rows"""
+
+    last_layer = network.layers[-1]
+    features = np.empty((len(images), last_layer.out_channels * last_layer.output_size[0] * last_layer.output_size[1]))
+    for j, image in enumerate(images):
+        x = image
+        for layer in network.layers:
+            x = layer.forward(x)
+        features[j] = x.reshape(-1)
+    return features
+
+
+def solve_least_squares(features, labels, num_outputs, regularization_parameter, chunk_size=10000):
+    """Output weights minimizing the mean squared error to the one-hot labels. Setting the gradient to zero gives
+    (F^T F + n k regularization_parameter/2 I) W^T = F^T Y"""
+
+    num_features = features.shape[1]
+    gram = np.zeros((num_features, num_features))
+    features_T__targets = np.zeros((num_features, num_outputs))
+
+    for start in range(0, len(features), chunk_size):
+        chunk = np.asarray(features[start:start + chunk_size], dtype=float)
+        gram += chunk.T @ chunk
+        # F^T Y for one-hot Y adds every feature vector to the column of its label
+        np.add.at(features_T__targets.T, np.asarray(labels[start:start + chunk_size]), chunk)
+
+    gram[np.diag_indices(num_features)] += len(features) * num_outputs * regularization_parameter / 2
+
+    # Solve L L^T W^T = F^T Y
+    L = np.linalg.cholesky(gram)
+    weights_T = np.linalg.solve(L.T, np.linalg.solve(L, features_T__targets))
+
+    return weights_T.T
+
+
+def solve_lbfgs(features, labels, loss_function, regularization_parameter, initial_weights, iterations=100, history=10,
+                tolerance=1e-6, chunk_size=10000):
+    """Output weights minimizing the average loss plus the L2 term by L-BFGS, starting from initial_weights
+    (num_outputs, num_features), until the norm of the gradient is at most tolerance. The loss function needs batch_loss
+    and batch_gradient"""
+
+    n = len(features)
+    shape = initial_weights.shape
+
+    def loss_and_gradient(weights):
+        loss = 0
+        gradient = np.zeros(shape)
+        for start in range(0, n, chunk_size):
+            chunk = np.asarray(features[start:start + chunk_size], dtype=float)
+            chunk_labels = labels[start:start + chunk_size]
+            predicted = chunk @ weights.T
+            loss += loss_function.batch_loss(predicted, chunk_labels).sum()
+            gradient += loss_function.batch_gradient(predicted, chunk_labels).T @ chunk
+
+        loss = loss / n + np.sum(weights * weights) * regularization_parameter / 2
+        gradient = gradient / n + regularization_parameter * weights
+        return loss, gradient
+
+    weights = np.array(initial_weights, dtype=float)
+    loss, gradient = loss_and_gradient(weights)
+    steps, gradient_changes = [], []
+
+    for _ in range(iterations):
+        if np.linalg.norm(gradient) <= tolerance:
+            break
+
+        # Two-loop recursion for the direction -H g
+        direction = -gradient
+        alphas = []
+        for s, y in zip(reversed(steps), reversed(gradient_changes)):
+            alpha = np.sum(s * direction) / np.sum(y * s)
+            direction = direction - alpha * y
+            alphas.append(alpha)
+        if steps:
+            direction *= np.sum(steps[-1] * gradient_changes[-1]) / np.sum(gradient_changes[-1] * gradient_changes[-1])
+        else:
+            direction /= max(1, np.linalg.norm(gradient))
+        for s, y, alpha in zip(steps, gradient_changes, reversed(alphas)):
+            beta = np.sum(y * direction) / np.sum(y * s)
+            direction = direction + (alpha - beta) * s
+
+        slope = np.sum(gradient * direction)
+        if slope >= 0:
+            # Not a descent direction, restart from the gradient
+            steps, gradient_changes = [], []
+            direction = -gradient / max(1, np.linalg.norm(gradient))
+            slope = np.sum(gradient * direction)
+
+        # Backtracking line search with the Armijo condition
+        step_size = 1
+        while True:
+            new_weights = weights + step_size * direction
+            new_loss, new_gradient = loss_and_gradient(new_weights)
+            if new_loss <= loss + 1e-4 * step_size * slope or step_size < 1e-10:
+                break
+            step_size /= 2
+
+        if new_loss >= loss:
+            break
+
+        s, y = new_weights - weights, new_gradient - gradient
+        if np.sum(s * y) > 1e-12:
+            steps.append(s)
+            gradient_changes.append(y)
+            if len(steps) > history:
+                steps.pop(0)
+                gradient_changes.pop(0)
+
+        weights, loss, gradient = new_weights, new_loss, new_gradient
+
+    return weights
+
+
+def solve_output_layer(network, features, labels, loss_function, regularization_parameter, **kwargs):
+    """Replace the output weights of the network by the solution for the features (rows of the flattened last layer
+    outputs) and labels. Uses the Cholesky solve for MeanSquaredError and L-BFGS (warm started) otherwise"""
+
+    shape = network.output_weights.shape
+    if isinstance(loss_function, MeanSquaredError):
+        weights = solve_least_squares(features, labels, shape[0], regularization_parameter, **kwargs)
+    else:
+        weights = solve_lbfgs(features, labels, loss_function, regularization_parameter,
+                              network.output_weights.reshape(shape[0], -1), **kwargs)
+
+    network.output_weights = weights.reshape(shape)
+    network.parameters_changed()
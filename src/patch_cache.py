@@ -0,0 +1,115 @@
+import os
+import hashlib
+import json
+from collections import OrderedDict
+import numpy as np
+
+class PatchCache:
+    """Caches the patch matrix E(image) and the patch norms S of the first (filter) layer for every training image,
+    which do not change between epochs. Entries are keyed by the index of the image in the training set.
+
+    In memory the entries are evicted in least recently used order once they take more than max_bytes. With a filename
+    all entries are stored in two memory-mapped .npy files (filename_patches.npy and filename_norms.npy) instead, whose
+    pages are managed by the operating system. Existing files are reused only if filename_fingerprint.json shows that
+    they were computed from the same training images by a layer of the same geometry. A dtype of np.float32 halves the
+    memory of the patches"""
+
+    def __init__(self, layer, images, max_bytes = None, filename = None, dtype = np.float64):
+        """images are the training images whose indices are passed to get"""
+        self.layer = layer
+        self.num_images = len(images)
+        self.max_bytes = max_bytes
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+        if filename is not None:
+            filter_vector_length = layer.in_channels * layer.filter_size[0] * layer.filter_size[1]
+            num_patches = layer.output_size[0] * layer.output_size[1]
+            fingerprint_path = f"{filename}_fingerprint.json"
+            fingerprint = PatchCache.fingerprint(layer, images)
+            reuse = False
+            if os.path.exists(fingerprint_path):
+                with open(fingerprint_path) as f:
+                    reuse = json.load(f).get('fingerprint') == fingerprint
+
+            self._patches = PatchCache._open_memmap(f"{filename}_patches.npy", self.dtype,
+                                                    (self.num_images, filter_vector_length, num_patches), reuse)
+            # Norms of 0 mark missing entries, since stored norms are always positive
+            self._norms = PatchCache._open_memmap(f"{filename}_norms.npy", np.dtype(np.float64), (self.num_images, num_patches), reuse)
+
+            # Written after the new (empty) files, so that an interrupted rebuild is repeated
+            if not reuse:
+                with open(fingerprint_path, 'w') as f:
+                    json.dump({'fingerprint': fingerprint}, f)
+
+    @staticmethod
+    def fingerprint(layer, images):
+        """Hash of the training images and of the geometry of the layer, which determine the cached entries"""
+
+        digest = hashlib.sha256()
+        digest.update(f"{layer.input_size}:{layer.in_channels}:{layer.filter_size}:{layer.zero_padding}:{layer.stride}".encode())
+        images = np.asarray(images)
+        digest.update(f"{images.dtype.str}:{images.shape}".encode())
+        for start in range(0, len(images), 1000):
+            digest.update(memoryview(np.ascontiguousarray(images[start:start + 1000])).cast('B'))
+        return digest.hexdigest()
+
+    @property
+    def nbytes(self):
+        """Memory of the entries held in memory (0 for memory-mapped caches)"""
+        return self._nbytes
+
+    def get(self, index, image):
+        """Return the patches and norms of the image, computing and storing them if they are not cached"""
+
+        if self.filename is not None:
+            return self._get_memmapped(index, image)
+
+        entry = self._entries.get(index)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(index)
+            return entry
+
+        self.misses += 1
+        E_input, S_diag = self.layer.patches_and_norms(image)
+        entry = (E_input.astype(self.dtype, copy=False), S_diag)
+        entry_bytes = entry[0].nbytes + entry[1].nbytes
+
+        if self.max_bytes is None or entry_bytes <= self.max_bytes:
+            # Evict the least recently used entries until the new one fits
+            while self.max_bytes is not None and self._nbytes + entry_bytes > self.max_bytes:
+                _, (evicted_E, evicted_S) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_E.nbytes + evicted_S.nbytes
+
+            self._entries[index] = entry
+            self._nbytes += entry_bytes
+
+        return entry
+
+    def _get_memmapped(self, index, image):
+        if self._norms[index, 0] > 0:
+            self.hits += 1
+            return self._patches[index], self._norms[index]
+
+        self.misses += 1
+        E_input, S_diag = self.layer.patches_and_norms(image)
+        self._patches[index] = E_input
+        self._norms[index] = S_diag
+
+        return self._patches[index], self._norms[index]
+
+    @staticmethod
+    def _open_memmap(filename, dtype, shape, reuse):
+        if reuse and os.path.exists(filename):
+            array = np.load(filename, mmap_mode='r+')
+            if array.shape == shape and array.dtype == dtype:
+                return array
+
+        return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
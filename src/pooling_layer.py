@@ -4,15 +4,24 @@ from gradient_calculation_info import GradientCalculationInfo
 import pickle
 
 class PoolingLayer(LayerBase):
-    def __init__(self, input_size, in_channels, pooling_size):
+    cache_attributes = ('last_output',)
+
+    def __init__(self, input_size, in_channels, pooling_size, stride = None):
+        # Non-overlapping windows by default, overlapping windows for strides smaller than the pooling size
+        stride = stride if stride is not None else pooling_size
+
         super().__init__(
             input_size=input_size, 
-            output_size=(input_size[0] // pooling_size[0], input_size[1] // pooling_size[1]), 
+            output_size=(
+                (input_size[0] - pooling_size[0]) // stride[0] + 1, 
+                (input_size[1] - pooling_size[1]) // stride[1] + 1
+            ), 
             in_channels=in_channels, 
             out_channels=in_channels
         )
 
         self.pooling_size = pooling_size
+        self.stride = stride
         self.last_output = None
     
     def compute_gradient(self, gradient_calculation_info):
@@ -58,8 +67,8 @@ class PoolingLayer(LayerBase):
             ),
             strides=(
                 stride_channels, 
-                stride_x * self.pooling_size[0], 
-                stride_y * self.pooling_size[1], 
+                stride_x * self.stride[0], 
+                stride_y * self.stride[1], 
                 stride_x, 
                 stride_y
             )
@@ -79,21 +88,40 @@ class PoolingLayer(LayerBase):
         # Reshape U into a 3D tensor
         U_3d = U.reshape(-1, self.output_size[0], self.output_size[1])
 
-        # Upsample the 3D tensor by repeating values along the pooling dimensions
-        upscaled = np.repeat(np.repeat(U_3d, self.pooling_size[0], axis=1), self.pooling_size[1], axis=2)
+        if self.stride != self.pooling_size:
+            return self._strided_avg_pooling_t(U_3d)
+
+        # Rows and columns that are not covered by a window (if the input dimensions are not multiples of the 
+        # pooling size) stay zero
+        upscaled = np.zeros((U_3d.shape[0], self.input_size[0], self.input_size[1]))
+
+        # Create a writeable view of the windows of the upscaled tensor, the same view as in _avg_pooling
+        stride_channels, stride_x, stride_y = upscaled.strides
+        window_view = np.lib.stride_tricks.as_strided(
+            upscaled,
+            shape=(U_3d.shape[0], self.output_size[0], self.output_size[1], self.pooling_size[0], self.pooling_size[1]),
+            strides=(stride_channels, stride_x * self.pooling_size[0], stride_y * self.pooling_size[1], stride_x, stride_y)
+        )
+
+        # Broadcast the normalized values into their (non-overlapping) windows
+        window_view[...] = (U_3d / (self.pooling_size[0] * self.pooling_size[1]))[:, :, :, None, None]
+
+        # Reshape the upscaled tensor
+        return upscaled.reshape(-1, self.input_size[0] * self.input_size[1])
 
-        # Pad the tensor with zeros if the input dimensions are not multiples of the pooling size
-        missing_x = self.input_size[0] - upscaled.shape[1]
-        missing_y = self.input_size[1] - upscaled.shape[2]
-        if missing_x > 0 or missing_y > 0:
-            upscaled = np.pad(upscaled, ((0, 0), (0, missing_x), (0, missing_y)))
+    def _strided_avg_pooling_t(self, U_3d):
+        upscaled = np.zeros((U_3d.shape[0], self.input_size[0], self.input_size[1]))
+        U_3d = U_3d / (self.pooling_size[0] * self.pooling_size[1])
 
-        # Normalize the values by the pooling size and reshape the tensor
-        upscaled /= self.pooling_size[0] * self.pooling_size[1]
-        upscaled = upscaled.reshape(-1, self.input_size[0] * self.input_size[1])
+        # Add every output value to all positions of its (possibly overlapping) window
+        for x_offset in range(self.pooling_size[0]):
+            for y_offset in range(self.pooling_size[1]):
+                upscaled[:, 
+                    x_offset : x_offset + self.stride[0] * (self.output_size[0] - 1) + 1 : self.stride[0],
+                    y_offset : y_offset + self.stride[1] * (self.output_size[1] - 1) + 1 : self.stride[1]
+                ] += U_3d
 
-        # Return the upscaled tensor
-        return upscaled
+        return upscaled.reshape(-1, self.input_size[0] * self.input_size[1])
 
     def save_to_file(self, file):
         if isinstance(file, str):
@@ -106,6 +134,7 @@ class PoolingLayer(LayerBase):
                 self.input_size, 
                 self.in_channels, 
                 self.pooling_size, 
+                self.stride,
                 self.last_output,
             ), 
             file
@@ -113,14 +142,19 @@ class PoolingLayer(LayerBase):
 
     @staticmethod
     def _derived_load_from_file(file):
+        state = pickle.load(file)
+        if len(state) == 4:
+            # Written before strides were supported, with non-overlapping windows
+            state = state[:3] + (None,) + state[3:]
         (
             input_size, 
             in_channels, 
             pooling_size, 
+            stride,
             last_output,
-        ) = pickle.load(file)
+        ) = state
 
-        pooling_layer = PoolingLayer(input_size, in_channels, pooling_size)
+        pooling_layer = PoolingLayer(input_size, in_channels, pooling_size, stride)
         pooling_layer.last_output = last_output
 
         return pooling_layer
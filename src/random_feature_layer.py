@@ -0,0 +1,148 @@
+import numpy as np
+from layer_base import LayerBase
+from filter_layer import FilterLayer
+import pickle
+
+class RandomFeatureLayer(FilterLayer):
+    """Filter layer that maps the normalized patches with random Fourier features of the RBF kernel
+    k(x^T z) = exp(alpha (x^T z - 1)) = exp(-alpha/2 ||x - z||^2) instead of projecting onto the span of filters.
+    With W ~ N(0, alpha I) (the filter matrix) and b ~ U(0, 2 pi) (the offsets) the output is
+
+        M = sqrt(2/D) cos(W^T E(input) S^-1 + b) S,
+
+    so that the inner products of the columns approximate the kernel. There is no p x p matrix A, which makes forward
+    and gradient linear in the number of features D. The gradients have the same structure as for FilterLayer:
+    with B = -sqrt(2/D) sin(W^T E(input) S^-1 + b) * U P^T the gradient with respect to W is E(input) B^T, and h(U) is
+    computed by FilterLayer._h with W in place of Z"""
+
+    def __init__(self, input_size, in_channels, filter_size, filter_matrix, offsets, alpha, zero_padding = (0, 0), stride = (1, 1), trainable = True):
+        self.offsets = offsets
+        self.alpha = alpha
+        self.trainable = trainable
+        super().__init__(input_size, in_channels, filter_size, filter_matrix, dp_kernel=None, zero_padding=zero_padding, stride=stride)
+
+    @property
+    def filter_matrix(self):
+        return self._filter_matrix
+
+    @filter_matrix.setter
+    def filter_matrix(self, filter_matrix):
+        assert filter_matrix.shape[0] == self.filter_size[0] * self.filter_size[1] * self.in_channels
+
+        # No derived matrices, the random features are used directly
+        self._filter_matrix = filter_matrix
+        self._scale = np.sqrt(2 / filter_matrix.shape[1])
+
+    def zero_gradient(self):
+        return super().zero_gradient() if self.trainable else 0
+
+    def get_parameters(self):
+        return {'filter_matrix': self.filter_matrix, 'offsets': self.offsets}
+
+    def set_parameters(self, parameters):
+        self.filter_matrix = parameters['filter_matrix']
+        self.offsets = parameters['offsets']
+
+    def forward(self, input):
+        # Without the p x p matrix A the patch matrix dominates less, so it is always processed untiled
+        return self.forward_patches(input, *self.patches_and_norms(input))
+
+    def forward_patches(self, input, E_input, S_diag):
+        self.last_input = input
+
+        # E(input)
+        self._E_input = E_input
+
+        # S (diagonal elements)
+        self._S_diag = S_diag
+
+        # S^-1 (diagonal elements)
+        self._S_n1_diag = 1 / self._S_diag
+
+        # Y = W^T E(input) S^-1 + b (stored in place of Z^T E(input) S^-1)
+        self._Z_T__E_input__S_n1 = self._filter_matrix.transpose() @ (self._E_input * self._S_n1_diag)
+        self._Z_T__E_input__S_n1 += self.offsets[:, None]
+
+        # M = sqrt(2/D) cos(Y) S
+        self.last_output = np.cos(self._Z_T__E_input__S_n1)
+        self.last_output *= self._scale * self._S_diag
+
+        return self.last_output
+
+    def gradient_descent(self, descent):
+        if self.trainable:
+            # The frequencies are not restricted to the unit sphere
+            self._filter_matrix -= descent
+
+    def _calculate_B(self, U_upscaled):
+        # B = -sqrt(2/D) sin(Y) * U P^T
+        return -self._scale * np.sin(self._Z_T__E_input__S_n1) * U_upscaled
+
+    def _calculate_C(self, U, last_output_after_pooling):
+        # There is no A depending on the filters
+        return None
+
+    def _g(self, B, C):
+        # g(U) = E(input) B^T
+        if not self.trainable:
+            return 0
+        return self._E_input @ B.transpose()
+
+    def save_to_file(self, file):
+        if isinstance(file, str):
+            with open(file, "wb") as f:
+                return self.save_to_file(f)
+
+        file.write(f"{RandomFeatureLayer.__name__}\n".encode())
+        pickle.dump(
+            (
+                self.input_size,
+                self.in_channels,
+                self.filter_size,
+                self.filter_matrix,
+                self.offsets,
+                self.alpha,
+                self.zero_padding,
+                self.stride,
+                self.trainable,
+                self.last_input,
+                self.last_output,
+                self._E_input,
+                self._S_diag,
+                self._S_n1_diag,
+                self._Z_T__E_input__S_n1,
+            ),
+            file
+        )
+
+    @staticmethod
+    def _derived_load_from_file(file):
+        (
+            input_size,
+            in_channels,
+            filter_size,
+            filter_matrix,
+            offsets,
+            alpha,
+            zero_padding,
+            stride,
+            trainable,
+            last_input,
+            last_output,
+            _E_input,
+            _S_diag,
+            _S_n1_diag,
+            _Z_T__E_input__S_n1,
+        ) = pickle.load(file)
+
+        layer = RandomFeatureLayer(input_size, in_channels, filter_size, filter_matrix, offsets, alpha, zero_padding, stride, trainable)
+        layer.last_input = last_input
+        layer.last_output = last_output
+        layer._E_input = _E_input
+        layer._S_diag = _S_diag
+        layer._S_n1_diag = _S_n1_diag
+        layer._Z_T__E_input__S_n1 = _Z_T__E_input__S_n1
+
+        return layer
+
+LayerBase.register_derived(RandomFeatureLayer)
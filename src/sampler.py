@@ -0,0 +1,42 @@
+import numpy as np
+
+class Sampler:
+    def sample(self, num_images, num_samples):
+        """Indices of the num_samples training images of an epoch and their importance weights (None if all are 1)"""
+        raise NotImplementedError()
+
+    def report_loss(self, index, loss):
+        pass
+
+class UniformSampler(Sampler):
+    def sample(self, num_images, num_samples):
+        # Every image at most once per epoch
+        return np.random.permutation(num_images)[:num_samples], None
+
+class LossImportanceSampler(Sampler):
+    def __init__(self, uniform_portion=0.5):
+        """Samples images with replacement, with probability proportional to the last loss of the image, mixed with
+        uniform sampling by uniform_portion. Images that were not seen yet get the highest known loss. The weights
+        1 / (num_images p_i) keep the averaged gradient unbiased and are at most 1 / uniform_portion"""
+
+        self.uniform_portion = uniform_portion
+        self.losses = None
+
+    def sample(self, num_images, num_samples):
+        if self.losses is None or len(self.losses) != num_images:
+            self.losses = np.full(num_images, np.nan)
+
+        seen = ~np.isnan(self.losses)
+        losses = np.where(seen, self.losses, np.max(self.losses[seen]) if seen.any() else 1)
+        total = losses.sum()
+
+        probabilities = np.full(num_images, 1 / num_images)
+        if total > 0:
+            probabilities *= self.uniform_portion
+            probabilities += (1 - self.uniform_portion) * losses / total
+
+        indices = np.random.choice(num_images, size=num_samples, p=probabilities)
+        return indices, 1 / (num_images * probabilities[indices])
+
+    def report_loss(self, index, loss):
+        self.losses[index] = loss
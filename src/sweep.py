@@ -0,0 +1,300 @@
+"""
+Runs a grid of create_analyses configurations concurrently in a process pool. A sweep config is a JSON file of the form
+
+{
+    "directory": "../analyses/sweep",
+    "epochs": 20,
+    "batches_per_test": 100,
+    "num_tests_batch": 1000,
+    "layer_stacks": {
+        "3_3x3_layers_10_filters_3x3_pooling": [
+            {"type": "filter", "filter_size": [3, 3], "out_channels": 10, "zero_padding": "same"},
+            {"type": "avg_pooling", "pooling_size": [3, 3]},
+            {"type": "filter", "filter_size": [3, 3], "out_channels": 10, "zero_padding": "same"}
+        ]
+    },
+    "alphas": [4],
+    "batch_sizes": [128],
+    "learning_rates": [2],
+    "kmeans_init": false
+}
+
+Filter and pooling layers take an optional "stride"; Gaussian pooling layers are given as
+{"type": "gaussian_pooling", "subsampling": [2, 2]} with an optional "sigma". Layers of type "random_features" take
+the arguments of filter layers plus an optional "trainable" and use random Fourier features of the kernel. Every 
+combination of layer stack, kernel alpha, batch size and learning rate is one run; "kmeans_init" initializes the 
+filters of new runs by spherical k-means and an optional "sampling" ("uniform" or "loss", see 
+train_mnist.create_sampler) chooses their training images. Relative directories are resolved relative to the config file.
+
+With --halving the grid is scheduled by successive halving: all runs train for a budget of batches, only the best 
+1/eta of them (by the accuracy of the current network on num_tests_batch test images) continue with an eta times 
+larger budget, and so on until one run is left, which is then trained for the full number of epochs. Every rung gets 
+a new pool with one process per surviving run (up to -j) and the cores divided among their BLAS threads, so the 
+survivors use the cores of the stopped runs. Stopped runs keep their checkpoints and are resumed by a later sweep 
+without --halving.
+"""
+
+# Standard library imports
+import os
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+
+# Third-party library imports
+from mnist import MNIST
+
+# Local imports
+import kernel
+import layer_info as li
+from analysis import Analysis
+from network import Network
+from create_analyses import create_analysis
+from train_mnist import create_mnist_trainer, create_sampler
+
+
+def layer_infos_from_config(layer_stack, alpha):
+    layer_infos = []
+    for layer in layer_stack:
+        if layer['type'] == 'filter':
+            layer_infos.append(li.FilterInfo(
+                filter_size=tuple(layer['filter_size']),
+                out_channels=layer['out_channels'],
+                zero_padding=layer.get('zero_padding', 'same'),
+                stride=tuple(layer.get('stride', (1, 1))),
+                dp_kernel=kernel.RadialBasisFunction(alpha=alpha)
+            ))
+        elif layer['type'] == 'random_features':
+            layer_infos.append(li.RandomFeatureInfo(
+                filter_size=tuple(layer['filter_size']),
+                out_channels=layer['out_channels'],
+                zero_padding=layer.get('zero_padding', 'same'),
+                stride=tuple(layer.get('stride', (1, 1))),
+                trainable=layer.get('trainable', True),
+                dp_kernel=kernel.RadialBasisFunction(alpha=alpha)
+            ))
+        elif layer['type'] == 'avg_pooling':
+            stride = layer.get('stride')
+            layer_infos.append(li.AvgPoolingInfo(pooling_size=tuple(layer['pooling_size']), stride=tuple(stride) if stride is not None else None))
+        elif layer['type'] == 'gaussian_pooling':
+            sigma = layer.get('sigma')
+            layer_infos.append(li.GaussianPoolingInfo(subsampling=tuple(layer['subsampling']), sigma=tuple(sigma) if sigma is not None else None))
+        else:
+            raise ValueError(f"Unknown layer type: {layer['type']}")
+    return layer_infos
+
+
+def sweep_runs(config, config_directory):
+    directory = os.path.join(config_directory, config['directory'])
+
+    # Reject layer stacks that do not fit the input before any run starts
+    summaries = {}
+    for stack_name, layer_stack in config['layer_stacks'].items():
+        try:
+            summaries[stack_name] = Network.summarize((28, 28), 1, layer_infos_from_config(layer_stack, alpha=1), output_nodes=10)
+        except ValueError as e:
+            print(f"Skipping layer stack {stack_name}: {e}")
+
+    runs = []
+    for (stack_name, layer_stack), alpha, batch_size, learning_rate in itertools.product(
+            config['layer_stacks'].items(), config['alphas'], config['batch_sizes'], config['learning_rates']):
+        if stack_name not in summaries:
+            continue
+        name = f"{stack_name}__alpha_{alpha}__batch_{batch_size}__lr_{learning_rate}"
+        runs.append(dict(
+            name=name,
+            filepath=os.path.join(directory, name),
+            layer_stack=layer_stack,
+            alpha=alpha,
+            batch_size=batch_size,
+            learning_rate=learning_rate,
+            epochs=config['epochs'],
+            batches_per_test=config.get('batches_per_test', 100),
+            num_tests_batch=config.get('num_tests_batch', 1000),
+            num_tests_epoch=config.get('num_tests_epoch', math.inf),
+            kmeans_init=config.get('kmeans_init', False),
+            sampling=config.get('sampling', 'uniform'),
+            num_parameters=summaries[stack_name].num_parameters,
+            flops=summaries[stack_name].flops,
+        ))
+    return runs
+
+
+# Memory-mapped MNIST of the worker process
+_mnist = None
+
+def _init_worker(mnist_dir):
+    global _mnist
+    _mnist = MNIST.memory_mapped(mnist_dir)
+
+
+def _create_trainer(run):
+    if os.path.exists(run['filepath']):
+        return None
+
+    return create_mnist_trainer(
+        data=_mnist,
+        model_layers=layer_infos_from_config(run['layer_stack'], run['alpha']),
+        batch_size=run['batch_size'],
+        learning_rate=run['learning_rate'],
+        kmeans_init=run['kmeans_init'],
+        sampler=create_sampler(run['sampling'])
+    )
+
+
+def run_configuration(run):
+    """Trains one configuration of the sweep (resuming from its checkpoint) and returns its summary row"""
+
+    trainer = _create_trainer(run)
+    analysis = create_analysis(
+        mnist=_mnist,
+        filepath=run['filepath'],
+        epochs=run['epochs'],
+        trainer=trainer,
+        batches_per_test=run['batches_per_test'],
+        num_tests_batch=run['num_tests_batch'],
+        num_tests_epoch=run['num_tests_epoch'],
+        verbose=False
+    )
+    print(f"Finished {run['name']}: {100.0 * analysis.test_results_epoch[-1].correct_portion:.2f}%", flush=True)
+    return summary_row(run, analysis)
+
+
+def run_budget(run, total_batches):
+    """Trains one configuration of the sweep (resuming from its checkpoint) until it has been trained for total_batches
+    batches or all its epochs, and returns its summary row with the accuracy of its current network"""
+
+    trainer = _create_trainer(run)
+    if trainer is None:
+        analysis = Analysis.load_from_file(run['filepath'], _mnist.train_images, _mnist.train_labels, _mnist.test_images, _mnist.test_labels)
+    else:
+        analysis = Analysis(trainer, _mnist.test_images, _mnist.test_labels, num_labels=10)
+
+    batches_per_epoch = analysis.trainer.epoch_size // analysis.trainer.batch_size
+    total_batches = min(total_batches, run['epochs'] * batches_per_epoch)
+    test_result = analysis.perform_batches(
+        batches=max(total_batches - len(analysis.trainer.average_loss_batch), 0),
+        batches_per_test=run['batches_per_test'],
+        num_tests_batch=run['num_tests_batch'],
+        num_tests_epoch=run['num_tests_epoch']
+    )
+    analysis.save_to_file(run['filepath'])
+
+    row = summary_row(run, analysis)
+    row['accuracy'] = test_result.correct_portion
+    row['finished'] = analysis.trainer.stopped or len(analysis.trainer.average_loss_batch) >= run['epochs'] * batches_per_epoch
+    return row
+
+
+def summary_row(run, analysis, status='finished'):
+    return dict(
+        name=run['name'],
+        status=status,
+        num_parameters=run['num_parameters'],
+        flops=run['flops'],
+        epochs=len(analysis.trainer.average_loss_epoch),
+        batches=len(analysis.trainer.average_loss_batch),
+        accuracy=analysis.test_results_epoch[-1].correct_portion,
+        best_accuracy=max(test_result.correct_portion for test_result in analysis.test_results_epoch + analysis.test_results_batch),
+        elapsed_time=analysis.elapsed_time,
+    )
+
+
+def write_summary(rows, filepath):
+    """Writes the summary rows as a tab-separated table, best accuracy first"""
+
+    rows = sorted(rows, key=lambda row: row['accuracy'], reverse=True)
+    with open(filepath, "w") as f:
+        f.write("name\tstatus\tparameters\tflops_per_image\tepochs\tbatches\taccuracy\tbest_accuracy\telapsed_time_s\n")
+        for row in rows:
+            f.write(f"{row['name']}\t{row['status']}\t{row['num_parameters']}\t{row['flops']}\t{row['epochs']}\t{row['batches']}\t{row['accuracy']:.4f}\t{row['best_accuracy']:.4f}\t{row['elapsed_time']:.1f}\n")
+
+
+# BLAS thread counts set by the user are kept, the others are chosen per pool
+BLAS_THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+_user_blas_variables = {variable for variable in BLAS_THREAD_VARIABLES if variable in os.environ}
+
+def _create_pool(runs, mnist_dir, processes):
+    # Create the memory-mapped copy of the dataset once before the workers map it
+    MNIST.memory_mapped(mnist_dir)
+    for run in runs:
+        os.makedirs(os.path.dirname(run['filepath']), exist_ok=True)
+
+    # Every process runs its own configuration, so divide the cores among the BLAS threads of the workers. The 
+    # libraries read the variables when the workers import numpy, so they are set before the pool starts them
+    processes = min(processes or os.cpu_count(), len(runs))
+    for variable in BLAS_THREAD_VARIABLES:
+        if variable not in _user_blas_variables:
+            os.environ[variable] = str(max(1, os.cpu_count() // processes))
+
+    context = multiprocessing.get_context('spawn')
+    return context.Pool(processes, initializer=_init_worker, initargs=(mnist_dir,))
+
+
+def run_sweep(runs, mnist_dir, summary_path, processes=None):
+    with _create_pool(runs, mnist_dir, processes) as pool:
+        rows = pool.map(run_configuration, runs, chunksize=1)
+
+    write_summary(rows, summary_path)
+    return rows
+
+
+def run_successive_halving(runs, mnist_dir, summary_path, min_batches, eta=3, processes=None):
+    """Successive halving over the runs. Every rung runs in its own pool sized to the surviving runs, so the cores of
+    the worst configurations go to the promising ones"""
+
+    rows = {}
+    survivors = runs
+    budget = min_batches
+    while len(survivors) > 1:
+        with _create_pool(survivors, mnist_dir, processes) as pool:
+            rung_rows = pool.starmap(run_budget, [(run, budget) for run in survivors], chunksize=1)
+        ranking = sorted(zip(survivors, rung_rows), key=lambda run_row: run_row[1]['accuracy'], reverse=True)
+        for run, row in ranking:
+            rows[run['name']] = row
+        if all(row['finished'] for _, row in ranking):
+            break
+
+        num_kept = max(1, len(survivors) // eta)
+        for run, row in ranking[num_kept:]:
+            row['status'] = f'stopped after {row["batches"]} batches'
+        print(f"Budget of {budget} batches: continuing with " + ", ".join(run['name'] for run, _ in ranking[:num_kept]), flush=True)
+
+        survivors = [run for run, _ in ranking[:num_kept]]
+        budget *= eta
+
+    with _create_pool(survivors, mnist_dir, processes) as pool:
+        for row in pool.map(run_configuration, survivors, chunksize=1):
+            rows[row['name']] = row
+
+    rows = list(rows.values())
+    write_summary(rows, summary_path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a grid of convolutional kernel network configurations on the MNIST dataset in parallel')
+    parser.add_argument('config', help='path to the JSON sweep config', type=str)
+    parser.add_argument('-m', help='path to the directory of the mnist dataset (downloads mnist dataset if not existent)', type=str, dest="mnist_dir",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '../mnist'))
+    parser.add_argument('-j', help='number of worker processes (defaults to the number of cores)', type=int, dest="processes", default=None)
+    parser.add_argument('--halving', help='schedule the runs by successive halving, starting with a budget of this many batches', type=int, dest="min_batches", default=None)
+    parser.add_argument('--eta', help='factor by which successive halving reduces the runs and increases the budget', type=int, dest="eta", default=3)
+    args = parser.parse_args()
+
+    config_path = os.path.realpath(args.config)
+    with open(config_path) as f:
+        config = json.load(f)
+    config_directory = os.path.dirname(config_path)
+
+    runs = sweep_runs(config, config_directory)
+    summary_path = os.path.join(config_directory, config['directory'], 'summary.tsv')
+    if args.min_batches is not None:
+        run_successive_halving(runs, args.mnist_dir, summary_path, args.min_batches, args.eta, args.processes)
+    else:
+        run_sweep(runs, args.mnist_dir, summary_path, args.processes)
+    print(f"Summary written to {summary_path}")
+
+if __name__ == '__main__':
+    main()
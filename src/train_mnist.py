@@ -14,19 +14,87 @@ import network
 import loss_function
 import optimizer as op
 import trainer as tr
+import update_rule as ur
+import lr_schedule as ls
+import sampler as sp
+from filter_initialization import initialize_filters_kmeans
+from patch_cache import PatchCache
+from augmentation import Augmentation
+from output_solver import network_features, solve_output_layer
 from trainer import Trainer
+from distributed import Coordinator, parse_addresses
+
+
+def create_update_rule(name):
+    if name == 'sgd':
+        return ur.GradientDescent()
+    if name == 'momentum':
+        return ur.Momentum(momentum=0.9)
+    if name == 'nesterov':
+        return ur.Momentum(momentum=0.9, nesterov=True)
+    if name == 'rmsprop':
+        return ur.RMSProp()
+    if name == 'adam':
+        return ur.Adam()
+    raise ValueError(f"Unknown update rule: {name}")
+
+
+def create_schedule(name, epochs, warmup_batches=0):
+    """Returns the learning-rate schedule for a name, or None for the halve-and-rollback rule"""
+
+    if name == 'rollback':
+        schedule = None
+    elif name == 'constant':
+        schedule = ls.ConstantSchedule()
+    elif name == 'step':
+        schedule = ls.StepSchedule(step_epochs=max(1, epochs // 4) if math.isfinite(epochs) else 5)
+    elif name == 'cosine':
+        schedule = ls.CosineSchedule(epochs=epochs if math.isfinite(epochs) else 20)
+    elif name == 'plateau':
+        schedule = ls.PlateauSchedule()
+    else:
+        raise ValueError(f"Unknown learning rate schedule: {name}")
+
+    if warmup_batches > 0:
+        if schedule is None:
+            raise ValueError("Warmup requires a learning rate schedule")
+        schedule = ls.WarmupSchedule(warmup_batches=warmup_batches, schedule=schedule)
+    return schedule
 
 
-def create_mnist_trainer(data, model_layers, square_hinge_loss_margin=0.2, batch_size=128, learning_rate=2, regularization_parameter=1/60000):
+def create_mnist_trainer(data, model_layers, square_hinge_loss_margin=0.2, batch_size=128, learning_rate=2, regularization_parameter=1/60000, 
+                         update_rule=None, schedule=None, validation_size=0, validation_interval=None, early_stopping_patience=None,
+                         kmeans_init=False, sampler=None, augmentation=None):
     net = network.Network(input_size=(28, 28), in_channels=1, layer_infos=model_layers, output_nodes=10)
-    optimizer = op.Optimizer(network=net, loss_function=loss_function.SquareHingeLoss(margin=square_hinge_loss_margin))
+    if kmeans_init:
+        # Only use the training images (not the held-out validation images) to initialize the filters
+        initialize_filters_kmeans(net, data.train_images[:len(data.train_images) - validation_size])
+    optimizer = op.Optimizer(network=net, loss_function=loss_function.SquareHingeLoss(margin=square_hinge_loss_margin), update_rule=update_rule)
     trainer = tr.Trainer(
         optimizer=optimizer, batch_size=batch_size, learning_rate=learning_rate, regularization_parameter=regularization_parameter,
-        train_images=data.train_images, train_labels=data.train_labels
+        train_images=data.train_images, train_labels=data.train_labels,
+        schedule=schedule, validation_size=validation_size, validation_interval=validation_interval,
+        early_stopping=ls.EarlyStopping(patience=early_stopping_patience) if early_stopping_patience is not None else None,
+        sampler=sampler,
+        augmentation=augmentation
     )
     return trainer
 
 
+def create_sampler(name, uniform_portion=0.5):
+    if name == 'uniform':
+        return sp.UniformSampler()
+    if name == 'loss':
+        return sp.LossImportanceSampler(uniform_portion=uniform_portion)
+    raise ValueError(f"Unknown sampling: {name}")
+
+
+def create_patch_cache(trainer, max_megabytes=None, filename=None):
+    """Cache of the first layer's patches of the trainer's training images (memory-mapped if a filename is given)"""
+    max_bytes = int(max_megabytes * 2**20) if max_megabytes is not None else None
+    return PatchCache(trainer.optimizer.network.layers[0], trainer.train_images, max_bytes=max_bytes, filename=filename)
+
+
 def perform_test(trainer, test_images, test_labels, num_tests):
     num_tests = min(num_tests, len(test_images))
     print(f"Test of size {num_tests}\t\t")
@@ -44,17 +112,35 @@ def perform_test(trainer, test_images, test_labels, num_tests):
     print()
 
 
-def train_network(trainer, filepath, test_images, test_labels, epochs, num_tests, epochs_btw_tests):
+def solve_head(trainer, num_images=math.inf):
+    """Fit the output weights of the trainer's network exactly to the features of (the first num_images) training images"""
+    num_images = min(num_images, len(trainer.train_images))
+    network = trainer.optimizer.network
+    features = network_features(network, trainer.train_images[:num_images])
+    solve_output_layer(network, features, trainer.train_labels[:num_images], trainer.optimizer.loss_function, trainer.regularization_parameter)
+
+
+def train_network(trainer, filepath, test_images, test_labels, epochs, num_tests, epochs_btw_tests, solve_head_images=None, coordinator=None):
+    """With solve_head_images the filters are trained by SGD while the output weights are solved exactly on the features
+    of that many training images at the start of every epoch. With a distributed.Coordinator of the trainer the batches
+    are computed by its workers"""
     epoch_test_counter = 0
+    trainer.optimizer.update_output_weights = solve_head_images is None
 
-    while trainer.epoch <= epochs:
+    while trainer.epoch <= epochs and not trainer.stopped:
         print(f"Epoch: {trainer.epoch}")
+        if solve_head_images is not None:
+            solve_head(trainer, solve_head_images)
+        steps, skipped = trainer.optimizer.total_steps, trainer.optimizer.total_skipped
         while True:
             print(f"[E{trainer.epoch}, {trainer.epoch_counter}]", end='\r')
-            trainer.finish_batch()
-            if trainer.epoch_counter == 0:
+            (coordinator if coordinator is not None else trainer).finish_batch()
+            if trainer.epoch_counter == 0 or trainer.stopped:
                 print(' ' * 50, end='\r')
                 break
+        steps, skipped = trainer.optimizer.total_steps - steps, trainer.optimizer.total_skipped - skipped
+        if steps > 0:
+            print(f"Backward passes skipped for zero loss gradients: {skipped}/{steps} ({100.0 * skipped / steps:.2f}%)")
         
         trainer.save_to_file(filepath)
         epoch_test_counter += 1
@@ -62,6 +148,10 @@ def train_network(trainer, filepath, test_images, test_labels, epochs, num_tests
             perform_test(trainer, test_images, test_labels, num_tests)
             epoch_test_counter = 0
 
+    if trainer.stopped:
+        print(f"Stopped early after {len(trainer.validation_accuracies)} validations without improvement "
+              f"(best validation accuracy {100.0 * trainer.best_validation_accuracy:.2f}%)")
+
 
 def main():
     parser = argparse.ArgumentParser(description='Train a convolutional kernel network on the MNIST dataset')
@@ -71,6 +161,27 @@ def main():
     parser.add_argument('-nt', help="number of tests to perform (<= 0 for all tests)", type=int, dest="num_tests", default=-1)
     parser.add_argument('-et', help="number of epochs between tests (<= for no tests)", type=int, dest="epochs_btw_tests", default=1)
     parser.add_argument('--initial-test', help="perform a test of the network before starting with training", action='store_true', dest='initial_test')
+    parser.add_argument('-u', help="update rule of a new trainer", choices=['sgd', 'momentum', 'nesterov', 'rmsprop', 'adam'], dest="update_rule", default='sgd')
+    parser.add_argument('-lr', help="initial learning rate of a new trainer", type=float, dest="learning_rate", default=2)
+    parser.add_argument('-s', help="learning rate schedule of a new trainer ('rollback' halves the learning rate and restores the best network when the epoch loss increases)", 
+                        choices=['rollback', 'constant', 'step', 'cosine', 'plateau'], dest="schedule", default='rollback')
+    parser.add_argument('--warmup', help="number of linear warmup batches of the learning rate schedule", type=int, dest="warmup_batches", default=0)
+    parser.add_argument('--validation-size', help="number of training images held out for validation (chooses the best network only with a schedule)", type=int, dest="validation_size", default=0)
+    parser.add_argument('--validation-interval', help="number of batches between validations (validates at the end of each epoch otherwise)", type=int, dest="validation_interval", default=None)
+    parser.add_argument('--early-stopping', help="stop after this many validations without improvement", type=int, dest="early_stopping_patience", default=None)
+    parser.add_argument('--kmeans-init', help="initialize the filters of a new trainer by spherical k-means on sampled training patches", action='store_true', dest='kmeans_init')
+    parser.add_argument('--patch-cache', help="cache the first layer's patches of the training images in at most this many MiB", type=float, dest="patch_cache_mb", default=None)
+    parser.add_argument('--patch-cache-file', help="cache the first layer's patches of all training images in memory-mapped files with this prefix", type=str, dest="patch_cache_file", default=None)
+    parser.add_argument('--sampling', help="sampling of the training images of a new trainer ('loss' prefers images with a high loss, with unbiased importance weights)",
+                        choices=['uniform', 'loss'], dest="sampling", default='uniform')
+    parser.add_argument('--uniform-portion', help="portion of uniform sampling mixed into the loss-based sampling", type=float, dest="uniform_portion", default=0.5)
+    parser.add_argument('--augment', help="augment the training images of a new trainer by random shifts (by up to 2 pixels) and rotations (by up to 10 degrees)", action='store_true', dest='augment')
+    parser.add_argument('--elastic', help="also distort the augmented images elastically with this strength (e.g. 8)", type=float, dest="elastic_alpha", default=0)
+    parser.add_argument('--workers', help="comma-separated host:port of distributed.py workers that compute the gradients of the batches", type=str, dest="workers", default=None)
+    parser.add_argument('--solve-head', help="alternate SGD on the filters with an exact fit of the output layer on the features of this many training images (<= 0 for all)", 
+                        type=int, dest="solve_head_images", default=None)
+    parser.add_argument('--cache-budget', help="keep the arrays cached by the forward pass for the backward pass in at most this many MiB and recompute the others", 
+                        type=float, dest="cache_budget_mb", default=None)
     args = parser.parse_args()
 
     filepath = os.path.realpath(args.filepath)
@@ -79,6 +190,9 @@ def main():
     num_tests = args.num_tests if args.num_tests > 0 else math.inf
     epochs_btw_tests = args.epochs_btw_tests if args.epochs_btw_tests > 0 else math.inf
     initial_test = args.initial_test
+    update_rule = create_update_rule(args.update_rule)
+    learning_rate = args.learning_rate
+    schedule = create_schedule(args.schedule, epochs, args.warmup_batches)
 
     mnist = MNIST(directory=mnist_dir)
 
@@ -91,7 +205,10 @@ def main():
             li.AvgPoolingInfo(pooling_size=(3, 3)),
 
             li.FilterInfo(filter_size=(3, 3), zero_padding='same', out_channels=10, dp_kernel=kernel.RadialBasisFunction(alpha=4))
-        ])
+        ], learning_rate=learning_rate, update_rule=update_rule, schedule=schedule, validation_size=args.validation_size,
+           validation_interval=args.validation_interval, early_stopping_patience=args.early_stopping_patience, kmeans_init=args.kmeans_init,
+           sampler=create_sampler(args.sampling, args.uniform_portion),
+           augmentation=Augmentation(elastic_alpha=args.elastic_alpha) if args.augment else None)
 
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         trainer.save_to_file(filepath)
@@ -99,6 +216,14 @@ def main():
     else:
         trainer = Trainer.load_from_file(filepath, train_images=mnist.train_images, train_labels=mnist.train_labels)
 
+    if args.patch_cache_mb is not None or args.patch_cache_file is not None:
+        trainer.patch_cache = create_patch_cache(trainer, args.patch_cache_mb, args.patch_cache_file)
+
+    if args.cache_budget_mb is not None:
+        trainer.optimizer.network.cache_budget = trainer.best_network.cache_budget = int(args.cache_budget_mb * 2**20)
+
+    coordinator = Coordinator(trainer, parse_addresses(args.workers)) if args.workers is not None else None
+
     if initial_test:
         perform_test(
             trainer=trainer, 
@@ -114,8 +239,13 @@ def main():
         test_labels=mnist.test_labels, 
         epochs=epochs, 
         num_tests=num_tests, 
-        epochs_btw_tests=epochs_btw_tests
+        epochs_btw_tests=epochs_btw_tests,
+        solve_head_images=(args.solve_head_images if args.solve_head_images > 0 else math.inf) if args.solve_head_images is not None else None,
+        coordinator=coordinator
     )
 
+    if coordinator is not None:
+        coordinator.close()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
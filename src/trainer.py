@@ -1,17 +1,41 @@
+import os
 import numpy as np
 from copy import deepcopy
 import pickle
 from optimizer import Optimizer
 from network import Network
+from sampler import UniformSampler
+from augmentation import AugmentedBatches
+from checkpoint import CheckpointWriter, CheckpointReader
 
 class Trainer:
-    def __init__(self, optimizer, learning_rate, regularization_parameter, batch_size, train_images, train_labels):
+    def __init__(self, optimizer, learning_rate, regularization_parameter, batch_size, train_images, train_labels,
+                 schedule = None, validation_size = 0, validation_interval = None, early_stopping = None, patch_cache = None,
+                 sampler = None, augmentation = None):
+        """Without a schedule the learning rate is halved and the best network restored whenever an epoch's average loss 
+        increases. With a schedule the learning rate is updated every batch and no epoch is rolled back; the best network
+        is then chosen by the accuracy on the last validation_size training images (checked every validation_interval 
+        batches and at the end of every epoch), or by the average epoch loss if there is no validation set. Without a 
+        schedule the validation accuracy is only recorded and passed to early_stopping, as the rollback keeps the network
+        with the best epoch loss. An optional PatchCache for the first layer, indexed like train_images, replaces its
+        patch extraction; it is not saved. The sampler chooses the images of every epoch (a uniform permutation by
+        default) and receives their losses. An Augmentation transforms the training images batch by batch in a background
+        thread ahead of training (the patch cache is not used then)."""
+
         self.optimizer = optimizer
         self.learning_rate = learning_rate
+        self.base_learning_rate = learning_rate
         self.regularization_parameter = regularization_parameter
         self.batch_size = batch_size
-        self.train_images = train_images
-        self.train_labels = train_labels
+        self.schedule = schedule
+        self.validation_size = validation_size
+        self.validation_interval = validation_interval
+        self.early_stopping = early_stopping
+        self.patch_cache = patch_cache
+        self.sampler = sampler if sampler is not None else UniformSampler()
+        self.augmentation = augmentation
+        self._augmented_batches = None
+        self.set_training_data(train_images, train_labels)
         self._new_epoch()
 
         self.best_network = deepcopy(self.optimizer.network)
@@ -20,6 +44,10 @@ class Trainer:
         self.average_loss_batch = []
         self.average_loss_epoch = []
         self.learning_rates = []
+
+        self.best_validation_accuracy = -float('inf')
+        self.validation_accuracies = []
+        self.stopped = False
     
     @property
     def batch(self):
@@ -33,27 +61,78 @@ class Trainer:
     def epoch_size(self):
         return len(self.permutation) 
 
+    def set_training_data(self, train_images, train_labels):
+        # Hold out the last validation_size images for validation
+        num_train = len(train_images) - self.validation_size
+        self.train_images = train_images[:num_train]
+        self.train_labels = train_labels[:num_train]
+        self.validation_images = train_images[num_train:]
+        self.validation_labels = train_labels[num_train:]
+
+    def validate(self):
+        """Compute the accuracy of the current network on the validation images"""
+
+        correct_preds = 0
+        for image, label in zip(self.validation_images, self.validation_labels):
+            if np.argmax(self.optimizer.network.forward(image)) == label:
+                correct_preds += 1
+        return correct_preds / len(self.validation_images)
+
     def next_image(self):
         index = self.permutation[self.epoch_counter]
-        self.optimizer.step(self.train_images[index], self.train_labels[index])
+        if self.augmentation is not None:
+            image = self._augmented_images(self.epoch_counter, self.epoch_counter + 1)[0]
+            patches = None
+        else:
+            image = self.train_images[index]
+            patches = self.patch_cache.get(index, image) if self.patch_cache is not None else None
+        weight = self.sample_weights[self.epoch_counter] if self.sample_weights is not None else 1
+        loss = self.optimizer.step(image, self.train_labels[index], patches, weight)
+        self.sampler.report_loss(index, loss)
         self.batch_counter += 1
         self.epoch_counter += 1
 
         self._check_batch_epoch()
 
+    def _augmented_images(self, start, end):
+        # The augmented images of the positions start to end (within one batch) of the permutation
+        batch, offset = divmod(start, self.batch_size)
+        if offset == 0 or self._augmented_batch is None:
+            if self._augmented_batches is None:
+                # Starts at the current batch, e.g. after loading a checkpoint in the middle of an epoch
+                self._augmented_batches = AugmentedBatches(self.augmentation, self.train_images, self.permutation,
+                                                           self.batch_size, self.epoch, batch)
+            self._augmented_batch = self._augmented_batches.get(batch)
+        return self._augmented_batch[offset:offset + end - start]
+
+    def close(self):
+        """Stop the background augmentation of the epoch"""
+        if self._augmented_batches is not None:
+            self._augmented_batches.close()
+        self._augmented_batches = None
+        self._augmented_batch = None
+
     def finish_batch(self):
+        if self.stopped:
+            return
         self.next_image()
         while self.batch_counter > 0:
             self.next_image()    
 
     def finish_epoch(self):
+        if self.stopped:
+            return
         self.next_image()
-        while self.epoch_counter > 0:
+        while self.epoch_counter > 0 and not self.stopped:
             self.next_image()
     
     def _check_batch_epoch(self):
         # Check if enough images have been processed to complete a batch
         if self.batch_counter >= self.batch_size:
+            if self.schedule is not None:
+                self.learning_rate = self.schedule.learning_rate(
+                    self.base_learning_rate, len(self.average_loss_batch), len(self.permutation) // self.batch_size)
+
             loss_batch = self.optimizer.optim(self.learning_rate, self.regularization_parameter)
             self.average_loss_batch.append(loss_batch)
             self.loss_sum += loss_batch
@@ -61,14 +140,24 @@ class Trainer:
             self.optimized_data_counter += self.batch_counter
             self.batch_counter = 0
 
+            end_of_epoch = self.epoch_counter >= len(self.permutation)
+            if len(self.validation_images) > 0 and (end_of_epoch or (
+                    self.validation_interval is not None and len(self.average_loss_batch) % self.validation_interval == 0)):
+                self._check_validation()
+
             # Check if all images in the epoch have been processed
-            if self.epoch_counter >= len(self.permutation):
+            if end_of_epoch:
                 average_loss = self.loss_sum / self.optimized_data_counter
                 self.average_loss_epoch.append(average_loss)
                 self.learning_rates.append(self.learning_rate)
 
+                if self.schedule is not None:
+                    # The schedule owns the learning rate; without a validation set keep the network with the best loss
+                    if len(self.validation_images) == 0 and average_loss < self.bestaverage_loss_epoch:
+                        self.bestaverage_loss_epoch = average_loss
+                        self.best_network = deepcopy(self.optimizer.network)
                 # Check if the current epoch had the best average loss so far
-                if average_loss < self.bestaverage_loss_epoch:
+                elif average_loss < self.bestaverage_loss_epoch:
                     # If the current epoch had the best average loss so far, update the best average loss and copy the network
                     self.bestaverage_loss_epoch = average_loss
                     self.best_network = deepcopy(self.optimizer.network)
@@ -80,11 +169,28 @@ class Trainer:
                 # Reset the counters for the batch and epoch, and start a new epoch
                 self._new_epoch()
 
+    def _check_validation(self):
+        accuracy = self.validate()
+        self.validation_accuracies.append(accuracy)
+
+        if accuracy > self.best_validation_accuracy:
+            self.best_validation_accuracy = accuracy
+            if self.schedule is not None:
+                self.best_network = deepcopy(self.optimizer.network)
+
+        if self.schedule is not None:
+            self.schedule.report_validation(accuracy)
+
+        if self.early_stopping is not None:
+            self.early_stopping.report_validation(accuracy)
+            self.stopped = self.early_stopping.should_stop
+
     def _new_epoch(self):
-        # Shuffle the indices of the training data
-        self.permutation = np.random.permutation(len(self.train_images))
-        # Discard any indices that would result in an incomplete batch
-        self.permutation = self.permutation[:len(self.permutation) - (len(self.permutation) % self.batch_size)]
+        self.close()
+
+        # Sample the indices of the training data, discarding any that would result in an incomplete batch
+        num_samples = len(self.train_images) - (len(self.train_images) % self.batch_size)
+        self.permutation, self.sample_weights = self.sampler.sample(len(self.train_images), num_samples)
 
         # Set counters to 0
         self.epoch_counter = 0
@@ -94,47 +200,154 @@ class Trainer:
 
     def save_to_file(self, file):
         if isinstance(file, str):
-            with open(file, "wb") as f:
-                return self.save_to_file(f)
+            # Write to a temporary file first so that readers never see a partially written file
+            with open(file + '.tmp', "wb") as f:
+                self.save_to_file(f)
+            os.replace(file + '.tmp', file)
+            return
         
-        self.optimizer.save_to_file(file)
-        self.best_network.save_to_file(file)
-
-        pickle.dump(
-            (
-                self.learning_rate,
-                self.regularization_parameter,
-                self.batch_size,
-
-                self.bestaverage_loss_epoch,
-                self.average_loss_batch,
-                self.average_loss_epoch,
-                self.learning_rates,
-
-                self.permutation,
-
-                self.epoch_counter,
-                self.batch_counter,
-                self.loss_sum,
-                self.optimized_data_counter,
-            ),
-            file
-        )
+        writer = CheckpointWriter(file)
+        self.write_checkpoint(writer)
+        writer.close()
+
+    def write_checkpoint(self, writer):
+        """Write the sections of the optimizer, 'best_network', 'trainer', 'sampling' and 'history' to a CheckpointWriter"""
+
+        self.optimizer.write_checkpoint(writer)
+        writer.write_network('best_network', self.best_network)
+        writer.write_object('trainer', (
+            self.learning_rate,
+            self.regularization_parameter,
+            self.batch_size,
+
+            self.base_learning_rate,
+            self.schedule,
+            self.validation_size,
+            self.validation_interval,
+            self.early_stopping,
+            self.stopped,
+
+            self.permutation,
+
+            self.epoch_counter,
+            self.batch_counter,
+            self.loss_sum,
+            self.optimized_data_counter,
+        ))
+        writer.write_object('history', (
+            self.bestaverage_loss_epoch,
+            self.average_loss_batch,
+            self.average_loss_epoch,
+            self.learning_rates,
+            self.best_validation_accuracy,
+            self.validation_accuracies,
+        ))
+        writer.write_object('sampling', (
+            self.sampler,
+            self.sample_weights,
+        ))
+        writer.write_object('augmentation', self.augmentation)
+
+    @staticmethod
+    def load_best_network(file, mmap = True):
+        """Load only the best network of a trainer (or analysis) checkpoint, memory-mapping its parameters if mmap is
+        set and file is a path. Checkpoints of the old chained format are read up to the best network"""
+
+        if isinstance(file, str) and CheckpointReader.is_checkpoint(file):
+            with CheckpointReader(file) as reader:
+                return reader.read_network('best_network', mmap)
+
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                return Trainer.load_best_network(f)
+
+        if CheckpointReader.is_checkpoint(file):
+            return CheckpointReader(file).read_network('best_network')
+
+        Optimizer.skip_in_file(file)
+        return Network.load_from_file(file)
 
     @staticmethod
     def load_from_file(file, train_images, train_labels):
         if isinstance(file, str):
             with open(file, "rb") as f:
                 return Trainer.load_from_file(f, train_images, train_labels)
-        
+
+        if not CheckpointReader.is_checkpoint(file):
+            return Trainer._load_legacy(file, train_images, train_labels)
+
+        return Trainer.read_checkpoint(CheckpointReader(file), train_images, train_labels)
+
+    @staticmethod
+    def read_checkpoint(reader, train_images, train_labels):
+        trainer = Trainer.__new__(Trainer)
+
+        trainer.optimizer = Optimizer.read_checkpoint(reader)
+        trainer.best_network = reader.read_network('best_network')
+        (
+            trainer.learning_rate,
+            trainer.regularization_parameter,
+            trainer.batch_size,
+
+            trainer.base_learning_rate,
+            trainer.schedule,
+            trainer.validation_size,
+            trainer.validation_interval,
+            trainer.early_stopping,
+            trainer.stopped,
+
+            trainer.permutation,
+
+            trainer.epoch_counter,
+            trainer.batch_counter,
+            trainer.loss_sum,
+            trainer.optimized_data_counter,
+        ) = reader.read_object('trainer')
+        (
+            trainer.bestaverage_loss_epoch,
+            trainer.average_loss_batch,
+            trainer.average_loss_epoch,
+            trainer.learning_rates,
+            trainer.best_validation_accuracy,
+            trainer.validation_accuracies,
+        ) = reader.read_object('history')
+
+        if 'sampling' in reader:
+            trainer.sampler, trainer.sample_weights = reader.read_object('sampling')
+        else:
+            trainer.sampler, trainer.sample_weights = UniformSampler(), None
+        trainer.augmentation = reader.read_object('augmentation') if 'augmentation' in reader else None
+        trainer._augmented_batches = trainer._augmented_batch = None
+
+        trainer.patch_cache = None
+        trainer.set_training_data(train_images, train_labels)
+
+        return trainer
+
+    @staticmethod
+    def _load_legacy(file, train_images, train_labels):
+        # Chained pickles of the optimizer, the best network and the trainer's state
         trainer = Trainer.__new__(Trainer)
 
         trainer.optimizer = Optimizer.load_from_file(file)
         trainer.best_network = Network.load_from_file(file)
+        state = pickle.load(file)
+        if len(state) == 12:
+            # Written before schedules and validation, i.e. with the rollback of the learning rate and no validation set
+            state = state[:3] + (state[0], None, 0, None, None, -float('inf'), [], False) + state[3:]
         (
             trainer.learning_rate,
             trainer.regularization_parameter,
             trainer.batch_size,
+
+            trainer.base_learning_rate,
+            trainer.schedule,
+            trainer.validation_size,
+            trainer.validation_interval,
+            trainer.early_stopping,
+            trainer.best_validation_accuracy,
+            trainer.validation_accuracies,
+            trainer.stopped,
         
             trainer.bestaverage_loss_epoch,
             trainer.average_loss_batch,
@@ -147,9 +360,12 @@ class Trainer:
             trainer.batch_counter,
             trainer.loss_sum,
             trainer.optimized_data_counter,
-        ) = pickle.load(file)
+        ) = state
 
-        trainer.train_images = train_images
-        trainer.train_labels = train_labels
+        trainer.sampler, trainer.sample_weights = UniformSampler(), None
+        trainer.augmentation = None
+        trainer._augmented_batches = trainer._augmented_batch = None
+        trainer.patch_cache = None
+        trainer.set_training_data(train_images, train_labels)
 
-        return trainer
\ No newline at end of file
+        return trainer
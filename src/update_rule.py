@@ -0,0 +1,124 @@
+import numpy as np
+
+class UpdateRule:
+    """Turns an averaged gradient into the descent that is subtracted from a parameter.
+
+    Parameters are identified by their index in Network.compute_gradients' result. State buffers are allocated
+    on first use and then updated in place, and the gradient buffer passed in may be overwritten and returned."""
+
+    def descent(self, index, gradient, learning_rate):
+        raise NotImplementedError()
+
+    def reset(self):
+        pass
+
+class GradientDescent(UpdateRule):
+    def descent(self, index, gradient, learning_rate):
+        # lr * g
+        return np.multiply(gradient, learning_rate, out=gradient)
+
+class Momentum(UpdateRule):
+    def __init__(self, momentum=0.9, nesterov=False):
+        self.momentum = momentum
+        self.nesterov = nesterov
+        self.reset()
+
+    def descent(self, index, gradient, learning_rate):
+        velocity = self._velocity.get(index)
+        if velocity is None:
+            velocity = self._velocity[index] = np.zeros_like(gradient)
+
+        # v = mu v + g
+        velocity *= self.momentum
+        velocity += gradient
+
+        if self.nesterov:
+            # lr * (g + mu v)
+            descent = np.multiply(velocity, self.momentum, out=self._scratch(index, gradient))
+            descent += gradient
+            return np.multiply(descent, learning_rate, out=gradient)
+
+        # lr * v
+        return np.multiply(velocity, learning_rate, out=gradient)
+
+    def reset(self):
+        self._velocity = {}
+        self._scratch_buffers = {}
+
+    def _scratch(self, index, gradient):
+        buffer = self._scratch_buffers.get(index)
+        if buffer is None:
+            buffer = self._scratch_buffers[index] = np.empty_like(gradient)
+        return buffer
+
+class RMSProp(UpdateRule):
+    def __init__(self, decay=0.9, epsilon=1e-8):
+        self.decay = decay
+        self.epsilon = epsilon
+        self.reset()
+
+    def descent(self, index, gradient, learning_rate):
+        mean_square = self._mean_square.get(index)
+        if mean_square is None:
+            mean_square = self._mean_square[index] = np.zeros_like(gradient)
+            self._denominator[index] = np.empty_like(gradient)
+        denominator = self._denominator[index]
+
+        # r = rho r + (1 - rho) g^2
+        mean_square *= self.decay
+        np.multiply(gradient, gradient, out=denominator)
+        denominator *= 1 - self.decay
+        mean_square += denominator
+
+        # lr * g / (sqrt(r) + eps)
+        np.sqrt(mean_square, out=denominator)
+        denominator += self.epsilon
+        np.divide(gradient, denominator, out=gradient)
+        return np.multiply(gradient, learning_rate, out=gradient)
+
+    def reset(self):
+        self._mean_square = {}
+        self._denominator = {}
+
+class Adam(UpdateRule):
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.reset()
+
+    def descent(self, index, gradient, learning_rate):
+        first_moment = self._first_moment.get(index)
+        if first_moment is None:
+            first_moment = self._first_moment[index] = np.zeros_like(gradient)
+            self._second_moment[index] = np.zeros_like(gradient)
+            self._denominator[index] = np.empty_like(gradient)
+            self._steps[index] = 0
+        second_moment = self._second_moment[index]
+        denominator = self._denominator[index]
+        self._steps[index] += 1
+        t = self._steps[index]
+
+        # m = b1 m + (1 - b1) g
+        first_moment *= self.beta1
+        np.multiply(gradient, 1 - self.beta1, out=denominator)
+        first_moment += denominator
+
+        # v = b2 v + (1 - b2) g^2
+        second_moment *= self.beta2
+        np.multiply(gradient, gradient, out=denominator)
+        denominator *= 1 - self.beta2
+        second_moment += denominator
+
+        # lr * m_hat / (sqrt(v_hat) + eps) with the bias corrections folded into the step size
+        step_size = learning_rate * np.sqrt(1 - self.beta2 ** t) / (1 - self.beta1 ** t)
+        np.sqrt(second_moment, out=denominator)
+        denominator += self.epsilon * np.sqrt(1 - self.beta2 ** t)
+        np.divide(first_moment, denominator, out=gradient)
+        return np.multiply(gradient, step_size, out=gradient)
+
+    def reset(self):
+        self._first_moment = {}
+        self._second_moment = {}
+        self._denominator = {}
+        self._steps = {}
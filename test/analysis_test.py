@@ -0,0 +1,109 @@
+import unittest
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+import src.analysis as analysis_module
+from src.analysis import Analysis
+
+class AnalysisTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.images = np.random.rand(16, 16)
+        self.labels = np.random.randint(0, 3, 16)
+        network = Network(input_size=(4, 4), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        trainer = Trainer(Optimizer(network, SquareHingeLoss(margin=0.2)), learning_rate=1, regularization_parameter=0.01,
+                          batch_size=4, train_images=self.images, train_labels=self.labels)
+        self.analysis = Analysis(trainer, self.images, self.labels, num_labels=3)
+
+    def count_forwards(self, network):
+        counter = [0]
+        forward = network.forward
+        def counting_forward(x, *args):
+            counter[0] += 1
+            return forward(x, *args)
+        network.forward = counting_forward
+        return counter
+
+    def test_unchanged_best_network_is_not_retested(self):
+        counter = self.count_forwards(self.analysis.trainer.best_network)
+
+        # The best network is only replaced at the end of the epoch, i.e. in the last of the 4 batches
+        self.analysis.perform_analysis(epochs=1, batches_per_test=1, num_tests_batch=8, num_tests_epoch=8)
+
+        results = self.analysis.test_results_batch
+        self.assertEqual(len(results), 5)
+        self.assertEqual(counter[0], 8)
+        self.assertTrue(all(result is results[1] for result in results[1:4]))
+        self.assertIs(self.analysis.test_results_epoch[-1], results[4])
+
+    def test_live_network_is_retested_after_every_batch(self):
+        network = self.analysis.trainer.optimizer.network
+        version = network.version
+
+        self.analysis.perform_analysis(epochs=1, batches_per_test=1, num_tests_batch=8, num_tests_epoch=8, live_network=True)
+
+        self.assertNotEqual(network.version, version)
+        results = self.analysis.test_results_batch[1:]
+        self.assertEqual(len(set(id(result) for result in results)), 4)
+        # The epoch test reuses the test of the last batch
+        self.assertIs(self.analysis.test_results_epoch[-1], results[-1])
+
+    def test_every_prefix_of_the_test_order_is_stratified(self):
+        labels = np.repeat([0, 1, 2], [500, 300, 200])
+        np.random.shuffle(labels)
+        analysis = Analysis(self.analysis.trainer, np.random.rand(1000, 4, 4), labels, num_labels=3)
+
+        order = analysis.test_order()
+        self.assertEqual(sorted(order), list(range(1000)))
+        for m in [10, 55, 100, 333, 1000]:
+            counts = np.bincount(labels[order[:m]], minlength=3)
+            np.testing.assert_allclose(counts, m * np.array([0.5, 0.3, 0.2]), atol=1)
+
+    def test_adaptive_test_stops_at_the_confidence_width(self):
+        class PerfectNetwork:
+            version = 'perfect'
+            def forward(self, x):
+                return np.eye(3)[int(x[0, 0])]
+
+        labels = np.random.randint(0, 3, 1000)
+        images = np.repeat(labels, 16).reshape(1000, 4, 4)
+        analysis = Analysis(self.analysis.trainer, images, labels, num_labels=3)
+
+        result = analysis.perform_test(network=PerfectNetwork(), confidence_width=0.05)
+        self.assertEqual(result.tests_count, Analysis.MIN_ADAPTIVE_TESTS)
+        self.assertLessEqual(result.confidence_width, 0.05)
+
+        result = analysis.perform_test(network=PerfectNetwork(), confidence_width=0.01)
+        self.assertEqual(result.tests_count % Analysis.ADAPTIVE_TEST_STEP, 0)
+        self.assertLessEqual(result.confidence_width, 0.01)
+        # The previous check was still too wide
+        previous_count = result.tests_count - Analysis.ADAPTIVE_TEST_STEP
+        low, high = analysis_module.TestResult.wilson_interval(previous_count, previous_count)
+        self.assertGreater(high - low, 0.01)
+
+    def test_wilson_interval(self):
+        low, high = analysis_module.TestResult.wilson_interval(50, 100)
+        self.assertAlmostEqual((low + high) / 2, 0.5)
+        self.assertAlmostEqual(high - low, 0.1923, places=4)
+
+        low, high = analysis_module.TestResult.wilson_interval(100, 100)
+        self.assertLess(low, 1)
+        self.assertAlmostEqual(high, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import io
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.augmentation import Augmentation, AugmentedBatches
+
+class FixedRandomState:
+    """Returns the given values (as arrays of the requested size) for the consecutive calls of uniform"""
+
+    def __init__(self, *values):
+        self.values = list(values)
+
+    def uniform(self, low, high, size):
+        return np.broadcast_to(self.values.pop(0), size)
+
+class AugmentationTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.images = np.random.rand(5, 2 * 6 * 7)
+
+    def test_shift_and_rotation(self):
+        augmentation = Augmentation(image_size=(6, 7), in_channels=2)
+        images = self.images.reshape(5, 2, 6, 7)
+
+        # The output pixel (y, x) shows the input pixel (y - 1, x + 2)
+        shifted = augmentation.transform(self.images, FixedRandomState(0, [[1], [-2]])).reshape(5, 2, 6, 7)
+        np.testing.assert_allclose(shifted[:, :, 1:, :5], images[:, :, :5, 2:], atol=1e-12)
+        np.testing.assert_array_equal(shifted[:, :, 0], 0)
+        np.testing.assert_array_equal(shifted[:, :, :, 5:], 0)
+
+        augmentation = Augmentation(image_size=(6, 6), in_channels=1)
+        images = np.random.rand(3, 36)
+        rotated = augmentation.transform(images, FixedRandomState(180, 0))
+        np.testing.assert_allclose(rotated, images[:, ::-1], atol=1e-12)
+
+    def test_elastic_distortion_is_smooth_and_deterministic(self):
+        augmentation = Augmentation(image_size=(6, 7), in_channels=2, elastic_alpha=2, seed=4)
+
+        first = augmentation.transform(self.images, augmentation.random_state(epoch=1, batch=3))
+        second = augmentation.transform(self.images, augmentation.random_state(epoch=1, batch=3))
+        other = augmentation.transform(self.images, augmentation.random_state(epoch=1, batch=4))
+
+        np.testing.assert_array_equal(first, second)
+        self.assertFalse(np.allclose(first, other))
+        self.assertEqual(first.shape, self.images.shape)
+
+    def test_augmented_batches_are_prefetched_in_order(self):
+        augmentation = Augmentation(image_size=(6, 7), in_channels=2)
+        permutation = np.array([4, 2, 0, 1])
+        batches = AugmentedBatches(augmentation, self.images, permutation, batch_size=2, epoch=1, start_batch=1)
+
+        np.testing.assert_array_equal(batches.get(1), augmentation.transform(self.images[[0, 1]], augmentation.random_state(1, 1)))
+        with self.assertRaises(ValueError):
+            batches.get(0)
+        batches.close()
+
+    def test_trainer_resumes_augmentation(self):
+        labels = np.random.randint(0, 3, 24)
+        images = np.random.rand(24, 16)
+        network = Network(input_size=(4, 4), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        trainer = Trainer(Optimizer(network, SquareHingeLoss(margin=0.2)), learning_rate=1, regularization_parameter=0.01,
+                          batch_size=4, train_images=images, train_labels=labels,
+                          augmentation=Augmentation(image_size=(4, 4), max_shift=1, elastic_alpha=1))
+
+        trainer.finish_batch()
+        trainer.finish_batch()
+        trainer.next_image()
+        trainer.next_image()
+        file = io.BytesIO()
+        trainer.save_to_file(file)
+
+        for _ in range(3):
+            trainer.finish_batch()
+        trainer.close()
+
+        file.seek(0)
+        loaded = Trainer.load_from_file(file, images, labels)
+        for _ in range(3):
+            loaded.finish_batch()
+        loaded.close()
+
+        self.assertEqual(len(loaded.average_loss_batch), 5)
+        np.testing.assert_allclose(loaded.average_loss_batch, trainer.average_loss_batch, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import io
+import pickle
+import tempfile
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.analysis import Analysis
+from src.update_rule import Adam
+from src.checkpoint import CheckpointWriter, CheckpointReader
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.images = np.random.rand(16, 36)
+        self.labels = np.random.randint(0, 3, 16)
+        network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        self.trainer = Trainer(Optimizer(network, SquareHingeLoss(margin=0.2), Adam()), learning_rate=0.1,
+                               regularization_parameter=0.01, batch_size=4, train_images=self.images, train_labels=self.labels)
+        self.trainer.finish_epoch()
+
+    def test_sections(self):
+        file = io.BytesIO()
+        writer = CheckpointWriter(file)
+        writer.write_object('object', {'a': 1})
+        writer.write_array('array', np.arange(6.).reshape(2, 3))
+        writer.write_array('empty', np.zeros((0, 3)))
+        writer.close()
+
+        file.seek(0)
+        reader = CheckpointReader(file)
+        self.assertEqual(reader.read_object('object'), {'a': 1})
+        self.assertTrue(np.array_equal(reader.read_array('array'), np.arange(6.).reshape(2, 3)))
+        self.assertEqual(reader.read_array('empty').shape, (0, 3))
+        self.assertEqual(reader.table['array'][1] % 64, 0)
+
+    def test_trainer_round_trip_continues_identically(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'trainer')
+            self.trainer.save_to_file(filepath)
+            loaded = Trainer.load_from_file(filepath, self.images, self.labels)
+        self.assertEqual(loaded.optimizer.total_steps, self.trainer.optimizer.total_steps)
+
+        np.random.seed(1)
+        self.trainer.finish_epoch()
+        np.random.seed(1)
+        loaded.finish_epoch()
+
+        self.assertEqual(loaded.average_loss_batch, self.trainer.average_loss_batch)
+        self.assertTrue(np.allclose(loaded.optimizer.network.output_weights, self.trainer.optimizer.network.output_weights))
+        self.assertTrue(np.allclose(loaded.optimizer.network.layers[0].filter_matrix, self.trainer.optimizer.network.layers[0].filter_matrix))
+
+    def test_load_best_network_is_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'analysis')
+            analysis = Analysis(self.trainer, self.images, self.labels, num_labels=3)
+            analysis.save_to_file(filepath)
+
+            network = Trainer.load_best_network(filepath)
+            self.assertIsInstance(network.output_weights, np.memmap)
+            self.assertTrue(np.allclose(network.predict(self.images), self.trainer.best_network.predict(self.images)))
+            del network
+
+            loaded = Analysis.load_from_file(filepath, self.images, self.labels, self.images, self.labels)
+            self.assertEqual(len(loaded.test_results_epoch), 1)
+
+    def test_legacy_checkpoint(self):
+        # The chained pickle format written before the indexed checkpoints
+        file = io.BytesIO()
+        trainer = self.trainer
+        trainer.optimizer.save_to_file(file)
+        trainer.best_network.save_to_file(file)
+        pickle.dump((trainer.learning_rate, trainer.regularization_parameter, trainer.batch_size, trainer.base_learning_rate,
+                     trainer.schedule, trainer.validation_size, trainer.validation_interval, trainer.early_stopping,
+                     trainer.best_validation_accuracy, trainer.validation_accuracies, trainer.stopped,
+                     trainer.bestaverage_loss_epoch, trainer.average_loss_batch, trainer.average_loss_epoch,
+                     trainer.learning_rates, trainer.permutation, trainer.epoch_counter, trainer.batch_counter,
+                     trainer.loss_sum, trainer.optimized_data_counter), file)
+
+        file.seek(0)
+        loaded = Trainer.load_from_file(file, self.images, self.labels)
+        file.seek(0)
+        best_network = Trainer.load_best_network(file)
+
+        self.assertEqual(loaded.average_loss_batch, trainer.average_loss_batch)
+        self.assertTrue(np.allclose(best_network.output_weights, trainer.best_network.output_weights))
+
+    @staticmethod
+    def _write_baseline_network(network, file):
+        pickle.dump(len(network.layers), file)
+        for layer in network.layers:
+            file.write(f"{type(layer).__name__}\n".encode())
+            if hasattr(layer, 'filter_matrix'):
+                pickle.dump((layer.input_size, layer.in_channels, layer.filter_size, layer.filter_matrix, layer.dp_kernel,
+                             layer.zero_padding) + (None,) * 6, file)
+            else:
+                pickle.dump((layer.input_size, layer.in_channels, layer.pooling_size, None), file)
+        pickle.dump((network.output_weights, None, None), file)
+
+    def test_baseline_analysis_file(self):
+        # The chained pickle format of the first release, without update rules, strides, schedules and elapsed time
+        trainer = Trainer(Optimizer(self.trainer.optimizer.network, SquareHingeLoss(margin=0.2)), learning_rate=0.1,
+                          regularization_parameter=0.01, batch_size=4, train_images=self.images, train_labels=self.labels)
+        trainer.finish_epoch()
+        analysis = Analysis(trainer, self.images, self.labels, num_labels=3)
+
+        file = io.BytesIO()
+        self._write_baseline_network(trainer.optimizer.network, file)
+        pickle.dump((trainer.optimizer.loss_function, 0, None, 0), file)
+        self._write_baseline_network(trainer.best_network, file)
+        pickle.dump((trainer.learning_rate, trainer.regularization_parameter, trainer.batch_size,
+                     trainer.bestaverage_loss_epoch, trainer.average_loss_batch, trainer.average_loss_epoch,
+                     trainer.learning_rates, trainer.permutation, trainer.epoch_counter, trainer.batch_counter,
+                     trainer.loss_sum, trainer.optimized_data_counter), file)
+        pickle.dump((analysis.num_labels, analysis.test_results_epoch, analysis.test_results_batch), file)
+
+        file.seek(0)
+        loaded = Analysis.load_from_file(file, self.images, self.labels, self.images, self.labels)
+        self.assertEqual(loaded.trainer.average_loss_batch, trainer.average_loss_batch)
+        self.assertIsNone(loaded.trainer.schedule)
+        self.assertTrue(np.allclose(loaded.trainer.best_network.predict(self.images), trainer.best_network.predict(self.images)))
+
+        np.random.seed(1)
+        trainer.finish_epoch()
+        np.random.seed(1)
+        loaded.trainer.finish_epoch()
+        self.assertEqual(loaded.trainer.average_loss_batch, trainer.average_loss_batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import socket
+import json
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.update_rule import Momentum
+from src.sampler import LossImportanceSampler
+from src.augmentation import Augmentation
+from src.distributed import Coordinator, send_message, receive_message, describe, build, start_local_workers
+
+class DistributedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(0)
+        cls.images = np.random.rand(24, 36)
+        cls.labels = np.random.randint(0, 3, 24)
+        cls.processes, cls.addresses = start_local_workers(3, cls.images, cls.labels)
+
+    @classmethod
+    def tearDownClass(cls):
+        for process in cls.processes:
+            process.kill()
+            process.join()
+
+    def create_trainer(self, **kwargs):
+        np.random.seed(1)
+        network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        optimizer = Optimizer(network, SquareHingeLoss(margin=0.2), Momentum(momentum=0.9))
+        return Trainer(optimizer, learning_rate=1, regularization_parameter=0.01, batch_size=8,
+                       train_images=self.images, train_labels=self.labels, **kwargs)
+
+    def assert_trainers_match(self, trainer, distributed_trainer):
+        np.testing.assert_allclose(distributed_trainer.average_loss_batch, trainer.average_loss_batch, rtol=1e-10)
+        np.testing.assert_allclose(distributed_trainer.average_loss_epoch, trainer.average_loss_epoch, rtol=1e-10)
+        self.assertEqual(distributed_trainer.learning_rates, trainer.learning_rates)
+        for (_, _, expected), (_, _, actual) in zip(trainer.optimizer.network.get_parameters(),
+                                                    distributed_trainer.optimizer.network.get_parameters()):
+            np.testing.assert_allclose(actual, expected, rtol=1e-8, atol=1e-12)
+
+    def test_messages_keep_arrays(self):
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            arrays = [np.random.rand(3, 4), np.arange(5), np.zeros((0, 2))]
+            send_message(sender, {'type': 'test', 'value': 1}, arrays)
+            header, received = receive_message(receiver)
+
+            self.assertEqual(header, {'type': 'test', 'value': 1})
+            for array, received_array in zip(arrays, received):
+                np.testing.assert_array_equal(received_array, array)
+                self.assertEqual(received_array.dtype, array.dtype)
+
+            sender.close()
+            self.assertIsNone(receive_message(receiver))
+
+    def test_setup_description(self):
+        trainer = self.create_trainer()
+        network = trainer.optimizer.network
+        arrays = []
+        description = describe((network.structure(), trainer.optimizer.loss_function), arrays)
+        built_structure, loss_function = build(json.loads(json.dumps(description)), arrays)
+        built_structure.set_parameters(network.get_parameters())
+
+        image = np.random.rand(36)
+        np.testing.assert_allclose(built_structure.forward(image), network.forward(image))
+        self.assertEqual(built_structure.layers[0].filter_size, (3, 3))
+        self.assertEqual(loss_function.margin, 0.2)
+
+        with self.assertRaises(ValueError):
+            build({'class': 'Popen', 'attributes': {}}, [])
+
+    def test_distributed_training_matches_single_process(self):
+        trainer = self.create_trainer()
+        distributed_trainer = self.create_trainer()
+        state = np.random.get_state()
+
+        for _ in range(3):
+            trainer.finish_epoch()
+        np.random.set_state(state)
+        with Coordinator(distributed_trainer, self.addresses) as coordinator:
+            for _ in range(3):
+                coordinator.finish_epoch()
+
+        self.assertEqual(len(trainer.average_loss_epoch), 3)
+        self.assert_trainers_match(trainer, distributed_trainer)
+
+    def test_distributed_importance_sampling(self):
+        trainer = self.create_trainer(sampler=LossImportanceSampler())
+        distributed_trainer = self.create_trainer(sampler=LossImportanceSampler())
+        state = np.random.get_state()
+
+        np.random.set_state(state)
+        trainer.finish_epoch()
+        trainer.finish_epoch()
+        np.random.set_state(state)
+        with Coordinator(distributed_trainer, self.addresses[:2]) as coordinator:
+            coordinator.finish_epoch()
+            coordinator.finish_epoch()
+
+        np.testing.assert_allclose(distributed_trainer.sampler.losses, trainer.sampler.losses, rtol=1e-10)
+        self.assert_trainers_match(trainer, distributed_trainer)
+
+    def test_distributed_augmentation(self):
+        trainer = self.create_trainer(augmentation=Augmentation(image_size=(6, 6), max_shift=1, elastic_alpha=1))
+        distributed_trainer = self.create_trainer(augmentation=Augmentation(image_size=(6, 6), max_shift=1, elastic_alpha=1))
+        state = np.random.get_state()
+
+        trainer.finish_epoch()
+        trainer.finish_epoch()
+        np.random.set_state(state)
+        with Coordinator(distributed_trainer, self.addresses) as coordinator:
+            coordinator.finish_epoch()
+            coordinator.finish_epoch()
+        trainer.close()
+        distributed_trainer.close()
+
+        self.assert_trainers_match(trainer, distributed_trainer)
+
+
+if __name__ == '__main__':
+    unittest.main()
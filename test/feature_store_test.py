@@ -0,0 +1,79 @@
+import unittest
+import tempfile
+from copy import deepcopy
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss, MeanSquaredError
+from src.network import Network
+from src.optimizer import Optimizer
+from src.feature_store import FeatureStore, train_output_layer
+
+class FeatureStoreTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.images = np.random.rand(10, 36)
+        self.labels = np.random.randint(0, 3, 10)
+        self.network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+        ], output_nodes=3)
+
+    def test_batch_loss_matches_single_loss(self):
+        predicted = np.random.rand(5, 4)
+        expected = np.array([0, 3, 1, 1, 2])
+        for loss_function, targets in [(SquareHingeLoss(margin=0.2), expected), (MeanSquaredError(), np.eye(4)[expected])]:
+            batch_loss = loss_function.batch_loss(predicted, targets)
+            batch_gradient = loss_function.batch_gradient(predicted, targets)
+            for j in range(5):
+                self.assertAlmostEqual(batch_loss[j], loss_function.loss(predicted[j], targets[j]))
+                self.assertTrue(np.allclose(batch_gradient[j], loss_function.gradient(predicted[j], targets[j])))
+
+    def test_extract_and_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = FeatureStore.extract(self.network, self.images, self.labels, directory, chunk_size=4, dtype=np.float64)
+
+            self.assertEqual(store.features.shape, (10, 4, 9))
+            self.assertTrue(np.allclose(store.predict(self.network.output_weights)[3], self.network.forward(self.images[3])))
+
+            # A finished extraction is not repeated for the same layers
+            features_mtime = os.path.getmtime(os.path.join(directory, 'features.npy'))
+            del store
+            store = FeatureStore.extract(deepcopy(self.network), self.images, self.labels, directory, chunk_size=4, dtype=np.float64)
+            self.assertEqual(os.path.getmtime(os.path.join(directory, 'features.npy')), features_mtime)
+
+            # but it is after the filters changed
+            network = deepcopy(self.network)
+            network.layers[0].filter_matrix = np.eye(9, 4)
+            del store
+            store = FeatureStore.extract(network, self.images, self.labels, directory, chunk_size=4, dtype=np.float64)
+            self.assertTrue(np.allclose(store.predict(network.output_weights)[3], network.forward(self.images[3])))
+            self.assertFalse(np.allclose(store.predict(network.output_weights)[3], self.network.forward(self.images[3])))
+            del store
+
+    def test_batch_matches_optimizer(self):
+        loss_function = SquareHingeLoss(margin=0.2)
+        optimizer = Optimizer(deepcopy(self.network), loss_function)
+        for image, label in zip(self.images, self.labels):
+            optimizer.step(image, label)
+        optimizer.optim(learning_rate=0.5, regularization_parameter=0.1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = FeatureStore.extract(self.network, self.images, self.labels, directory, dtype=np.float64)
+            train_output_layer(self.network, store, loss_function, learning_rate=0.5, regularization_parameter=0.1,
+                               batch_size=10, epochs=1)
+            del store
+
+        self.assertTrue(np.allclose(self.network.output_weights, optimizer.network.output_weights))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.network import Network
+from src.filter_initialization import spherical_kmeans, initialize_filters_kmeans
+
+class FilterInitializationTest(unittest.TestCase):
+    def test_spherical_kmeans_finds_cluster_directions(self):
+        rng = np.random.default_rng(0)
+        directions = np.linalg.qr(rng.standard_normal((6, 3)))[0]
+        patches = np.repeat(directions, 200, axis=1) + 0.05 * rng.standard_normal((6, 600))
+        patches /= np.linalg.norm(patches, axis=0)
+
+        centroids = spherical_kmeans(patches, 3, iterations=50, batch_size=100, rng=rng)
+
+        self.assertTrue(np.allclose(np.linalg.norm(centroids, axis=0), 1))
+        # Every direction is matched by one centroid
+        self.assertTrue((np.max(directions.T @ centroids, axis=1) > 0.99).all())
+
+    def test_initialize_filters_kmeans(self):
+        network = Network(input_size=(8, 8), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        images = np.random.rand(30, 64)
+        previous_filters = [network.layers[0].filter_matrix.copy(), network.layers[2].filter_matrix.copy()]
+
+        initialize_filters_kmeans(network, images, num_images=20, patches_per_image=5, iterations=10, seed=0)
+
+        for layer, previous in zip([network.layers[0], network.layers[2]], previous_filters):
+            self.assertEqual(layer.filter_matrix.shape, previous.shape)
+            self.assertTrue(np.allclose(np.linalg.norm(layer.filter_matrix, axis=0), 1))
+            self.assertFalse(np.allclose(layer.filter_matrix, previous))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import io
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.gaussian_pooling_layer import GaussianPoolingLayer
+
+class GaussianPoolingLayerTest(unittest.TestCase):
+    def test_forward_matches_2d_gaussian(self):
+        pl = GaussianPoolingLayer(input_size=(7, 6), in_channels=2, subsampling=(2, 3))
+        U = np.random.rand(2, 7 * 6)
+        pooled = pl.forward(U)
+
+        # Direct evaluation of the 2D Gaussian window around every subsampled position
+        w_x, w_y = pl._weights
+        r_x, r_y = len(w_x) // 2, len(w_y) // 2
+        U_3d = np.pad(U.reshape(2, 7, 6), ((0, 0), (r_x, r_x), (r_y, r_y)))
+        expected = np.zeros((2, pl.output_size[0], pl.output_size[1]))
+        for i in range(pl.output_size[0]):
+            for j in range(pl.output_size[1]):
+                window = U_3d[:, i * 2 : i * 2 + len(w_x), j * 3 : j * 3 + len(w_y)]
+                expected[:, i, j] = (window * np.outer(w_x, w_y)).sum(axis=(1, 2))
+
+        self.assertEqual(pl.output_size, (4, 2))
+        self.assertTrue(np.allclose(pooled, expected.reshape(2, -1)))
+
+    def test_forward_keeps_constant_interior(self):
+        pl = GaussianPoolingLayer(input_size=(12, 12), in_channels=1, subsampling=(2, 2))
+        pooled = pl.forward(np.full((1, 144), 3.)).reshape(6, 6)
+
+        self.assertTrue(np.allclose(pooled[2:4, 2:4], 3))
+
+    def test_backward_is_adjoint(self):
+        for subsampling, sigma in [((2, 2), None), ((3, 1), None), ((2, 3), (1.5, 0.5))]:
+            pl = GaussianPoolingLayer(input_size=(8, 7), in_channels=2, subsampling=subsampling, sigma=sigma)
+            x = np.random.rand(2, 8 * 7)
+            y = np.random.rand(2, pl.output_size[0] * pl.output_size[1])
+
+            # <P(x), y> = <x, P_adj(y)>
+            self.assertAlmostEqual((pl.forward(x) * y).sum(), (x * pl.backward(y)).sum())
+
+    def test_save_and_load(self):
+        pl = GaussianPoolingLayer(input_size=(8, 7), in_channels=2, subsampling=(2, 2))
+        file = io.BytesIO()
+        pl.save_to_file(file)
+        file.seek(0)
+        loaded = GaussianPoolingLayer.load_from_file(file)
+
+        self.assertEqual(loaded.output_size, pl.output_size)
+        self.assertEqual(loaded.sigma, pl.sigma)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from copy import deepcopy
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.hogwild import train_hogwild, train_synchronous, loss_curve
+
+class HogwildTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        self.images = np.random.rand(48, 36)
+        self.labels = np.random.randint(0, 3, 48)
+        self.loss_function = SquareHingeLoss(margin=0.2)
+
+    def test_single_worker_is_minibatch_sgd(self):
+        network = deepcopy(self.network)
+        losses = train_hogwild(network, self.loss_function, 0.1, 0.01, 8, self.images, self.labels, epochs=2, processes=1, seed=3)
+
+        optimizer = Optimizer(deepcopy(self.network), self.loss_function)
+        expected_losses = []
+        for epoch in range(2):
+            permutation = np.random.RandomState(3 + epoch).permutation(48)
+            for start in range(0, 48, 8):
+                for index in permutation[start:start + 8]:
+                    optimizer.step(self.images[index], self.labels[index])
+                expected_losses.append(optimizer.optim(0.1, 0.01))
+
+        np.testing.assert_allclose([loss for _, loss in losses], expected_losses, rtol=1e-10)
+        for (_, _, expected), (_, _, actual) in zip(optimizer.network.get_parameters(), network.get_parameters()):
+            np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-14)
+
+    def test_workers_share_the_parameters(self):
+        network = deepcopy(self.network)
+        # A small learning rate, as larger ones can diverge with the stale gradients of some interleavings
+        losses = train_hogwild(network, self.loss_function, 0.01, 0.01, 4, self.images, self.labels, epochs=3, processes=3)
+
+        # Every worker trains on 16 images per epoch
+        self.assertEqual(len(losses), 3 * 3 * 4)
+        self.assertEqual([t for t, _ in losses], sorted(t for t, _ in losses))
+        self.assertLess(np.mean([loss for _, loss in losses[-6:]]), np.mean([loss for _, loss in losses[:6]]))
+
+        self.assertFalse(np.allclose(network.output_weights, self.network.output_weights))
+        np.testing.assert_allclose(np.linalg.norm(network.layers[0].filter_matrix, axis=0), 1, atol=1e-6)
+
+    def test_loss_curve(self):
+        trainer = Trainer(Optimizer(deepcopy(self.network), self.loss_function), learning_rate=0.1, regularization_parameter=0.01,
+                          batch_size=8, train_images=self.images, train_labels=self.labels)
+        losses = train_synchronous(trainer, epochs=2)
+        self.assertEqual(len(losses), 12)
+
+        curve = loss_curve([(0.5, 1.0), (1.5, 3.0), (1.7, 5.0), (3.2, 2.0)], interval=1)
+        self.assertEqual(curve, [(1, 1.0), (2, 4.0), (4, 2.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import io
+import tempfile
+import threading
+import time
+from copy import deepcopy
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.network import Network
+from src.loss_function import SquareHingeLoss
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.inference_server import InferenceServer, SharedNetwork, CheckpointWatcher, request_predictions, load_test
+
+class InferenceServerTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        self.images = np.random.rand(20, 36)
+
+    def test_shared_network_matches_network(self):
+        shared_network = SharedNetwork(self.network)
+        network, shm = SharedNetwork.attach(shared_network.descriptor)
+
+        self.assertTrue(np.allclose(network.predict(self.images), self.network.predict(self.images)))
+
+        del network
+        shm.close()
+        shared_network.close()
+
+    def test_server_batches_concurrent_requests(self):
+        expected = self.network.predict(self.images)
+
+        with InferenceServer(self.network, processes=2, max_batch_size=8, max_wait=0.05) as server:
+            labels, scores = request_predictions(server.address, self.images[:3])
+            predictions, client_stats = load_test(server.address, self.images, num_requests=40, concurrency=8)
+            stats = server.stats.summary()
+
+        self.assertTrue(np.allclose(scores, expected[:3]))
+        self.assertTrue(np.array_equal(labels, np.argmax(expected[:3], axis=1)))
+        for j, request_labels in enumerate(predictions):
+            self.assertEqual(request_labels[0], np.argmax(expected[j % 20]))
+
+        self.assertEqual(stats['requests'], 41)
+        self.assertLess(stats['batches'], 41)
+        self.assertGreater(client_stats['requests_per_second'], 0)
+
+    def test_reload_under_load(self):
+        trainer = Trainer(Optimizer(deepcopy(self.network), SquareHingeLoss(margin=0.2)), learning_rate=1,
+                          regularization_parameter=0.01, batch_size=4, train_images=self.images, train_labels=np.zeros(20, dtype=int))
+        new_network = deepcopy(self.network)
+        new_network.output_weights = -new_network.output_weights
+        expected = new_network.predict(self.images[:3])
+
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'trainer')
+            trainer.save_to_file(filepath)
+            self.assertTrue(np.allclose(Trainer.load_best_network(filepath).predict(self.images), self.network.predict(self.images)))
+
+            with InferenceServer(self.network, processes=2, max_batch_size=4, max_wait=0.01) as server:
+                watcher = CheckpointWatcher(filepath, server.update_network, trainer=True, interval=0.05).start()
+
+                # Keep requests running while the checkpoint is replaced
+                results = []
+                load = threading.Thread(target=lambda: results.append(load_test(server.address, self.images, 200, 4)))
+                load.start()
+                trainer.best_network = new_network
+                time.sleep(0.1)
+                trainer.save_to_file(filepath)
+                load.join()
+
+                for _ in range(100):
+                    if server.shared_network.generation == 1:
+                        break
+                    time.sleep(0.05)
+                watcher.stop()
+                _, scores = request_predictions(server.address, self.images[:3])
+                self.assertEqual(server.num_reloads, 1)
+                self.assertEqual(server._retired, {})
+                self.assertEqual(len(results[0][0]), 200)
+
+        self.assertTrue(np.allclose(scores, expected))
+
+    def test_watcher_retries_incomplete_file(self):
+        file = io.BytesIO()
+        self.network.save_to_file(file)
+        content = file.getvalue()
+
+        networks = []
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'network')
+            watcher = CheckpointWatcher(filepath, networks.append, interval=0.02).start()
+
+            # A truncated file, as seen while another program writes it in place
+            with open(filepath, 'wb') as f:
+                f.write(content[:len(content) // 2])
+            time.sleep(0.1)
+            self.assertEqual(networks, [])
+
+            with open(filepath, 'wb') as f:
+                f.write(content)
+            for _ in range(100):
+                if networks:
+                    break
+                time.sleep(0.02)
+            watcher.stop()
+
+        self.assertEqual(len(networks), 1)
+        self.assertTrue(np.allclose(networks[0].predict(self.images), self.network.predict(self.images)))
+
+
+if __name__ == '__main__':
+    unittest.main()
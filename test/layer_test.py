@@ -1,4 +1,6 @@
 import unittest
+import io
+import pickle
 import numpy as np
 
 import sys
@@ -125,6 +127,58 @@ class LayerTest(unittest.TestCase):
 
 
 
+    def test_extract_patches_with_stride(self):
+        l = FilterLayer(
+            input_size=(4, 4), in_channels=1, filter_size=(2, 2), 
+            dp_kernel=RadialBasisFunction(1), filter_matrix=LayerTest.random_filter_matrix((2*2*1, 2)),
+            zero_padding=(0, 0), stride=(2, 2)
+        )
+        input = np.array([[
+            11, 12, 13, 14,
+            21, 22, 23, 24,
+            31, 32, 33, 34,
+            41, 42, 43, 44,
+        ]])
+        patched = l._extract_patches(input)
+
+        self.assertEqual(l.output_size, (2, 2))
+        expectedPatched = np.array([
+            [11, 12, 21, 22],
+            [13, 14, 23, 24],
+            [31, 32, 41, 42],
+            [33, 34, 43, 44],
+        ]).transpose()
+        self.assertTrue((patched == expectedPatched).all())
+
+    def test_extract_patches_adj_is_adjoint_with_stride(self):
+        for stride, zero_padding in [((2, 2), (0, 0)), ((2, 1), (1, 1)), ((3, 2), (1, 0))]:
+            l = FilterLayer(
+                input_size=(7, 6), in_channels=2, filter_size=(3, 3), 
+                dp_kernel=RadialBasisFunction(1), filter_matrix=self.filter_mx_3x3x2,
+                zero_padding=zero_padding, stride=stride
+            )
+            x = np.random.rand(2, 7 * 6)
+            y = np.random.rand(2 * 3 * 3, l.output_size[0] * l.output_size[1])
+
+            # <E(x), y> = <x, E_adj(y)>
+            self.assertAlmostEqual((l._extract_patches(x) * y).sum(), (x * l._extract_patches_adj(y)).sum())
+
+    def test_g_and_h_with_stride(self):
+        l = FilterLayer(
+            input_size=(5, 5), in_channels=1, filter_size=(3, 3), 
+            dp_kernel=RadialBasisFunction(1), 
+            filter_matrix=self.filter_mx_3x3x1,
+            zero_padding=(1, 1), stride=(2, 2)
+        )
+        output = l.forward(np.random.rand(1, 25))
+        self.assertEqual(output.shape, (2, 9))
+
+        U = np.random.rand(2, 9)
+        B = l._calculate_B(U)
+        C = l._calculate_C(U, output)
+        self.assertEqual(l._g(B, C).shape, self.filter_mx_3x3x1.shape)
+        self.assertEqual(l._h(U, B).shape, (1, 25))
+
     def test_forward_doesnt_crash(self):
         l = FilterLayer(
             input_size=(3, 3), in_channels=1, filter_size=(3, 3), 
@@ -167,6 +221,68 @@ class LayerTest(unittest.TestCase):
         B = l._calculate_B(U)
         l._h(U, B)
 
+    def test_sparse_patches_match_dense_computation(self):
+        l = FilterLayer(
+            input_size=(6, 6), in_channels=2, filter_size=(3, 3), 
+            dp_kernel=RadialBasisFunction(2), 
+            filter_matrix=LayerTest.random_filter_matrix((3*3*2, 4)),
+            zero_padding=(1, 1)
+        )
+        # Only the top left corner is not empty
+        x = np.zeros((2, 6, 6))
+        x[:, :2, :3] = np.random.rand(2, 2, 3)
+        x = x.reshape(2, 36)
+        U = np.random.rand(4, 36)
+
+        results = []
+        for sparse_threshold in [None, 0]:
+            l.sparse_threshold = sparse_threshold
+            output = l.forward(x)
+            B = l._calculate_B(U)
+            C = l._calculate_C(U, output)
+            results.append((output, l._g(B, C), l._h(U, B)))
+        self.assertEqual(len(l._active), 12)
+
+        for dense, sparse in zip(*results):
+            np.testing.assert_allclose(sparse, dense, rtol=1e-10, atol=1e-15)
+
+    def test_load_layer_without_stride(self):
+        # The format written before strides were supported
+        file = io.BytesIO()
+        pickle.dump(((4, 4), 1, (3, 3), self.filter_mx_3x3x1, RadialBasisFunction(2), (1, 1)) + (None,) * 6, file)
+        file.seek(0)
+
+        l = FilterLayer._derived_load_from_file(file)
+        self.assertEqual((l.stride, l.output_size), ((1, 1), (4, 4)))
+        self.assertTrue(np.array_equal(l.filter_matrix, self.filter_mx_3x3x1))
+
+    def test_tiles_match_untiled_computation(self):
+        for stride in [(1, 1), (2, 2)]:
+            l = FilterLayer(
+                input_size=(9, 9), in_channels=2, filter_size=(3, 3), 
+                dp_kernel=RadialBasisFunction(2), 
+                filter_matrix=LayerTest.random_filter_matrix((3*3*2, 4)),
+                zero_padding=(1, 1), stride=stride
+            )
+            x = np.random.rand(2, 81)
+            U = np.random.rand(4, l.output_size[0] * l.output_size[1])
+
+            results = []
+            # Untiled, two rows per tile (with a shorter last tile) and one row per tile
+            for max_patch_bytes in [None, 2 * 3 * 18 * l.output_size[1] * 8, 1]:
+                l.max_patch_bytes = max_patch_bytes
+                output = l.forward(x)
+                B = l._calculate_B(U)
+                C = l._calculate_C(U, output)
+                results.append((output, l._g(B, C), l._h(U, B)))
+                self.assertEqual(l._tiles is None, max_patch_bytes is None)
+            self.assertIsNone(l._E_input)
+
+            for tiled in results[1:]:
+                for untiled_result, tiled_result in zip(results[0], tiled):
+                    np.testing.assert_allclose(tiled_result, untiled_result, rtol=1e-12, atol=1e-15)
+            self.assertTrue(np.array_equal(results[1][0], results[0][0]))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
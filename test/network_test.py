@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.network import Network
+
+class NetworkTest(unittest.TestCase):
+    def setUp(self):
+        self.layer_infos = [
+            FilterInfo(filter_size=(3, 3), out_channels=4, zero_padding='same', dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, zero_padding='none', dp_kernel=RadialBasisFunction(2)),
+        ]
+
+    def test_summary_matches_built_network(self):
+        summary = Network.summarize((10, 10), 1, self.layer_infos, output_nodes=5)
+        network = Network((10, 10), 1, self.layer_infos, output_nodes=5)
+        network.forward(np.random.rand(1, 100))
+
+        for layer_summary, layer in zip(summary.layers, network.layers):
+            self.assertEqual(layer_summary.output_size, layer.output_size)
+            self.assertEqual(layer_summary.out_channels, layer.out_channels)
+            self.assertEqual(layer_summary.cache_bytes, layer.last_output.nbytes + (
+                layer._E_input.nbytes + layer._S_diag.nbytes + layer._S_n1_diag.nbytes + layer._Z_T__E_input__S_n1.nbytes
+                if hasattr(layer, '_E_input') else 0))
+
+        num_parameters = sum(layer.filter_matrix.size for layer in network.layers if hasattr(layer, 'filter_matrix'))
+        self.assertEqual(summary.num_parameters, num_parameters + network.output_weights.size)
+
+    def test_cache_budget_recomputes_same_gradients(self):
+        layer_infos = self.layer_infos + [
+            AvgPoolingInfo(pooling_size=(2, 2), stride=(1, 1)),
+            FilterInfo(filter_size=(2, 2), out_channels=3, zero_padding='none', dp_kernel=RadialBasisFunction(2)),
+        ]
+        network = Network((10, 10), 1, layer_infos, output_nodes=5)
+        summary = Network.summarize((10, 10), 1, layer_infos, output_nodes=5)
+        x = np.random.rand(1, 100)
+        loss_func_gradient = np.random.rand(5)
+
+        output = network.forward(x)
+        expected = network.compute_gradients(loss_func_gradient)
+        self.assertEqual([layer.cache_nbytes() for layer in network.layers], [layer.cache_bytes for layer in summary.layers])
+
+        # Nothing kept, the first two layers kept, all pooling layers and the last layer kept, and everything kept
+        cache_bytes = [layer.cache_bytes for layer in summary.layers]
+        for cache_budget in [0, cache_bytes[0] + cache_bytes[1], cache_bytes[1] + cache_bytes[3] + cache_bytes[4], summary.cache_bytes]:
+            network.cache_budget = cache_budget
+            self.assertTrue(np.array_equal(network.forward(x), output))
+            kept_bytes = sum(layer.cache_nbytes() for layer in network.layers)
+            self.assertLessEqual(kept_bytes, cache_budget)
+
+            gradients = network.compute_gradients(loss_func_gradient)
+            self.assertEqual(sum(layer.cache_nbytes() for layer in network.layers), kept_bytes)
+            for gradient, expected_gradient in zip(gradients, expected):
+                self.assertTrue(np.array_equal(gradient, expected_gradient))
+
+        self.assertEqual(network._segments, [])
+
+    def test_summary_rejects_empty_outputs(self):
+        with self.assertRaises(ValueError):
+            Network.summarize((4, 4), 1, self.layer_infos, output_nodes=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import io
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.update_rule import Momentum
+
+class OptimizerTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        # The features are positive, so label 0 is classified correctly by far more than the margin
+        self.network.output_weights[0] = 10
+        self.network.output_weights[1:] = -10
+        self.image = np.random.rand(6, 6)
+
+    def test_zero_gradients_match_the_backward_pass(self):
+        self.network.forward(self.image)
+        gradients = self.network.compute_gradients(np.zeros(3))
+        zero_gradients = self.network.zero_gradients()
+
+        self.assertEqual(len(zero_gradients), len(gradients))
+        for zero_gradient, gradient in zip(zero_gradients, gradients):
+            self.assertEqual(np.shape(zero_gradient), np.shape(gradient))
+            self.assertFalse(np.any(zero_gradient))
+
+    def test_backward_pass_is_skipped_for_zero_loss_gradients(self):
+        optimizer = Optimizer(self.network, SquareHingeLoss(margin=0.2))
+        compute_gradients = self.network.compute_gradients
+        backward_passes = []
+        self.network.compute_gradients = lambda g: backward_passes.append(g) or compute_gradients(g)
+
+        optimizer.step(self.image, 0)
+        optimizer.step(self.image, 0)
+        self.assertEqual((optimizer.num_steps, optimizer.num_skipped), (2, 2))
+        self.assertEqual(len(backward_passes), 0)
+
+        optimizer.step(self.image, 1)
+        self.assertEqual((optimizer.num_steps, optimizer.num_skipped), (3, 2))
+        self.assertEqual(len(backward_passes), 1)
+
+        optimizer.optim(0.1, 0.01)
+        self.assertEqual((optimizer.num_steps, optimizer.num_skipped), (0, 0))
+        self.assertEqual((optimizer.total_steps, optimizer.total_skipped), (3, 2))
+
+    def test_batch_of_skipped_steps_still_updates(self):
+        optimizer = Optimizer(self.network, SquareHingeLoss(margin=0.2), Momentum(momentum=0.9))
+        optimizer.step(self.image, 1)
+        optimizer.optim(0.1, 0.01)
+
+        filter_matrix = self.network.layers[2].filter_matrix.copy()
+        output_weights = self.network.output_weights.copy()
+
+        optimizer.step(self.image, 0)
+        optimizer.optim(0.1, 0.01)
+
+        # The momentum of the previous batch keeps moving the parameters
+        self.assertFalse(np.allclose(self.network.layers[2].filter_matrix, filter_matrix))
+        self.assertFalse(np.allclose(self.network.output_weights, output_weights * (1 - 0.1 * 0.01)))
+
+    def test_load_keeps_step_counts(self):
+        optimizer = Optimizer(self.network, SquareHingeLoss(margin=0.2))
+        optimizer.step(self.image, 0)
+        optimizer.step(self.image, 1)
+        optimizer.optim(0.1, 0.01)
+
+        file = io.BytesIO()
+        optimizer.save_to_file(file)
+        file.seek(0)
+        loaded = Optimizer.load_from_file(file)
+        self.assertEqual((loaded.total_steps, loaded.total_skipped), (optimizer.total_steps, optimizer.total_skipped))
+        self.assertEqual((loaded.total_steps, loaded.total_skipped), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+# solve_output_layer dispatches on the MeanSquaredError class the module imported itself
+from src.output_solver import network_features, solve_least_squares, solve_lbfgs, solve_output_layer, MeanSquaredError
+
+class OutputSolverTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.features = rng.random((50, 6))
+        self.labels = rng.integers(0, 3, 50)
+
+    def full_gradient(self, loss_function, weights, targets, regularization_parameter):
+        predicted = self.features @ weights.T
+        return loss_function.batch_gradient(predicted, targets).T @ self.features / len(self.features) + regularization_parameter * weights
+
+    def test_least_squares_is_stationary(self):
+        weights = solve_least_squares(self.features, self.labels, 3, regularization_parameter=0.1, chunk_size=16)
+        gradient = self.full_gradient(MeanSquaredError(), weights, np.eye(3)[self.labels], 0.1)
+
+        self.assertTrue(np.allclose(gradient, 0))
+
+    def test_lbfgs_square_hinge(self):
+        loss_function = SquareHingeLoss(margin=0.2)
+
+        def objective(weights):
+            return loss_function.batch_loss(self.features @ weights.T, self.labels).mean() + 0.01 / 2 * np.sum(weights * weights)
+
+        weights = solve_lbfgs(self.features, self.labels, loss_function, regularization_parameter=0.01,
+                              initial_weights=np.zeros((3, 6)), iterations=200, chunk_size=16)
+
+        # Reference by many steps of gradient descent
+        reference = np.zeros((3, 6))
+        for _ in range(2000):
+            reference -= 0.5 * self.full_gradient(loss_function, reference, self.labels, 0.01)
+
+        self.assertLessEqual(objective(weights), objective(reference) + 1e-9)
+
+    def test_solve_output_layer(self):
+        network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+        ], output_nodes=3)
+        images = np.random.rand(20, 36)
+        labels = np.random.randint(0, 3, 20)
+        features = network_features(network, images)
+
+        solve_output_layer(network, features, labels, MeanSquaredError(), regularization_parameter=0.01)
+
+        self.assertEqual(network.output_weights.shape, (3, 3, 9))
+        self.assertTrue(np.allclose(network.forward(images[4]), network.output_weights.reshape(3, -1) @ features[4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
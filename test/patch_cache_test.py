@@ -0,0 +1,99 @@
+import unittest
+import tempfile
+from copy import deepcopy
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.patch_cache import PatchCache
+
+class PatchCacheTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.images = np.random.rand(12, 36)
+        self.labels = np.random.randint(0, 3, 12)
+        self.network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=4, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+
+    def train(self, network, patch_cache):
+        np.random.seed(1)
+        trainer = Trainer(Optimizer(network, SquareHingeLoss(margin=0.2)), learning_rate=1, regularization_parameter=0.01,
+                          batch_size=4, train_images=self.images, train_labels=self.labels, patch_cache=patch_cache)
+        for _ in range(2):
+            trainer.finish_epoch()
+        return trainer.optimizer.network
+
+    def test_training_with_cache_matches_training_without(self):
+        cached_network = deepcopy(self.network)
+        cache = PatchCache(cached_network.layers[0], self.images)
+
+        expected = self.train(self.network, None)
+        actual = self.train(cached_network, cache)
+
+        self.assertEqual(cache.misses, len(self.images))
+        self.assertGreater(cache.hits, 0)
+        self.assertTrue(np.allclose(actual.layers[0].filter_matrix, expected.layers[0].filter_matrix))
+        self.assertTrue(np.allclose(actual.output_weights, expected.output_weights))
+
+    def test_lru_eviction(self):
+        layer = self.network.layers[0]
+        entry_bytes = sum(array.nbytes for array in layer.patches_and_norms(self.images[0]))
+        cache = PatchCache(layer, self.images, max_bytes=2 * entry_bytes)
+
+        for index in [0, 1, 0, 2, 0, 1]:
+            cache.get(index, self.images[index])
+
+        # 1 is evicted by 2 since 0 was used more recently
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        self.assertLessEqual(cache.nbytes, 2 * entry_bytes)
+
+    def test_memory_mapped_cache_is_reused(self):
+        layer = self.network.layers[0]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "layer0")
+            cache = PatchCache(layer, self.images, filename=filename, dtype=np.float32)
+            E_input, S_diag = cache.get(3, self.images[3])
+            del cache
+
+            reopened = PatchCache(layer, self.images, filename=filename, dtype=np.float32)
+            cached_E_input, cached_S_diag = reopened.get(3, self.images[3])
+
+            self.assertEqual(reopened.hits, 1)
+            self.assertTrue(np.allclose(cached_E_input, layer._extract_patches(self.images[3])))
+            self.assertTrue(np.array_equal(cached_S_diag, S_diag))
+            del E_input, cached_E_input, reopened
+
+    def test_memory_mapped_cache_of_other_images_is_rebuilt(self):
+        layer = self.network.layers[0]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "layer0")
+            cache = PatchCache(layer, self.images, filename=filename)
+            cache.get(3, self.images[3])
+            del cache
+
+            # The same number of images in another order
+            images = self.images[::-1].copy()
+            reopened = PatchCache(layer, images, filename=filename)
+            E_input, _ = reopened.get(3, images[3])
+
+            self.assertEqual((reopened.hits, reopened.misses), (0, 1))
+            self.assertTrue(np.allclose(E_input, layer._extract_patches(images[3])))
+            del E_input, reopened
+
+
+if __name__ == '__main__':
+    unittest.main()
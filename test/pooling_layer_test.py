@@ -1,4 +1,6 @@
 import unittest
+import io
+import pickle
 import numpy as np
 
 import sys
@@ -56,6 +58,47 @@ class LayerTest(unittest.TestCase):
 
         self.assertTrue((upscaled == expected_upscaled).all())
 
+    def test_avg_pooling_with_overlapping_stride(self):
+        pl = PoolingLayer(
+            input_size=(3, 5), in_channels=1, pooling_size=(2, 2), stride=(1, 2)
+        )
+
+        U = np.array([[
+            1., 2., 3., 4., 5.,
+            2., 3., 4., 5., 6.,
+            3., 4., 5., 6., 7.,
+        ]])
+
+        pooled = pl._avg_pooling(U)
+
+        expected_pooled = np.array([[
+            2., 4.,
+            3., 5.,
+        ]])
+
+        self.assertEqual(pl.output_size, (2, 2))
+        self.assertTrue((pooled == expected_pooled).all())
+
+    def test_avg_pooling_t_is_adjoint(self):
+        for pooling_size, stride in [((2, 2), None), ((3, 3), (2, 2)), ((3, 2), (1, 3))]:
+            pl = PoolingLayer(
+                input_size=(7, 8), in_channels=2, pooling_size=pooling_size, stride=stride
+            )
+            x = np.random.rand(2, 7 * 8)
+            y = np.random.rand(2, pl.output_size[0] * pl.output_size[1])
+
+            # <P(x), y> = <x, P_adj(y)>
+            self.assertAlmostEqual((pl._avg_pooling(x) * y).sum(), (x * pl._avg_pooling_t(y)).sum())
+
+    def test_load_layer_without_stride(self):
+        # The format written before strides were supported
+        file = io.BytesIO()
+        pickle.dump(((6, 6), 2, (3, 3), None), file)
+        file.seek(0)
+
+        pl = PoolingLayer._derived_load_from_file(file)
+        self.assertEqual((pl.stride, pl.output_size), ((3, 3), (2, 2)))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
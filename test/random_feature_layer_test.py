@@ -0,0 +1,92 @@
+import unittest
+import io
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction, DotProductKernel
+from src.layer_info import RandomFeatureInfo
+from src.network import Network
+from src.random_feature_layer import RandomFeatureLayer
+
+class RandomFeatureLayerTest(unittest.TestCase):
+    def test_features_approximate_kernel(self):
+        kernel = RadialBasisFunction(2)
+        layer = RandomFeatureInfo(filter_size=(2, 2), out_channels=20000, dp_kernel=kernel, zero_padding='none', seed=0).build((3, 3), 1)
+        input = np.random.rand(1, 9)
+        output = layer.forward(input)
+
+        # Columns of M S^-1 are the feature maps of the normalized patches
+        features = output * layer._S_n1_diag
+        patches = layer._E_input * layer._S_n1_diag
+
+        self.assertTrue(np.allclose(features.T @ features, kernel.func(patches.T @ patches), atol=0.05))
+
+    def test_gradients_match_finite_differences(self):
+        layer = RandomFeatureInfo(filter_size=(3, 3), out_channels=6, dp_kernel=RadialBasisFunction(1), zero_padding='same', seed=1).build((4, 4), 2)
+        input = np.random.rand(2, 16)
+        R = np.random.rand(6, 16)
+
+        # L = <M, R>, so that U P^T = R
+        def loss():
+            return (layer.forward(input) * R).sum()
+
+        loss()
+        B = layer._calculate_B(R)
+        gradient = layer._g(B, layer._calculate_C(None, None))
+        input_gradient = layer._h(R, B)
+
+        epsilon = 1e-6
+        numeric_gradient = np.zeros_like(gradient)
+        for index in np.ndindex(*gradient.shape):
+            layer.filter_matrix[index] += epsilon
+            upper = loss()
+            layer.filter_matrix[index] -= 2 * epsilon
+            lower = loss()
+            layer.filter_matrix[index] += epsilon
+            numeric_gradient[index] = (upper - lower) / (2 * epsilon)
+
+        numeric_input_gradient = np.zeros_like(input)
+        for index in np.ndindex(*input.shape):
+            input[index] += epsilon
+            upper = loss()
+            input[index] -= 2 * epsilon
+            lower = loss()
+            input[index] += epsilon
+            numeric_input_gradient[index] = (upper - lower) / (2 * epsilon)
+
+        self.assertTrue(np.allclose(gradient, numeric_gradient, rtol=1e-4, atol=1e-4))
+        self.assertTrue(np.allclose(input_gradient, numeric_input_gradient, rtol=1e-4, atol=1e-4))
+
+    def test_requires_radial_basis_function(self):
+        with self.assertRaises(ValueError):
+            RandomFeatureInfo(filter_size=(3, 3), out_channels=4, dp_kernel=DotProductKernel())
+
+    def test_network_and_summary(self):
+        layer_infos = [RandomFeatureInfo(filter_size=(3, 3), out_channels=64, dp_kernel=RadialBasisFunction(2), seed=2)]
+        network = Network(input_size=(6, 6), in_channels=1, layer_infos=layer_infos, output_nodes=3)
+        summary = Network.summarize((6, 6), 1, layer_infos, 3)
+
+        self.assertEqual(network.forward(np.random.rand(36)).shape, (3,))
+        self.assertEqual(summary.layers[0].layer_type, RandomFeatureLayer.__name__)
+        self.assertEqual(summary.layers[0].num_parameters, network.layers[0].filter_matrix.size)
+
+    def test_save_and_load(self):
+        layer = RandomFeatureInfo(filter_size=(3, 3), out_channels=8, dp_kernel=RadialBasisFunction(2), trainable=False).build((5, 5), 1)
+        input = np.random.rand(1, 25)
+        file = io.BytesIO()
+        layer.save_to_file(file)
+        file.seek(0)
+        loaded = RandomFeatureLayer.load_from_file(file)
+
+        self.assertFalse(loaded.trainable)
+        self.assertTrue(np.allclose(loaded.forward(input), layer.forward(input)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import tempfile
+import types
+from unittest import mock
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+import src.sweep as sweep
+from src.sweep import layer_infos_from_config, sweep_runs, run_budget, run_successive_halving
+
+class InProcessPool:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def map(self, function, iterable, chunksize=None):
+        return [function(item) for item in iterable]
+
+    def starmap(self, function, iterable, chunksize=None):
+        return [function(*args) for args in iterable]
+
+class SweepTest(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            "directory": "out",
+            "epochs": 2,
+            "layer_stacks": {
+                "a": [{"type": "filter", "filter_size": [3, 3], "out_channels": 4}, {"type": "avg_pooling", "pooling_size": [2, 2]}],
+                "b": [{"type": "filter", "filter_size": [5, 5], "out_channels": 2, "zero_padding": "none"}],
+            },
+            "alphas": [2, 4],
+            "batch_sizes": [64],
+            "learning_rates": [1, 2],
+        }
+
+    def test_layer_infos_from_config(self):
+        layer_infos = layer_infos_from_config(self.config['layer_stacks']['a'], alpha=3)
+
+        self.assertEqual(type(layer_infos[0]).__name__, 'FilterInfo')
+        self.assertEqual(layer_infos[0].filter_size, (3, 3))
+        self.assertEqual(layer_infos[0].zero_padding, 'same')
+        self.assertEqual(layer_infos[0].dp_kernel.alpha, 3)
+        self.assertEqual(type(layer_infos[1]).__name__, 'AvgPoolingInfo')
+        self.assertEqual(layer_infos[1].pooling_size, (2, 2))
+
+    def test_sweep_runs_cover_the_grid(self):
+        runs = sweep_runs(self.config, "/sweeps")
+
+        self.assertEqual(len(runs), 8)
+        self.assertEqual(len(set(run['filepath'] for run in runs)), 8)
+        self.assertTrue(all(run['filepath'].startswith(os.path.join("/sweeps", "out")) for run in runs))
+
+    def test_successive_halving_promotes_the_best_runs(self):
+        runs = [dict(name=f"run_{k}", accuracy=k / 10) for k in range(9)]
+        budgets = {}
+        pool_sizes = []
+
+        def fake_run_budget(run, total_batches):
+            budgets.setdefault(run['name'], []).append(total_batches)
+            return dict(name=run['name'], accuracy=run['accuracy'], batches=total_batches, finished=False, status='finished')
+
+        def fake_run_configuration(run):
+            return dict(name=run['name'], accuracy=run['accuracy'], batches=100, status='finished')
+
+        def fake_create_pool(runs, mnist_dir, processes):
+            pool_sizes.append(len(runs))
+            return InProcessPool()
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(sweep, 'run_budget', fake_run_budget), \
+                mock.patch.object(sweep, 'run_configuration', fake_run_configuration), \
+                mock.patch.object(sweep, '_create_pool', fake_create_pool), \
+                mock.patch.object(sweep, 'write_summary'):
+            rows = {row['name']: row for row in run_successive_halving(runs, directory, None, min_batches=2, eta=3)}
+
+        # 9 runs for 2 batches, the best 3 for 6 batches, then the best one for all epochs in pools of shrinking size
+        self.assertEqual(budgets['run_0'], [2])
+        self.assertEqual(budgets['run_6'], [2, 6])
+        self.assertEqual(budgets['run_8'], [2, 6])
+        self.assertEqual(pool_sizes, [9, 3, 1])
+        self.assertEqual(rows['run_8']['batches'], 100)
+        self.assertEqual(rows['run_7']['status'], 'stopped after 6 batches')
+        self.assertEqual(rows['run_0']['status'], 'stopped after 2 batches')
+
+    def test_run_budget_resumes_stopped_runs(self):
+        np.random.seed(0)
+        images = np.random.rand(40, 28 * 28)
+        labels = np.arange(40) % 10
+        config = dict(self.config, epochs=2, batch_sizes=[8], alphas=[2], learning_rates=[1], num_tests_batch=10,
+                      layer_stacks={"small": [{"type": "filter", "filter_size": [3, 3], "out_channels": 2, "stride": [3, 3]}]})
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(sweep, '_mnist', types.SimpleNamespace(train_images=images, train_labels=labels, test_images=images, test_labels=labels)):
+            run, = sweep_runs(config, directory)
+            os.makedirs(os.path.dirname(run['filepath']))
+
+            row = run_budget(run, 2)
+            self.assertEqual((row['batches'], row['finished']), (2, False))
+
+            # Resumed from the checkpoint, and limited to the run's epochs
+            row = run_budget(run, 7)
+            self.assertEqual((row['batches'], row['epochs'], row['finished']), (7, 1, False))
+            row = run_budget(run, 100)
+            self.assertEqual((row['batches'], row['epochs'], row['finished']), (10, 2, True))
+
+            analysis = sweep.Analysis.load_from_file(run['filepath'], images, labels, images, labels)
+            self.assertEqual(len(analysis.budget_test_results), 3)
+            self.assertEqual(analysis.budget_test_results[-1].correct_portion, row['accuracy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import unittest
+import io
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.trainer import Trainer
+from src.lr_schedule import StepSchedule, CosineSchedule, WarmupSchedule, PlateauSchedule, EarlyStopping
+from src.sampler import UniformSampler, LossImportanceSampler
+
+class ScheduleTest(unittest.TestCase):
+    def test_step_schedule(self):
+        schedule = StepSchedule(step_epochs=2, gamma=0.5)
+        self.assertEqual(schedule.learning_rate(1, batch=19, batches_per_epoch=10), 1)
+        self.assertEqual(schedule.learning_rate(1, batch=20, batches_per_epoch=10), 0.5)
+        self.assertEqual(schedule.learning_rate(1, batch=45, batches_per_epoch=10), 0.25)
+
+    def test_cosine_schedule(self):
+        schedule = CosineSchedule(epochs=2, min_learning_rate=0.1)
+        self.assertAlmostEqual(schedule.learning_rate(1, batch=0, batches_per_epoch=10), 1)
+        self.assertAlmostEqual(schedule.learning_rate(1, batch=10, batches_per_epoch=10), 0.55)
+        self.assertAlmostEqual(schedule.learning_rate(1, batch=30, batches_per_epoch=10), 0.1)
+
+    def test_warmup_schedule(self):
+        schedule = WarmupSchedule(warmup_batches=4, schedule=StepSchedule(step_epochs=1, gamma=0.5))
+        self.assertAlmostEqual(schedule.learning_rate(2, batch=0, batches_per_epoch=10), 0.5)
+        self.assertAlmostEqual(schedule.learning_rate(2, batch=3, batches_per_epoch=10), 2)
+        self.assertAlmostEqual(schedule.learning_rate(2, batch=14, batches_per_epoch=10), 1)
+
+    def test_plateau_schedule(self):
+        schedule = PlateauSchedule(patience=2, factor=0.1)
+        for accuracy in [0.5, 0.6, 0.6, 0.55]:
+            schedule.report_validation(accuracy)
+        self.assertAlmostEqual(schedule.learning_rate(1, batch=0, batches_per_epoch=10), 0.1)
+
+    def test_early_stopping(self):
+        early_stopping = EarlyStopping(patience=2)
+        early_stopping.report_validation(0.5)
+        early_stopping.report_validation(0.4)
+        self.assertFalse(early_stopping.should_stop)
+        early_stopping.report_validation(0.5)
+        self.assertTrue(early_stopping.should_stop)
+
+
+class SamplerTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_uniform_sampler(self):
+        indices, weights = UniformSampler().sample(10, 8)
+        self.assertEqual(len(set(indices)), 8)
+        self.assertIsNone(weights)
+
+    def test_loss_importance_sampler_prefers_high_losses(self):
+        sampler = LossImportanceSampler(uniform_portion=0.2)
+        sampler.sample(4, 4)
+        for index, loss in enumerate([0, 0, 1, 3]):
+            sampler.report_loss(index, loss)
+
+        indices, weights = sampler.sample(4, 100000)
+        frequencies = np.bincount(indices, minlength=4) / len(indices)
+        probabilities = np.array([0.05, 0.05, 0.25, 0.65])
+        np.testing.assert_allclose(frequencies, probabilities, atol=0.01)
+        np.testing.assert_allclose(weights, 1 / (4 * probabilities[indices]))
+
+        # The weighted average is an unbiased estimate of the average over all images
+        values = np.array([1.0, 2.0, 3.0, 4.0])
+        self.assertAlmostEqual(np.mean(weights * values[indices]), values.mean(), delta=0.05)
+
+    def test_unseen_images_get_the_highest_loss(self):
+        sampler = LossImportanceSampler(uniform_portion=0)
+        sampler.sample(3, 3)
+        sampler.report_loss(0, 0)
+        sampler.report_loss(1, 2)
+
+        indices, _ = sampler.sample(3, 10000)
+        self.assertNotIn(0, indices)
+        self.assertAlmostEqual(np.mean(indices == 2), 0.5, delta=0.03)
+
+
+class TrainerTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.images = np.random.rand(20, 16)
+        self.labels = np.random.randint(0, 3, 20)
+
+    def create_trainer(self, **kwargs):
+        network = Network(input_size=(4, 4), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+        ], output_nodes=3)
+        optimizer = Optimizer(network, SquareHingeLoss(margin=0.2))
+        return Trainer(optimizer, learning_rate=1, regularization_parameter=0.01, batch_size=4,
+                       train_images=self.images, train_labels=self.labels, **kwargs)
+
+    def test_schedule_updates_learning_rate_every_batch(self):
+        trainer = self.create_trainer(schedule=WarmupSchedule(warmup_batches=4))
+        trainer.finish_batch()
+        self.assertAlmostEqual(trainer.learning_rate, 0.25)
+        trainer.finish_batch()
+        self.assertAlmostEqual(trainer.learning_rate, 0.5)
+
+    def test_validation_set_is_held_out(self):
+        trainer = self.create_trainer(schedule=CosineSchedule(epochs=2), validation_size=4, validation_interval=2)
+        self.assertEqual(trainer.epoch_size, 16)
+        self.assertEqual(len(trainer.validation_images), 4)
+
+        trainer.finish_epoch()
+        self.assertEqual(trainer.epoch, 2)
+        self.assertEqual(len(trainer.validation_accuracies), 2)
+        self.assertEqual(trainer.best_validation_accuracy, max(trainer.validation_accuracies))
+
+    def test_early_stopping_stops_training(self):
+        trainer = self.create_trainer(schedule=CosineSchedule(epochs=10), validation_size=4, validation_interval=1,
+                                      early_stopping=EarlyStopping(patience=1, min_delta=1))
+        trainer.finish_epoch()
+        self.assertTrue(trainer.stopped)
+        self.assertEqual(len(trainer.average_loss_batch), 2)
+
+        trainer.finish_epoch()
+        self.assertEqual(len(trainer.average_loss_batch), 2)
+
+    def test_early_stopping_without_schedule(self):
+        trainer = self.create_trainer(validation_size=4, early_stopping=EarlyStopping(patience=1, min_delta=1))
+        trainer.finish_epoch()
+        trainer.finish_epoch()
+        self.assertTrue(trainer.stopped)
+        self.assertEqual(len(trainer.validation_accuracies), 2)
+        self.assertEqual(len(trainer.average_loss_epoch), 2)
+
+    def test_save_and_load(self):
+        trainer = self.create_trainer(schedule=PlateauSchedule(), validation_size=4)
+        trainer.finish_epoch()
+
+        file = io.BytesIO()
+        trainer.save_to_file(file)
+        file.seek(0)
+        loaded = Trainer.load_from_file(file, self.images, self.labels)
+
+        self.assertEqual(loaded.validation_accuracies, trainer.validation_accuracies)
+        self.assertEqual(len(loaded.train_images), 16)
+        self.assertIsInstance(loaded.schedule, PlateauSchedule)
+
+    def test_importance_sampling(self):
+        trainer = self.create_trainer(sampler=LossImportanceSampler())
+        self.assertEqual(trainer.epoch_size, 20)
+        visited = np.unique(trainer.permutation)
+        trainer.finish_epoch()
+
+        sampler = trainer.sampler
+        self.assertFalse(np.any(np.isnan(sampler.losses[visited])))
+        self.assertEqual(len(trainer.sample_weights), 20)
+
+        file = io.BytesIO()
+        trainer.save_to_file(file)
+        file.seek(0)
+        loaded = Trainer.load_from_file(file, self.images, self.labels)
+        np.testing.assert_array_equal(loaded.sampler.losses, sampler.losses)
+        np.testing.assert_array_equal(loaded.sample_weights, trainer.sample_weights)
+
+
+if __name__ == '__main__':
+    unittest.main()
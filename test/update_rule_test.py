@@ -0,0 +1,125 @@
+import unittest
+import io
+import pickle
+import numpy as np
+
+import sys
+import os
+current_directory = os.path.dirname(os.path.realpath(__file__))
+parent_directory = os.path.dirname(current_directory)
+sys.path.append(parent_directory)
+sys.path.append("src/")
+
+from src.kernel import RadialBasisFunction
+from src.layer_info import FilterInfo, AvgPoolingInfo
+from src.loss_function import SquareHingeLoss
+from src.network import Network
+from src.optimizer import Optimizer
+from src.update_rule import GradientDescent, Momentum, RMSProp, Adam
+
+class UpdateRuleTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.gradients = [np.random.randn(4, 3) for _ in range(3)]
+
+    def test_gradient_descent(self):
+        gradient = self.gradients[0].copy()
+        descent = GradientDescent().descent(0, gradient, 0.5)
+
+        self.assertIs(descent, gradient)
+        self.assertTrue(np.allclose(descent, 0.5 * self.gradients[0]))
+
+    def test_momentum(self):
+        rule = Momentum(momentum=0.9)
+        velocity = np.zeros((4, 3))
+        for g in self.gradients:
+            velocity = 0.9 * velocity + g
+            descent = rule.descent(0, g.copy(), 0.1)
+            self.assertTrue(np.allclose(descent, 0.1 * velocity))
+
+    def test_nesterov(self):
+        rule = Momentum(momentum=0.9, nesterov=True)
+        velocity = np.zeros((4, 3))
+        for g in self.gradients:
+            velocity = 0.9 * velocity + g
+            descent = rule.descent(0, g.copy(), 0.1)
+            self.assertTrue(np.allclose(descent, 0.1 * (g + 0.9 * velocity)))
+
+    def test_rmsprop(self):
+        rule = RMSProp(decay=0.9, epsilon=1e-8)
+        mean_square = np.zeros((4, 3))
+        for g in self.gradients:
+            mean_square = 0.9 * mean_square + 0.1 * g * g
+            descent = rule.descent(0, g.copy(), 0.1)
+            self.assertTrue(np.allclose(descent, 0.1 * g / (np.sqrt(mean_square) + 1e-8)))
+
+    def test_adam(self):
+        rule = Adam(beta1=0.9, beta2=0.999, epsilon=1e-8)
+        m = np.zeros((4, 3))
+        v = np.zeros((4, 3))
+        for t, g in enumerate(self.gradients, start=1):
+            m = 0.9 * m + 0.1 * g
+            v = 0.999 * v + 0.001 * g * g
+            m_hat = m / (1 - 0.9 ** t)
+            v_hat = v / (1 - 0.999 ** t)
+            descent = rule.descent(0, g.copy(), 0.1)
+            self.assertTrue(np.allclose(descent, 0.1 * m_hat / (np.sqrt(v_hat) + 1e-8)))
+
+    def test_state_is_kept_per_parameter(self):
+        rule = Momentum(momentum=0.5)
+        rule.descent(0, np.ones(2), 1)
+        self.assertTrue(np.allclose(rule.descent(1, np.ones(2), 1), 1))
+        self.assertTrue(np.allclose(rule.descent(0, np.ones(2), 1), 1.5))
+
+        rule.reset()
+        self.assertTrue(np.allclose(rule.descent(0, np.ones(2), 1), 1))
+
+    def test_optimizer_keeps_filters_unit_norm(self):
+        for rule in [GradientDescent(), Momentum(nesterov=True), RMSProp(), Adam()]:
+            network = Network(input_size=(6, 6), in_channels=1, layer_infos=[
+                FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+                AvgPoolingInfo(pooling_size=(2, 2)),
+                FilterInfo(filter_size=(3, 3), out_channels=2, dp_kernel=RadialBasisFunction(2)),
+            ], output_nodes=3)
+            optimizer = Optimizer(network, SquareHingeLoss(margin=0.2), rule)
+
+            for j in range(4):
+                optimizer.step(np.random.rand(1, 36), j % 3)
+            self.assertTrue(np.isfinite(optimizer.optim(learning_rate=0.1, regularization_parameter=0.01)))
+
+            for layer in [network.layers[0], network.layers[2]]:
+                self.assertTrue(np.allclose(np.linalg.norm(layer.filter_matrix, axis=0), 1))
+
+    def create_network(self):
+        return Network(input_size=(6, 6), in_channels=1, layer_infos=[
+            FilterInfo(filter_size=(3, 3), out_channels=3, dp_kernel=RadialBasisFunction(2)),
+            AvgPoolingInfo(pooling_size=(2, 2)),
+        ], output_nodes=3)
+
+    def test_load_optimizer_file_without_update_rule(self):
+        # The format written before update rules were saved
+        network = self.create_network()
+        file = io.BytesIO()
+        network.save_to_file(file)
+        pickle.dump((SquareHingeLoss(margin=0.2), 1.5, None, 2), file)
+        file.seek(0)
+
+        optimizer = Optimizer.load_from_file(file)
+        self.assertEqual(type(optimizer.update_rule).__name__, GradientDescent.__name__)
+        self.assertEqual((optimizer.loss_sum, optimizer.num_steps), (1.5, 2))
+        self.assertTrue(np.array_equal(optimizer.network.output_weights, network.output_weights))
+
+    def test_load_optimizer_keeps_update_rule_state(self):
+        optimizer = Optimizer(self.create_network(), SquareHingeLoss(margin=0.2), Momentum(momentum=0.9))
+        optimizer.step(np.random.rand(1, 36), 1)
+        optimizer.optim(0.1, 0.01)
+
+        file = io.BytesIO()
+        optimizer.save_to_file(file)
+        file.seek(0)
+        loaded = Optimizer.load_from_file(file)
+        self.assertTrue(np.array_equal(loaded.update_rule._velocity[-1], optimizer.update_rule._velocity[-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()